@@ -0,0 +1,150 @@
+import asyncio
+import math
+import time
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+import anyio.from_thread
+
+from metrics import LOCAL_ACTIVE_GENERATIONS, LOCAL_QUEUE_DEPTH, LOCAL_QUEUE_WAIT_SECONDS, LOCAL_REJECTIONS
+
+logger = logging.getLogger("backend")
+
+
+class AdmissionRejected(Exception):
+    """La cola de inferencia está saturada: responder `status_code` con Retry-After."""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class InferenceGate:
+    """Control de admisión de las generaciones del modelo local.
+
+    Como mucho `max_concurrent` generaciones a la vez; las demás esperan en una cola
+    de hasta `max_queue` requests durante un máximo de `max_wait` segundos. Si la
+    cola está llena se rechaza al instante con 429 y si la espera se agota con 503,
+    ambos con un Retry-After estimado a partir de la duración media de una
+    generación. Con `max_concurrent <= 0` no hay límite.
+
+    Solo las llamadas al modelo (clasificación y generación) ocupan un lugar: las
+    respuestas directas y por reglas no pasan por la cola. `acquire()` se espera en el
+    event loop; `model_slot()` lo usa desde el threadpool, donde corre el pipeline
+    local. `release()` se puede llamar desde cualquier hilo.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 16, max_wait: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait if max_wait and max_wait > 0 else None
+        self.active = 0
+        self.waiting = 0
+        # Media móvil exponencial de cuánto se ocupa un lugar (para el Retry-After)
+        self.avg_seconds = 0.0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere un lugar para un request nuevo."""
+        if not self.enabled or self.avg_seconds <= 0:
+            return 1
+        return max(1, math.ceil(self.avg_seconds * (self.waiting + 1) / self.max_concurrent))
+
+    def _reject(self, status_code: int, reason: str, detail: str) -> AdmissionRejected:
+        LOCAL_REJECTIONS.labels(reason).inc()
+        retry_after = self.retry_after()
+        logger.warning(f"[admission] rechazado ({reason}): {self.active} generando, {self.waiting} en cola, retry-after {retry_after} s")
+        return AdmissionRejected(status_code, retry_after, detail)
+
+    def _ensure_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            # Un semáforo por event loop (los benchmarks y tests pueden crear varios)
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+            self.active = 0
+            self.waiting = 0
+        return self._semaphore
+
+    async def acquire(self) -> float:
+        """Ocupa un lugar; devuelve el instante en que se obtuvo (para `release()`)."""
+        if not self.enabled:
+            return time.perf_counter()
+        semaphore = self._ensure_semaphore()
+        if semaphore.locked() or self.waiting:
+            if self.waiting >= self.max_queue:
+                raise self._reject(429, "queue_full", "El modelo local está saturado, intenta de nuevo en unos segundos")
+            self.waiting += 1
+            LOCAL_QUEUE_DEPTH.set(self.waiting)
+            wait_start = time.perf_counter()
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                LOCAL_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - wait_start)
+                raise self._reject(503, "timeout", "El modelo local no pudo atender la pregunta a tiempo, intenta de nuevo")
+            finally:
+                self.waiting -= 1
+                LOCAL_QUEUE_DEPTH.set(self.waiting)
+            LOCAL_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - wait_start)
+        else:
+            await semaphore.acquire()
+            LOCAL_QUEUE_WAIT_SECONDS.observe(0.0)
+        self.active += 1
+        LOCAL_ACTIVE_GENERATIONS.set(self.active)
+        return time.perf_counter()
+
+    def _release(self, acquired_at: float) -> None:
+        self.active -= 1
+        LOCAL_ACTIVE_GENERATIONS.set(self.active)
+        seconds = time.perf_counter() - acquired_at
+        self.avg_seconds = seconds if self.avg_seconds <= 0 else 0.8 * self.avg_seconds + 0.2 * seconds
+        self._semaphore.release()
+
+    def release(self, acquired_at: float) -> None:
+        """Libera el lugar ocupado en `acquired_at` (seguro desde hilos del threadpool)."""
+        if not self.enabled or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._release(acquired_at)
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._release, acquired_at)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        acquired_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    @contextmanager
+    def model_slot(self) -> Iterator[None]:
+        """Ocupa un lugar durante una llamada al modelo hecha desde el threadpool.
+
+        El hilo queda bloqueado mientras el request espera en la cola. Fuera de un hilo
+        de anyio (precarga, scripts) no hay event loop al que pedir el lugar y no se limita.
+        """
+        if not self.enabled:
+            yield
+            return
+        try:
+            acquired_at = anyio.from_thread.run(self.acquire)
+        except RuntimeError:
+            yield
+            return
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
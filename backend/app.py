@@ -1,32 +1,256 @@
 import os
 import json
-from typing import List, Dict, Any
+import functools
+import importlib.util
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import logging
 import sys
-import re
+import time
+import threading
+import zlib
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
-from huggingface_hub import InferenceClient
+from starlette.concurrency import run_in_threadpool
 import httpx
 
-# Imports para modelos locales (solo si USE_LOCAL_MODEL=true)
+from catalog import (
+    CatalogStore, CatalogSnapshot, DEFAULT_PRODUCTS_PATH, PUNCTUATION_TABLE,
+    normalize_word, normalize_question, product_dict,
+)
+from attributes import extract_constraints
+from cache import TTLCache, ResponseCache
+from context import CatalogContextBuilder, PromptAssembler, estimate_tokens
+from intent_rules import CATEGORY_LEXICON, INTENT_TYPES, RuleBasedClassifier, ClassificationStats
+from constrained import IntentGrammar, IntentGrammarProcessor, register_tokenizer
+from streaming import StreamCleaner, sse_event
+from providers import ChatProvider, LocalTransformersProvider, OpenAICompatibleProvider, HFInferenceProvider
+from batching import BatchScheduler
+from admission import InferenceGate, AdmissionRejected
+from workers import InferenceWorkerPool, share_weights
+from metrics import (
+    phase, record_phase, record_generation, render_metrics,
+    REQUESTS, REQUEST_SECONDS, LOCAL_ANSWERS, INTENT_CLASSIFICATIONS,
+)
+
+# HTTP/2 hacia los proveedores remotos (httpx lo soporta si está instalado `h2`)
 try:
-    from transformers import AutoTokenizer, AutoModelForCausalLM, AutoModelForSeq2SeqLM, pipeline, BitsAndBytesConfig
-    import torch
-    TRANSFORMERS_AVAILABLE = True
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
 except ImportError:
-    TRANSFORMERS_AVAILABLE = False
+    HTTP2_AVAILABLE = False
+
+# transformers y torch solo se importan al cargar el modelo local (arranque rápido sin USE_LOCAL_MODEL)
+TRANSFORMERS_AVAILABLE = importlib.util.find_spec("transformers") is not None and importlib.util.find_spec("torch") is not None
+# Se resuelve al primer stream local (los benchmarks lo reemplazan por un streamer falso)
+TextIteratorStreamer = None
 
 HF_MODEL_ID = os.environ.get("HF_MODEL_ID", "Qwen/Qwen2.5-1.5B-Instruct")
 USE_LOCAL_MODEL = os.environ.get("USE_LOCAL_MODEL", "false").lower() in ("true", "1", "yes")
 USE_8BIT_QUANTIZATION = os.environ.get("USE_8BIT_QUANTIZATION", "false").lower() in ("true", "1", "yes")
+# Backend del modelo local en CPU: auto (pesos tal cual, torch_dtype="auto") o int8 (cuantización dinámica
+# de torch en las capas lineales, guardada en LOCAL_QUANTIZED_CACHE_DIR para no repetirla en cada arranque)
+LOCAL_CPU_BACKEND = os.environ.get("LOCAL_CPU_BACKEND", "auto").strip().lower()
+LOCAL_QUANTIZED_CACHE_DIR = (
+    os.environ.get("LOCAL_QUANTIZED_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "chatbot-quantized")
+)
+# Catálogo: archivo JSON o base SQLite (sqlite:///catalog.db, creada con `python -m catalog_sqlite`)
+PRODUCTS_PATH = os.environ.get("PRODUCTS_PATH", DEFAULT_PRODUCTS_PATH)
+# Cada cuántos segundos se comprueba si products.json cambió (0 = solo recarga manual)
+CATALOG_CHECK_INTERVAL = float(os.environ.get("CATALOG_CHECK_INTERVAL", "2"))
+# Productos como mucho que devuelve una búsqueda por categoría (0 = todos los de la categoría)
+CATEGORY_MAX_PRODUCTS = int(os.environ.get("CATEGORY_MAX_PRODUCTS", "100"))
+
+# Cache de intenciones clasificadas por el modelo (0 = deshabilitada)
+INTENT_CACHE_SIZE = int(os.environ.get("INTENT_CACHE_SIZE", "1024"))
+INTENT_CACHE_TTL = float(os.environ.get("INTENT_CACHE_TTL", "3600"))
+# Clasificar con el modelo restringido a la gramática del JSON de intención (termina en la llave de cierre)
+INTENT_CONSTRAINED_DECODING = os.environ.get("INTENT_CONSTRAINED_DECODING", "true").lower() in ("true", "1", "yes")
+# Confianza mínima del clasificador por reglas para no consultar al modelo (>1 = siempre usar el modelo)
+INTENT_RULES_THRESHOLD = float(os.environ.get("INTENT_RULES_THRESHOLD", "0.8"))
+# Cache de respuestas completas (0 = deshabilitada; con muestreo, las repetidas reciben la misma respuesta)
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "0"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "600"))
+
+# Pool de conexiones hacia los proveedores remotos (compartido por todos los requests)
+UPSTREAM_HTTP2 = os.environ.get("UPSTREAM_HTTP2", "true").lower() in ("true", "1", "yes")
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "200"))
+UPSTREAM_MAX_KEEPALIVE = int(os.environ.get("UPSTREAM_MAX_KEEPALIVE", "50"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.environ.get("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "60"))
+
+# Contexto de catálogo en los prompts remotos: productos más relevantes y presupuesto de tokens (0 = sin límite)
+REMOTE_CONTEXT_TOP_K = int(os.environ.get("REMOTE_CONTEXT_TOP_K", "15"))
+REMOTE_CONTEXT_TOKEN_BUDGET = int(os.environ.get("REMOTE_CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Búsqueda semántica opcional (numpy + sentence-transformers): embeddings de los productos en
+# SEMANTIC_INDEX_DIR (vacío = ~/.cache/chatbot-embeddings), recalculados solo para los productos que cambian.
+# SEMANTIC_WEIGHT combina la similitud con el score por keywords (1 = solo similitud, 0 = solo keywords)
+SEMANTIC_SEARCH = os.environ.get("SEMANTIC_SEARCH", "false").lower() in ("true", "1", "yes")
+SEMANTIC_MODEL_ID = os.environ.get("SEMANTIC_MODEL_ID", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+SEMANTIC_INDEX_DIR = (
+    os.environ.get("SEMANTIC_INDEX_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "chatbot-embeddings")
+)
+SEMANTIC_WEIGHT = float(os.environ.get("SEMANTIC_WEIGHT", "0.5"))
+# Similitud mínima (coseno) para que un producto entre por la búsqueda semántica
+SEMANTIC_MIN_SIMILARITY = float(os.environ.get("SEMANTIC_MIN_SIMILARITY", "0.3"))
+
+# Clientes HTTP de la aplicación (se crean en el lifespan y viven lo que vive el proceso)
+_upstream_clients = {"http": None, "hf": None}
+
+# Micro-batching del pipeline local: prompts concurrentes se generan juntos (1 = deshabilitado)
+LOCAL_BATCH_MAX_SIZE = int(os.environ.get("LOCAL_BATCH_MAX_SIZE", "1"))
+LOCAL_BATCH_MAX_WAIT_MS = float(os.environ.get("LOCAL_BATCH_MAX_WAIT_MS", "10"))
+# Responder producto_especifico y categoria directamente con los datos del catálogo (sin generar)
+STRUCTURED_ANSWERS = os.environ.get("STRUCTURED_ANSWERS", "false").lower() in ("true", "1", "yes")
+# Variar la frase de introducción de las respuestas estructuradas (fija para cada pregunta)
+STRUCTURED_ANSWER_VARIATIONS = os.environ.get("STRUCTURED_ANSWER_VARIATIONS", "false").lower() in ("true", "1", "yes")
+# Cargar el modelo local al arrancar (en segundo plano, con warm-up); /ready responde 503 hasta terminar
+LOCAL_MODEL_PRELOAD = os.environ.get("LOCAL_MODEL_PRELOAD", "true").lower() in ("true", "1", "yes")
+# Reutilizar la KV-cache de las partes fijas de los prompts (system prompt, ejemplos)
+LOCAL_PREFIX_CACHE = os.environ.get("LOCAL_PREFIX_CACHE", "false").lower() in ("true", "1", "yes")
+# Procesos de inferencia que comparten los pesos del modelo cargado una vez (1 = en el proceso del servidor)
+# y hilos de torch de cada uno (0 = núcleos / workers)
+LOCAL_WORKERS = int(os.environ.get("LOCAL_WORKERS", "1"))
+LOCAL_WORKER_THREADS = int(os.environ.get("LOCAL_WORKER_THREADS", "0"))
+# Cola de inferencia del modelo local: generaciones simultáneas (0 = sin límite), requests en
+# espera y segundos máximos de espera; si se satura se responde 429/503 con Retry-After
+LOCAL_MAX_CONCURRENCY = int(os.environ.get("LOCAL_MAX_CONCURRENCY", str(max(1, LOCAL_BATCH_MAX_SIZE, LOCAL_WORKERS))))
+LOCAL_QUEUE_MAX_SIZE = int(os.environ.get("LOCAL_QUEUE_MAX_SIZE", "16"))
+LOCAL_QUEUE_MAX_WAIT = float(os.environ.get("LOCAL_QUEUE_MAX_WAIT", "30"))
+
+# Generación asistida (speculative decoding): modelo borrador pequeño con el mismo tokenizer que
+# propone LOCAL_DRAFT_TOKENS tokens por paso y el modelo principal los verifica ("" = deshabilitada)
+LOCAL_DRAFT_MODEL_ID = os.environ.get("LOCAL_DRAFT_MODEL_ID", "").strip()
+LOCAL_DRAFT_TOKENS = int(os.environ.get("LOCAL_DRAFT_TOKENS", "5"))
+
+# Tokens máximos del prompt de respuesta local: los productos que no entran se omiten (0 = sin límite)
+LOCAL_PROMPT_TOKEN_BUDGET = int(os.environ.get("LOCAL_PROMPT_TOKEN_BUDGET", "1024"))
+
+# Parámetros de generación por defecto del pipeline local
+LOCAL_GENERATION_DEFAULTS = dict(
+    max_length=500,
+    temperature=0.8,  # Mayor temperatura para más variedad
+    do_sample=True,
+    top_p=0.95,
+    repetition_penalty=1.2,  # Evitar repeticiones
+    num_beams=2,  # Mejora calidad de generación
+)
 
 # Cache global para el modelo local (evita recargarlo en cada request)
-_local_model_cache = {"model": None, "tokenizer": None, "pipeline": None}
+_local_model_cache = {"model": None, "tokenizer": None, "pipeline": None, "scheduler": None, "workers": None, "draft_model": None, "prefix_caches": {}}
+_prefix_cache_lock = threading.Lock()
+# Un solo hilo carga el modelo; los requests concurrentes esperan a que termine
+_model_load_lock = threading.Lock()
+# Estado de la precarga: idle, loading, warming, ready o failed
+_model_status = {"state": "idle", "error": None, "seconds": None}
+
+# Admisión de las generaciones locales (evita sobresuscribir la CPU cuando hay picos de tráfico)
+inference_gate = InferenceGate(LOCAL_MAX_CONCURRENCY, max_queue=LOCAL_QUEUE_MAX_SIZE, max_wait=LOCAL_QUEUE_MAX_WAIT)
+
+# Preguntas normalizadas -> intención parseada (evita una generación por pregunta repetida)
+intent_cache = TTLCache(maxsize=INTENT_CACHE_SIZE, ttl=INTENT_CACHE_TTL)
+intent_stats = ClassificationStats()
 
-app = FastAPI()
+# Respuestas por (pregunta normalizada, versión del catálogo, modelo)
+response_cache = ResponseCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+# Clasificador por reglas del catálogo actual (se reconstruye cuando cambia la versión)
+_rule_classifier = {"classifier": None}
+
+# Embeddings de los productos para la búsqueda semántica (se crea con SEMANTIC_SEARCH)
+_semantic = {"store": None}
+
+# Fragmentos de catálogo de los prompts remotos, memorizados por versión del catálogo
+remote_context = CatalogContextBuilder(token_budget=REMOTE_CONTEXT_TOKEN_BUDGET)
+
+# Armado de los prompts locales con el tokenizer del modelo (se crea al primer uso)
+_prompt_assembler = {"assembler": None}
+
+# Catálogo en memoria: se carga una vez al arrancar y se recarga si cambia el archivo
+catalog_store = CatalogStore(PRODUCTS_PATH, check_interval=CATALOG_CHECK_INTERVAL)
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    http2 = UPSTREAM_HTTP2 and HTTP2_AVAILABLE
+    if UPSTREAM_HTTP2 and not HTTP2_AVAILABLE:
+        logger.warning("[upstream] UPSTREAM_HTTP2=true pero falta el paquete h2, usando HTTP/1.1")
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=UPSTREAM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartido (keep-alive + HTTP/2) para los proveedores OpenAI-compatible."""
+    if _upstream_clients["http"] is None:
+        _upstream_clients["http"] = _create_http_client()
+    return _upstream_clients["http"]
+
+
+def get_hf_client(hf_token: Optional[str]):
+    """InferenceClient compartido; su sesión de requests reutiliza conexiones por hilo."""
+    if _upstream_clients["hf"] is None:
+        from huggingface_hub import InferenceClient
+        _upstream_clients["hf"] = InferenceClient(api_key=hf_token, base_url="https://router.huggingface.co/hf-inference")
+    return _upstream_clients["hf"]
+
+
+def get_semantic_store():
+    """EmbeddingStore de la búsqueda semántica, o None si está deshabilitada."""
+    if not SEMANTIC_SEARCH:
+        return None
+    if _semantic["store"] is None:
+        import hashlib
+        from semantic import EmbeddingStore, load_sentence_encoder
+        # Un directorio por modelo y catálogo: cada uno conserva sus embeddings para reutilizarlos
+        catalog_key = hashlib.sha1(os.path.abspath(catalog_store.file_path).encode("utf-8")).hexdigest()[:12]
+        directory = os.path.join(SEMANTIC_INDEX_DIR, f"{SEMANTIC_MODEL_ID.replace('/', '--')}-{catalog_key}")
+        _semantic["store"] = EmbeddingStore(directory, SEMANTIC_MODEL_ID, lambda: load_sentence_encoder(SEMANTIC_MODEL_ID))
+    return _semantic["store"]
+
+
+def semantic_search(question: str, catalog: CatalogSnapshot, limit: int) -> Optional[List[Tuple[float, Dict[str, Any]]]]:
+    """Productos más cercanos a la pregunta por embeddings, o None (deshabilitada o sin embeddings todavía)."""
+    store = get_semantic_store()
+    if store is None:
+        return None
+    try:
+        return store.search(question, catalog, limit, min_score=SEMANTIC_MIN_SIMILARITY)
+    except Exception as e:
+        logger.warning(f"[semantic] búsqueda semántica no disponible: {e}")
+        return None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    catalog = catalog_store.reload()
+    if SEMANTIC_SEARCH:
+        # Embeddings en segundo plano: hasta tenerlos se busca solo por keywords
+        get_semantic_store().refresh(catalog)
+    _upstream_clients["http"] = _create_http_client()
+    if USE_LOCAL_MODEL and LOCAL_MODEL_PRELOAD:
+        # En un hilo aparte: el servidor acepta /health y /ready mientras el modelo carga
+        threading.Thread(target=preload_local_model, name="model-preload", daemon=True).start()
+    try:
+        yield
+    finally:
+        client, _upstream_clients["http"] = _upstream_clients["http"], None
+        await client.aclose()
+        if _local_model_cache["workers"] is not None:
+            _local_model_cache["workers"].close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Logging config
 logger = logging.getLogger("backend")
@@ -64,14 +288,8 @@ class ChatMessage(BaseModel):
 
 
 def load_products() -> List[Dict[str, Any]]:
-    try:
-        products_path = os.environ.get("PRODUCTS_PATH", os.path.join(os.path.dirname(__file__), "products.json"))
-        with open(products_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("products", [])
-    except Exception as e:
-        logger.exception("Error loading products")
-        return []
+    """Devuelve los productos del snapshot actual del catálogo como dicts (sin leer disco)."""
+    return [product_dict(p) for p in catalog_store.get().products]
 
 
 def _mask_token(token: str) -> str:
@@ -85,8 +303,32 @@ def _mask_token(token: str) -> str:
         return "<MASK_ERROR>"
 
 
-def build_messages(question: str, products: List[Dict[str, Any]]):
-    products_str = json.dumps(products, ensure_ascii=False, indent=2)
+def retrieve_remote_products(question: str, catalog: CatalogSnapshot) -> List[Dict[str, Any]]:
+    """Productos relevantes para los proveedores remotos (misma búsqueda que el modelo local).
+
+    La intención sale solo del clasificador por reglas; si no es concluyente, se
+    usa el filtro por palabras clave. Se devuelven como mucho REMOTE_CONTEXT_TOP_K.
+    """
+    top_k = REMOTE_CONTEXT_TOP_K if REMOTE_CONTEXT_TOP_K > 0 else len(catalog.products)
+    with phase("classify"):
+        intent, confidence = get_rule_classifier(catalog).classify(question)
+    with phase("retrieve"):
+        products = []
+        if confidence >= INTENT_RULES_THRESHOLD:
+            products = search_catalog_by_intent(intent, question, catalog)
+        if not products:
+            products = filter_relevant_products(question, catalog, max_products=top_k)
+    return products[:top_k]
+
+
+def catalog_context(question: str, catalog: CatalogSnapshot) -> str:
+    products = retrieve_remote_products(question, catalog)
+    with phase("prompt"):
+        return remote_context.fragment(catalog, products)
+
+
+def build_messages(question: str, catalog: CatalogSnapshot):
+    products_str = catalog_context(question, catalog)
 
     system_prompt = (
         "Eres un asistente de ventas de una tienda en línea. "
@@ -99,15 +341,15 @@ def build_messages(question: str, products: List[Dict[str, Any]]):
 
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Catálogo de productos (JSON):\n{products_str}"},
+        {"role": "user", "content": f"Productos del catálogo (nombre | categoría | precio | stock | descripción):\n{products_str}"},
         {"role": "user", "content": f"{question}\n\nPor favor responde en español."},
     ]
     return messages
 
 
-def build_prompt(question: str, products: List[Dict[str, Any]]) -> str:
-    """Construye un prompt estilo Mistral Instruct usando el catálogo completo."""
-    products_str = json.dumps(products, ensure_ascii=False, indent=2)
+def build_prompt(question: str, catalog: CatalogSnapshot) -> str:
+    """Construye un prompt estilo Mistral Instruct con los productos relevantes del catálogo."""
+    products_str = catalog_context(question, catalog)
     system_prompt = (
         "Eres un asistente de ventas de una tienda en línea. "
         "IMPORTANTE: Siempre responde en español, incluso si el cliente pregunta en otro idioma. "
@@ -119,7 +361,7 @@ def build_prompt(question: str, products: List[Dict[str, Any]]) -> str:
     )
     prompt = (
         f"<s>[INST] <<SYS>>\n{system_prompt}\n<</SYS>>\n\n"
-        f"Catálogo de productos (JSON):\n{products_str}\n\n"
+        f"Productos del catálogo (nombre | categoría | precio | stock | descripción):\n{products_str}\n\n"
         f"Pregunta del cliente: {question}\n"
         f"Responde en español:\n"
         f"[/INST]"
@@ -132,11 +374,23 @@ def load_local_model():
     if not TRANSFORMERS_AVAILABLE:
         raise ImportError("transformers no está instalado. Ejecuta: pip install transformers torch accelerate")
     
-    if _local_model_cache["pipeline"] is not None:
-        logger.info("[local] usando modelo en caché")
-        return _local_model_cache["pipeline"]
+    pipe = _local_model_cache["pipeline"]
+    if pipe is not None:
+        return pipe
     
+    with _model_load_lock:
+        # Otro hilo pudo terminar de cargarlo mientras se esperaba el lock
+        if _local_model_cache["pipeline"] is not None:
+            return _local_model_cache["pipeline"]
+        return _load_local_model()
+
+
+def _load_local_components() -> Tuple[Any, Any, bool, Any]:
+    """Modelo y tokenizer según la configuración: (modelo, tokenizer, es seq2seq, modelo borrador o None)."""
     logger.info(f"[local] cargando modelo {HF_MODEL_ID}...")
+    import_start = time.perf_counter()
+    from transformers import AutoTokenizer, AutoModelForCausalLM, AutoModelForSeq2SeqLM
+    logger.info(f"[local] transformers y torch importados en {time.perf_counter() - import_start:.2f} s")
     
     # Detectar tipo de modelo
     model_lower = HF_MODEL_ID.lower()
@@ -144,8 +398,12 @@ def load_local_model():
     
     # Configurar opciones de carga según disponibilidad de memoria
     load_kwargs = {}
-    if USE_8BIT_QUANTIZATION:
+    if LOCAL_CPU_BACKEND == "int8":
+        if USE_8BIT_QUANTIZATION:
+            logger.warning("[local] USE_8BIT_QUANTIZATION se ignora con LOCAL_CPU_BACKEND=int8")
+    elif USE_8BIT_QUANTIZATION:
         logger.info("[local] usando cuantización 8-bit para reducir uso de memoria")
+        from transformers import BitsAndBytesConfig
         # Configuración correcta para cuantización 8-bit en CPU
         quantization_config = BitsAndBytesConfig(
             load_in_8bit=True,
@@ -160,28 +418,71 @@ def load_local_model():
     if is_seq2seq:
         logger.info("[local] detectado modelo seq2seq (T5/BART), usando text2text-generation")
         tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_ID)
-        model = AutoModelForSeq2SeqLM.from_pretrained(HF_MODEL_ID, **load_kwargs)
+        model = _load_model_weights(AutoModelForSeq2SeqLM, load_kwargs)
     else:
         logger.info("[local] detectado modelo causal (GPT/Llama), usando text-generation")
         tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_ID)
-        model = AutoModelForCausalLM.from_pretrained(HF_MODEL_ID, **load_kwargs)
+        model = _load_model_weights(AutoModelForCausalLM, load_kwargs)
+        # Generación en batch: padding a la izquierda para que todos los prompts terminen alineados
+        tokenizer.padding_side = "left"
+    
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    
+    draft_model = _load_draft_model(tokenizer, model) if LOCAL_DRAFT_MODEL_ID and not is_seq2seq else None
+    return model, tokenizer, is_seq2seq, draft_model
+
+
+def build_local_pipeline(model, tokenizer, is_seq2seq: bool, draft_model=None):
+    """Pipeline de generación sobre un modelo ya cargado (en el proceso principal o en un worker de inferencia)."""
+    from transformers import pipeline
+    generation_defaults = dict(LOCAL_GENERATION_DEFAULTS)
+    if draft_model is not None:
+        # Todas las generaciones del pipeline son asistidas; no admiten beam search
+        generation_defaults["num_beams"] = 1
+        generation_defaults["assistant_model"] = draft_model
     
     pipe = pipeline(
         "text-generation" if not is_seq2seq else "text2text-generation",
         model=model,
         tokenizer=tokenizer,
-        max_length=500,
-        temperature=0.8,  # Mayor temperatura para más variedad
-        do_sample=True,
-        top_p=0.95,
-        repetition_penalty=1.2,  # Evitar repeticiones
-        num_beams=2,  # Mejora calidad de generación
+        **generation_defaults,
     )
+    # Para reconstruir los logits processors que llegan serializados (también en cada worker)
+    register_tokenizer(tokenizer)
+    return pipe
+
+
+def _load_local_model():
+    model, tokenizer, is_seq2seq, draft_model = _load_local_components()
+    pipe = build_local_pipeline(model, tokenizer, is_seq2seq, draft_model)
+    import torch
     
-    _local_model_cache["tokenizer"] = tokenizer
-    _local_model_cache["model"] = model
-    _local_model_cache["pipeline"] = pipe
+    _local_model_cache["tokenizer"] = pipe.tokenizer
+    _local_model_cache["model"] = pipe.model
     _local_model_cache["is_seq2seq"] = is_seq2seq
+    _local_model_cache["draft_model"] = draft_model
+    if LOCAL_WORKERS > 1 and torch.cuda.is_available():
+        # Los tensores de la GPU no se comparten entre procesos como los de CPU: un solo proceso la usa
+        logger.warning("[local] LOCAL_WORKERS se ignora con GPU")
+    elif LOCAL_WORKERS > 1:
+        # Los workers reciben este mismo modelo con los pesos en memoria compartida (no lo vuelven
+        # a cargar; las capas int8 de LOCAL_CPU_BACKEND=int8 se reempaquetan en cada worker);
+        # warm_up_local_model() espera a que todos generen una vez
+        share_weights(model, draft_model)
+        loader = functools.partial(build_local_pipeline, model, tokenizer, is_seq2seq, draft_model)
+        _local_model_cache["workers"] = InferenceWorkerPool(
+            pipe, loader, LOCAL_WORKERS, threads=LOCAL_WORKER_THREADS, streamer_factory=create_streamer,
+        )
+        if LOCAL_BATCH_MAX_SIZE > 1:
+            logger.warning("[local] LOCAL_BATCH_MAX_SIZE se ignora con LOCAL_WORKERS > 1")
+    elif LOCAL_BATCH_MAX_SIZE > 1 and draft_model is not None:
+        logger.warning("[local] LOCAL_BATCH_MAX_SIZE se ignora con generación asistida (solo admite un prompt por generate)")
+    elif LOCAL_BATCH_MAX_SIZE > 1:
+        logger.info(f"[local] micro-batching habilitado (máx {LOCAL_BATCH_MAX_SIZE} prompts, espera {LOCAL_BATCH_MAX_WAIT_MS} ms)")
+        _local_model_cache["scheduler"] = BatchScheduler(pipe, LOCAL_BATCH_MAX_SIZE, LOCAL_BATCH_MAX_WAIT_MS)
+    # Se publica al final: ningún request usa el pipeline antes de tener workers o scheduler
+    _local_model_cache["pipeline"] = pipe
     
     device = "GPU" if torch.cuda.is_available() else "CPU"
     model_type = "seq2seq" if is_seq2seq else "causal"
@@ -190,30 +491,180 @@ def load_local_model():
     return pipe
 
 
-def normalize_word(word: str) -> str:
-    """Normaliza una palabra eliminando plurales y acentos para mejor matching."""
-    # Remover acentos comunes
-    replacements = {'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u', 'ñ': 'n'}
-    for old, new in replacements.items():
-        word = word.replace(old, new)
+def _load_model_weights(model_cls, load_kwargs: Dict[str, Any]):
+    """Carga el modelo principal con el backend de CPU configurado."""
+    if LOCAL_CPU_BACKEND == "int8":
+        from cpu_backend import load_dynamic_int8
+        return load_dynamic_int8(model_cls, HF_MODEL_ID, LOCAL_QUANTIZED_CACHE_DIR)
+    if LOCAL_CPU_BACKEND != "auto":
+        logger.warning(f"[local] LOCAL_CPU_BACKEND={LOCAL_CPU_BACKEND} desconocido, usando auto")
+    return model_cls.from_pretrained(HF_MODEL_ID, **load_kwargs)
+
+
+def _load_draft_model(tokenizer, model):
+    """Modelo borrador de la generación asistida, o None si no se puede usar con `model`."""
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    logger.info(f"[local] cargando modelo borrador {LOCAL_DRAFT_MODEL_ID} ({LOCAL_DRAFT_TOKENS} tokens especulativos)...")
+    try:
+        draft_tokenizer = AutoTokenizer.from_pretrained(LOCAL_DRAFT_MODEL_ID)
+        if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+            logger.warning(f"[local] {LOCAL_DRAFT_MODEL_ID} no comparte el tokenizer de {HF_MODEL_ID}, generación asistida deshabilitada")
+            return None
+        draft_model = AutoModelForCausalLM.from_pretrained(LOCAL_DRAFT_MODEL_ID, torch_dtype="auto").to(model.device)
+    except Exception as e:
+        logger.exception(f"[local] no se pudo cargar el modelo borrador, generación asistida deshabilitada: {e}")
+        return None
+    draft_model.generation_config.num_assistant_tokens = LOCAL_DRAFT_TOKENS
+    draft_model.generation_config.num_assistant_tokens_schedule = "constant"
+    return draft_model
+
+
+def warm_up_local_model(pipe) -> None:
+    """Una generación corta para cargar pesos y kernels antes del primer request real (en cada worker)."""
+    prompt = f"{CLASSIFICATION_PROMPT_PREFIX}Pregunta: ¿Qué productos tienen?<|im_end|>\n<|im_start|>assistant\n"
+    generate_kwargs = dict(max_new_tokens=8, do_sample=False, num_beams=1, pad_token_id=pipe.tokenizer.eos_token_id)
+    workers = _local_model_cache.get("workers")
+    if workers is not None and workers.pipe is pipe:
+        workers.warm_up(prompt, **generate_kwargs)
+    else:
+        generate_text(pipe, prompt, prefix=CLASSIFICATION_PROMPT_PREFIX, **generate_kwargs)
+    if _prefix_cache_enabled():
+        for prefix in (ANSWER_PREFIX_PRODUCT, ANSWER_PREFIX_CATALOG, ANSWER_PREFIX_DETAILS):
+            get_prefix_cache(prefix)
+
+
+def preload_local_model() -> None:
+    """Carga el modelo y lo calienta (se ejecuta en segundo plano desde el lifespan)."""
+    start = time.perf_counter()
+    try:
+        _model_status.update(state="loading", error=None)
+        pipe = load_local_model()
+        _model_status["state"] = "warming"
+        warm_up_local_model(pipe)
+    except Exception as e:
+        logger.exception(f"[local] falló la precarga del modelo: {e}")
+        _model_status.update(state="failed", error=str(e))
+        return
+    _model_status.update(state="ready", seconds=round(time.perf_counter() - start, 2))
+    logger.info(f"[local] modelo listo en {_model_status['seconds']} s (carga + warm-up)")
+
+
+def count_tokens(pipe, text: str) -> int:
+    """Tokens de `text` según el tokenizer del pipeline (estimados si no se puede tokenizar)."""
+    try:
+        return len(pipe.tokenizer.encode(text, add_special_tokens=False))
+    except (AttributeError, TypeError):
+        return estimate_tokens(text)
+
+
+def run_pipeline(pipe, prompt: str, **generate_kwargs):
+    """Ejecuta el pipeline local en los workers, o pasando por el micro-batching si está habilitado."""
+    workers = _local_model_cache.get("workers")
+    if workers is not None and workers.pipe is pipe:
+        return workers.submit(prompt, **generate_kwargs)
+    scheduler = _local_model_cache.get("scheduler")
+    if scheduler is not None and scheduler.pipe is pipe:
+        return scheduler.submit(prompt, **generate_kwargs)
+    return pipe(prompt, **generate_kwargs)
+
+
+def _prefix_cache_enabled() -> bool:
+    # Con workers la generación ocurre en otros procesos: la KV-cache del principal no sirve
+    return LOCAL_PREFIX_CACHE and not _local_model_cache.get("is_seq2seq") and _local_model_cache.get("workers") is None
+
+
+def _input_ids_enabled(pipe) -> bool:
+    # Solo con el modelo causal en este proceso: los workers y el micro-batching reciben texto
+    model = _local_model_cache.get("model")
+    return (
+        model is not None and getattr(pipe, "model", None) is model and not _local_model_cache.get("is_seq2seq")
+        and _local_model_cache.get("workers") is None and _local_model_cache.get("scheduler") is None
+    )
+
+
+def generate_from_ids(pipe, input_ids: List[int], **generate_kwargs) -> str:
+    """Genera con model.generate() desde un prompt ya tokenizado y devuelve solo el texto nuevo.
+
+    Usa los mismos parámetros por defecto que el pipeline; con `max_new_tokens` el
+    max_length del pipeline no se aplica (el prompt ya está acotado por su presupuesto).
+    """
+    import torch
+    model = pipe.model
+    kwargs = {**LOCAL_GENERATION_DEFAULTS, **generate_kwargs}
+    if "max_new_tokens" in kwargs:
+        kwargs.pop("max_length", None)
+    draft_model = _local_model_cache.get("draft_model")
+    if draft_model is not None:
+        kwargs["assistant_model"] = draft_model
+        kwargs["num_beams"] = 1
+    ids = torch.tensor([input_ids], device=model.device)
+    with torch.no_grad():
+        output = model.generate(input_ids=ids, attention_mask=torch.ones_like(ids), **kwargs)
+    return pipe.tokenizer.decode(output[0, ids.shape[1]:], skip_special_tokens=True)
+
+
+def get_prompt_assembler(pipe) -> PromptAssembler:
+    """Armador de prompts con el tokenizer de `pipe` (se recrea si cambia el pipeline)."""
+    assembler = _prompt_assembler["assembler"]
+    tokenizer = getattr(pipe, "tokenizer", None)
+    if assembler is None or assembler.tokenizer is not tokenizer:
+        assembler = PromptAssembler(tokenizer, token_budget=LOCAL_PROMPT_TOKEN_BUDGET)
+        _prompt_assembler["assembler"] = assembler
+    return assembler
+
+
+def get_prefix_cache(prefix: str):
+    """KV-cache del prefijo fijo de un prompt (se calcula la primera vez que se usa)."""
+    caches = _local_model_cache["prefix_caches"]
+    cache = caches.get(prefix)
+    if cache is None:
+        from prefix_cache import PrefixKVCache
+        with _prefix_cache_lock:
+            cache = caches.get(prefix)
+            if cache is None:
+                cache = PrefixKVCache(_local_model_cache["model"], _local_model_cache["tokenizer"], prefix)
+                caches[prefix] = cache
+    return cache
+
+
+def generate_text(
+    pipe, prompt: str, prefix: Optional[str] = None, input_ids: Optional[List[int]] = None, **generate_kwargs,
+) -> str:
+    """Genera con el modelo local y devuelve el texto (limpiar con clean_local_output()).
+
+    Si LOCAL_PREFIX_CACHE está activo y `prompt` empieza con `prefix`, el prefijo no
+    se vuelve a codificar: se continúa desde su KV-cache y solo se procesa el resto.
+    Con `input_ids` (el prompt ya tokenizado) y el modelo en este proceso, se genera
+    desde esos ids sin volver a tokenizar; los workers y el micro-batching reciben
+    el texto.
+    """
+    if prefix and _prefix_cache_enabled() and prompt.startswith(prefix):
+        from prefix_cache import generation_kwargs_for_cache
+        cache = get_prefix_cache(prefix)
+        cache_kwargs = generation_kwargs_for_cache(LOCAL_GENERATION_DEFAULTS, generate_kwargs)
+        if input_ids is not None and input_ids[:cache.prefix_tokens] == cache.prefix_ids[0].tolist():
+            return cache.generate_from_ids(input_ids[cache.prefix_tokens:], **cache_kwargs)
+        return cache.generate(prompt[len(prefix):], **cache_kwargs)
     
-    # Convertir plurales comunes a singular
-    if word.endswith('es') and len(word) > 3:
-        word = word[:-2]  # zapatos -> zapato, camisetas -> camiseta
-    elif word.endswith('s') and len(word) > 3:
-        word = word[:-1]  # gorras -> gorra
+    if input_ids is not None and _input_ids_enabled(pipe):
+        return generate_from_ids(pipe, input_ids, **generate_kwargs)
     
-    return word
+    result = run_pipeline(pipe, prompt, **generate_kwargs)
+    if isinstance(result, list) and len(result) > 0:
+        return result[0].get("generated_text", "")
+    return str(result)
 
 
-def filter_relevant_products(question: str, products: List[Dict[str, Any]], max_products: int = 10) -> List[Dict[str, Any]]:
+def filter_relevant_products(question: str, catalog: CatalogSnapshot, max_products: int = 10) -> List[Dict[str, Any]]:
     """Filtra productos relevantes basándose en la pregunta del usuario."""
-    question_lower = question.lower()
+    products = catalog.products
+    # Precio y stock pedidos ("de menos de 100", "en stock") se resuelven con el índice
+    # de atributos; las keywords salen del resto de la pregunta
+    constraints, question_text = extract_constraints(question)
+    question_lower = question_text.lower()
     
     # Remover signos de puntuación y caracteres especiales
-    import string
-    translator = str.maketrans('', '', string.punctuation + '¿¡')
-    question_clean = question_lower.translate(translator)
+    question_clean = question_lower.translate(PUNCTUATION_TABLE)
     
     # Extraer palabras clave (eliminar palabras comunes)
     stop_words = {'que', 'qué', 'cual', 'cuál', 'tiene', 'tienes', 'hay', 'vende', 'vendes', 
@@ -225,42 +676,30 @@ def filter_relevant_products(question: str, products: List[Dict[str, Any]], max_
     
     # Si no hay keywords específicos, detectar si pregunta por todo el catálogo
     if not keywords or any(word in question_lower for word in ['todos', 'todo', 'catálogo', 'catalogo', 'productos']):
+        if constraints is not None:
+            logger.info(f"[filter] pregunta general con restricciones {constraints}")
+            return catalog.index.by_attributes(constraints, limit=max_products)
         logger.info(f"[filter] pregunta general, mostrando primeros {max_products} productos")
         return products[:max_products]
     
-    # Calcular puntuación de relevancia para cada producto
-    scored_products = []
-    for product in products:
-        score = 0
-        # Obtener y normalizar textos del producto
-        product_name = product.get('name', '').lower()
-        product_category = product.get('category', '').lower()
-        product_desc = product.get('description', '').lower()
-        
-        # Normalizar palabras individuales del producto
-        product_name_words = [normalize_word(w) for w in product_name.split()]
-        product_category_words = [normalize_word(w) for w in product_category.split()]
-        product_desc_words = [normalize_word(w) for w in product_desc.split()]
-        
-        all_product_words = product_name_words + product_category_words + product_desc_words
-        
-        # Buscar coincidencias de keywords
-        for keyword in keywords:
-            if keyword in all_product_words:
-                score += 10
-                # Bonus si está en el nombre
-                if keyword in product_name_words:
-                    score += 20
-                # Bonus si está en la categoría
-                if keyword in product_category_words:
-                    score += 15
-        
-        if score > 0:
-            scored_products.append((score, product))
+    # Puntuación de relevancia (10 si aparece, +20 en nombre, +15 en categoría) con el índice invertido
+    scored_products = catalog.index.top_by_keywords(keywords, max_products, constraints=constraints)
+    relevant_products = [p for _, p in scored_products]
+    
+    # Con búsqueda semántica, también productos con sinónimos de las keywords ("laptop" para "portátil")
+    semantic_products = semantic_search(question, catalog, max_products)
+    if semantic_products is not None:
+        if constraints is not None:
+            semantic_products = [(score, p) for score, p in semantic_products if constraints.matches(p)]
+        from semantic import fuse_rankings
+        relevant_products = fuse_rankings(scored_products, semantic_products, SEMANTIC_WEIGHT, max_products)
     
-    # Ordenar por relevancia y tomar los top N
-    scored_products.sort(reverse=True, key=lambda x: x[0])
-    relevant_products = [p for _, p in scored_products[:max_products]]
+    if not relevant_products and constraints is not None:
+        # Si hay productos con esas keywords pero ninguno cumple, no mostrar otros que tampoco son
+        if catalog.index.top_by_keywords(keywords, 1):
+            logger.info(f"[filter] ningún producto para {keywords} cumple {constraints}")
+            return []
+        relevant_products = catalog.index.by_attributes(constraints, limit=max_products)
     
     # Si no se encontraron productos relevantes, mostrar algunos aleatorios
     if not relevant_products:
@@ -272,60 +711,106 @@ def filter_relevant_products(question: str, products: List[Dict[str, Any]], max_
     return relevant_products
 
 
-def get_available_categories(products: List[Dict[str, Any]]) -> List[str]:
-    """Extrae las categorías únicas del catálogo de productos."""
-    categories = set()
-    for p in products:
-        if 'category' in p and p['category']:
-            categories.add(p['category'])
-    return sorted(list(categories))
+def get_rule_classifier(catalog: CatalogSnapshot) -> RuleBasedClassifier:
+    """Devuelve el clasificador por reglas de esta versión del catálogo."""
+    classifier = _rule_classifier["classifier"]
+    if classifier is None or classifier.version != catalog.version:
+        classifier = RuleBasedClassifier(catalog)
+        _rule_classifier["classifier"] = classifier
+    return classifier
+
+
+def _log_intent_source(source: str) -> None:
+    intent_stats.record(source)
+    INTENT_CLASSIFICATIONS.labels(source).inc()
+    logger.info(
+        f"[intent] resuelta por {source}; sin modelo: {intent_stats.share_without_model():.0%} "
+        f"de {intent_stats.total} clasificaciones"
+    )
+
+
+def classify_question_intent(question: str, pipe, catalog: Optional[CatalogSnapshot] = None) -> Dict[str, Any]:
+    """Clasifica la intención de la pregunta.
+
+    Primero prueba el clasificador por reglas del catálogo; si su confianza no llega
+    a INTENT_RULES_THRESHOLD, usa la cache de intenciones y, por último, el modelo.
+    """
+    if catalog is not None:
+        intent, confidence = get_rule_classifier(catalog).classify(question)
+        if confidence >= INTENT_RULES_THRESHOLD:
+            logger.info(f"[intent] clasificación por reglas (confianza {confidence:.2f}): {intent}")
+            _log_intent_source("reglas")
+            return intent
+        logger.info(f"[intent] reglas con confianza baja ({confidence:.2f}), consultando al modelo")
+
+    cache_key = normalize_question(question)
+    cached = intent_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"[intent] cache hit: {cached} (hits={intent_cache.hits}, misses={intent_cache.misses})")
+        _log_intent_source("cache")
+        return dict(cached, terminos=list(cached.get("terminos", [])))
+
+    with inference_gate.model_slot():
+        intent = _classify_with_model(question, pipe)
+    _log_intent_source("modelo")
+    if isinstance(intent, dict):
+        intent_cache.set(cache_key, intent)
+        return dict(intent, terminos=list(intent.get("terminos", [])))
+    return {"tipo": "general", "terminos": [], "categoria": None}
 
 
-def classify_question_intent(question: str, pipe) -> Dict[str, Any]:
-    """Clasifica la intención de la pregunta del usuario usando el modelo."""
+_CATEGORY_LEXICON_PROMPT = "".join(f"- {category}: {', '.join(words)}\n" for category, words in CATEGORY_LEXICON.items())
+
+
+# Parte fija del prompt de clasificación (se puede precalcular su KV-cache)
+CLASSIFICATION_PROMPT_PREFIX = (
+    f"<|im_start|>system\n"
+    f"Eres un clasificador de preguntas. Analiza la pregunta del usuario y responde SOLO con un JSON.\n\n"
+    f"CATEGORÍAS DISPONIBLES Y SUS PRODUCTOS:\n"
+    f"{_CATEGORY_LEXICON_PROMPT}\n"
+    f"TIPOS DE PREGUNTA:\n"
+    f"- 'categorias_disponibles': pregunta QUÉ categorías existen\n"
+    f"- 'categoria': pide VER productos de UNA categoría\n"
+    f"- 'producto_especifico': pregunta por UN producto en particular\n"
+    f"- 'general': pregunta general sobre el catálogo\n"
+    f"- 'fuera_catalogo': NO es sobre productos\n\n"
+    f"Responde SOLO JSON: {{\"tipo\": \"...\", \"terminos\": [...], \"categoria\": \"...\"}}\n\n"
+    f"EJEMPLOS:\n"
+    f"'Qué categorías tienes?' -> {{\"tipo\": \"categorias_disponibles\", \"terminos\": [], \"categoria\": null}}\n"
+    f"'Muéstrame electrónica' -> {{\"tipo\": \"categoria\", \"terminos\": [\"electronica\"], \"categoria\": \"electrónica\"}}\n"
+    f"'Mochila para Portátil' -> {{\"tipo\": \"producto_especifico\", \"terminos\": [\"mochila\", \"portatil\"], \"categoria\": \"accesorios\"}}\n"
+    f"'Tienes camisetas?' -> {{\"tipo\": \"categoria\", \"terminos\": [\"camiseta\"], \"categoria\": \"ropa\"}}\n"
+    f"'Laptop 14' -> {{\"tipo\": \"producto_especifico\", \"terminos\": [\"laptop\", \"14\"], \"categoria\": \"electrónica\"}}\n"
+    f"'Zapatos' -> {{\"tipo\": \"categoria\", \"terminos\": [\"zapatos\"], \"categoria\": \"calzado\"}}<|im_end|>\n"
+    f"<|im_start|>user\n"
+)
+
+
+# JSON que puede emitir el modelo al clasificar: tipos y categorías del prompt
+INTENT_GRAMMAR = IntentGrammar(INTENT_TYPES, list(CATEGORY_LEXICON))
+
+
+def _classify_with_model(question: str, pipe) -> Optional[Dict[str, Any]]:
+    """Clasifica la intención con el modelo. Devuelve None si la respuesta no se pudo usar."""
     classification_prompt = (
-        f"<|im_start|>system\n"
-        f"Eres un clasificador de preguntas. Analiza la pregunta del usuario y responde SOLO con un JSON.\n\n"
-        f"CATEGORÍAS DISPONIBLES Y SUS PRODUCTOS:\n"
-        f"- ropa: camisetas, pantalones, vestidos, sudaderas, blusas, faldas, camperas\n"
-        f"- calzado: zapatillas, zapatos, botines, sandalias, botas, tenis, mocasines\n"
-        f"- electrónica: laptops, tablets, relojes inteligentes, auriculares, monitores, mouse, bocinas, cámaras\n"
-        f"- accesorios: mochilas, gafas, gorras, cinturones, riñoneras, bufandas, carteras, sombreros\n\n"
-        f"TIPOS DE PREGUNTA:\n"
-        f"- 'categorias_disponibles': pregunta QUÉ categorías existen\n"
-        f"- 'categoria': pide VER productos de UNA categoría\n"
-        f"- 'producto_especifico': pregunta por UN producto en particular\n"
-        f"- 'general': pregunta general sobre el catálogo\n"
-        f"- 'fuera_catalogo': NO es sobre productos\n\n"
-        f"Responde SOLO JSON: {{\"tipo\": \"...\", \"terminos\": [...], \"categoria\": \"...\"}}\n\n"
-        f"EJEMPLOS:\n"
-        f"'Qué categorías tienes?' -> {{\"tipo\": \"categorias_disponibles\", \"terminos\": [], \"categoria\": null}}\n"
-        f"'Muéstrame electrónica' -> {{\"tipo\": \"categoria\", \"terminos\": [\"electronica\"], \"categoria\": \"electrónica\"}}\n"
-        f"'Mochila para Portátil' -> {{\"tipo\": \"producto_especifico\", \"terminos\": [\"mochila\", \"portatil\"], \"categoria\": \"accesorios\"}}\n"
-        f"'Tienes camisetas?' -> {{\"tipo\": \"categoria\", \"terminos\": [\"camiseta\"], \"categoria\": \"ropa\"}}\n"
-        f"'Laptop 14' -> {{\"tipo\": \"producto_especifico\", \"terminos\": [\"laptop\", \"14\"], \"categoria\": \"electrónica\"}}\n"
-        f"'Zapatos' -> {{\"tipo\": \"categoria\", \"terminos\": [\"zapatos\"], \"categoria\": \"calzado\"}}<|im_end|>\n"
-        f"<|im_start|>user\n"
+        f"{CLASSIFICATION_PROMPT_PREFIX}"
         f"Pregunta: {question}<|im_end|>\n"
         f"<|im_start|>assistant\n"
     )
+    generate_kwargs = dict(
+        max_new_tokens=100,
+        do_sample=False,  # Greedy: misma pregunta -> misma intención (requisito de la cache)
+        num_beams=1,
+        pad_token_id=pipe.tokenizer.eos_token_id
+    )
+    if INTENT_CONSTRAINED_DECODING:
+        # Solo JSON válido con tipo y categoría conocidos; EOS al cerrar la llave
+        generate_kwargs["logits_processor"] = [IntentGrammarProcessor(pipe.tokenizer, INTENT_GRAMMAR)]
     
     try:
-        result = pipe(
-            classification_prompt,
-            max_new_tokens=100,
-            temperature=0.3,  # Baja temperatura para respuestas más determinísticas
-            do_sample=True,
-            top_p=0.9,
-            pad_token_id=pipe.tokenizer.eos_token_id
-        )
+        text = generate_text(pipe, classification_prompt, prefix=CLASSIFICATION_PROMPT_PREFIX, **generate_kwargs)
         
         # Extraer y limpiar respuesta
-        if isinstance(result, list) and len(result) > 0:
-            text = result[0].get("generated_text", "")
-        else:
-            text = str(result)
-        
         if "<|im_start|>assistant" in text:
             text = text.split("<|im_start|>assistant")[-1].strip()
         
@@ -333,51 +818,51 @@ def classify_question_intent(question: str, pipe) -> Dict[str, Any]:
         text = text.replace("<|im_start|>", "").strip()
         
         # Intentar parsear JSON
-        import json
         # Buscar JSON en la respuesta
         if "{" in text and "}" in text:
             json_start = text.find("{")
             json_end = text.rfind("}") + 1
             json_str = text[json_start:json_end]
             intent = json.loads(json_str)
+            if not isinstance(intent, dict) or intent.get("tipo") not in INTENT_TYPES:
+                logger.warning(f"[intent] tipo desconocido en {intent}, usando fallback")
+                return None
             logger.info(f"[intent] clasificación: {intent}")
             return intent
         else:
             logger.warning(f"[intent] no se pudo parsear JSON, usando fallback")
-            return {"tipo": "general", "terminos": [], "categoria": None}
+            return None
     
     except Exception as e:
         logger.warning(f"[intent] error en clasificación: {e}, usando fallback")
-        return {"tipo": "general", "terminos": [], "categoria": None}
+        return None
 
 
-def search_catalog_by_intent(intent: Dict[str, Any], question: str, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def search_catalog_by_intent(intent: Dict[str, Any], question: str, catalog: CatalogSnapshot) -> List[Dict[str, Any]]:
     """Busca en el catálogo según la intención clasificada."""
+    products = catalog.products
     tipo = intent.get("tipo", "general")
     terminos = intent.get("terminos", [])
     categoria = intent.get("categoria")
+    constraints, _ = extract_constraints(question)
     
-    logger.info(f"[catalog] buscando por tipo='{tipo}', términos={terminos}, categoría='{categoria}'")
+    logger.info(f"[catalog] buscando por tipo='{tipo}', términos={terminos}, categoría='{categoria}', "
+                f"restricciones={constraints}")
     
     if tipo == "fuera_catalogo" or tipo == "categorias_disponibles":
         # No buscar productos para estas intenciones
         return []
     
     if tipo == "producto_especifico":
-        # Buscar producto específico por términos
-        matching_products = []
-        for p in products:
-            product_name_lower = p['name'].lower()
-            # Verificar si todos los términos están en el nombre del producto
-            if terminos and all(normalize_word(term) in normalize_word(product_name_lower) for term in terminos):
-                matching_products.append(p)
+        # Buscar producto específico: todos los términos en el nombre (ya normalizado en el índice)
+        matching_products = catalog.index.name_contains_all(terminos, limit=1) if terminos else []
         
         if matching_products:
             logger.info(f"[catalog] encontrado producto específico: {matching_products[0]['name']}")
             return matching_products[:1]  # Solo el primero
         else:
             # Fallback: buscar por similitud
-            return filter_relevant_products(question, products, max_products=3)
+            return filter_relevant_products(question, catalog, max_products=3)
     
     elif tipo == "categoria":
         # Buscar por categoría o términos relacionados
@@ -387,30 +872,29 @@ def search_catalog_by_intent(intent: Dict[str, Any], question: str, products: Li
         
         # Primero intentar por categoría exacta
         if categoria:
-            # Debug: mostrar algunas categorías del catálogo
-            sample_categories = list(set([p.get('category', '') for p in products[:5]]))
-            logger.info(f"[catalog] categorías de ejemplo en catálogo: {sample_categories}")
-            
-            for p in products:
-                product_category = p.get('category', '').lower()
-                if categoria.lower() == product_category:
-                    matching_products.append(p)
-                    logger.info(f"[catalog] match: {p['name']} (categoría: {product_category})")
+            if constraints is not None:
+                # Rango de precio / stock con bisect sobre el índice de la categoría
+                matching_products = catalog.index.by_attributes(constraints, categoria, limit=CATEGORY_MAX_PRODUCTS or None)
+            else:
+                matching_products = catalog.index.in_category(categoria, limit=CATEGORY_MAX_PRODUCTS or None)
+            for p in matching_products:
+                logger.debug(f"[catalog] match: {p['name']} (categoría: {p.get('category', '')})")
             
             if matching_products:
                 logger.info(f"[catalog] encontrados {len(matching_products)} productos de categoría '{categoria}'")
-                return matching_products  # Todos los de la categoría
+                return matching_products  # Todos los de la categoría (hasta CATEGORY_MAX_PRODUCTS)
+            elif constraints is not None and catalog.index.in_category(categoria, limit=1):
+                logger.info(f"[catalog] ningún producto de '{categoria}' cumple {constraints}")
+                return []
             else:
-                logger.warning(f"[catalog] NO se encontraron productos con categoría exacta '{categoria}'")
+                logger.warning(f"[catalog] NO se encontraron productos con categoría exacta '{categoria}' (disponibles: {catalog.index.categories})")
         
         # Si no hay coincidencias por categoría exacta, buscar por términos en nombre o descripción
         if not matching_products and terminos:
             logger.info(f"[catalog] buscando por términos: {terminos}")
-            for p in products:
-                product_text = f"{p['name']} {p.get('description', '')} {p.get('category', '')}".lower()
-                if any(normalize_word(term) in normalize_word(product_text) for term in terminos):
-                    matching_products.append(p)
-                    logger.info(f"[catalog] match por término: {p['name']}")
+            matching_products = catalog.index.text_contains_any(terminos, limit=15, constraints=constraints)
+            for p in matching_products:
+                logger.debug(f"[catalog] match por término: {p['name']}")
         
         if matching_products:
             logger.info(f"[catalog] encontrados {len(matching_products)} productos relacionados")
@@ -418,42 +902,93 @@ def search_catalog_by_intent(intent: Dict[str, Any], question: str, products: Li
         else:
             # Fallback: usar filtro inteligente
             logger.warning(f"[catalog] usando fallback con filtro inteligente")
-            return filter_relevant_products(question, products, max_products=10)
+            return filter_relevant_products(question, catalog, max_products=10)
     
     else:  # general
         # Para preguntas generales, mostrar productos variados
+        if constraints is not None:
+            logger.info(f"[catalog] pregunta general con restricciones {constraints}")
+            return catalog.index.by_attributes(constraints, limit=8)
         logger.info(f"[catalog] pregunta general, mostrando productos destacados")
         return products[:8]  # Primeros 8 productos
 
 
-def generate_local(question: str, products: List[Dict[str, Any]]) -> str:
-    """Genera una respuesta natural usando el modelo con información de productos filtrados."""
-    pipe = load_local_model()
-    
+# Bloques system de los prompts de respuesta (fijos: su KV-cache se puede reutilizar)
+ANSWER_PREFIX_PRODUCT = (
+    "<|im_start|>system\n"
+    "Eres un asistente de ventas profesional y amable. Siempre respondes en español.\n"
+    "REGLA IMPORTANTE: Solo puedes mencionar información que esté en el catálogo. NO inventes datos.<|im_end|>\n"
+    "<|im_start|>user\n"
+)
+ANSWER_PREFIX_CATALOG = (
+    "<|im_start|>system\n"
+    "Eres un asistente de ventas amable. Siempre respondes en español.\n"
+    "REGLA IMPORTANTE: Solo menciona productos que estén en el catálogo. NO inventes productos ni datos.<|im_end|>\n"
+    "<|im_start|>user\n"
+)
+ANSWER_PREFIX_DETAILS = (
+    "<|im_start|>system\n"
+    "Eres un asistente de ventas amable. Siempre respondes en español.\n"
+    "REGLA IMPORTANTE: Solo menciona productos e información que esté en el catálogo. NO inventes datos.<|im_end|>\n"
+    "<|im_start|>user\n"
+)
+
+
+@dataclass
+class LocalAnswerPlan:
+    """Todo lo necesario para generar (o no) la respuesta local de una pregunta."""
+    question: str
+    intent: Dict[str, Any]
+    relevant_products: List[Dict[str, Any]] = field(default_factory=list)
+    asking_details: bool = False
+    specific_product: Optional[Dict[str, Any]] = None
+    # Productos de la categoría en todo el catálogo (respuestas estructuradas de categoría)
+    category_total: int = 0
+    # Respuesta que no necesita el modelo (categorías disponibles, fuera de catálogo, sin resultados,
+    # respuestas estructuradas)
+    direct_response: Optional[str] = None
+    prompt: Optional[str] = None
+    # Parte fija inicial de `prompt` (system prompt), reutilizable con la KV-cache de prefijos
+    prompt_prefix: Optional[str] = None
+    # `prompt` ya tokenizado (None si el pipeline no tiene tokenizer) y su tamaño en tokens
+    input_ids: Optional[List[int]] = None
+    prompt_tokens: int = 0
+    max_tokens: int = 250
+    temperature: float = 0.7
+
+
+def plan_local_answer(question: str, catalog: CatalogSnapshot, pipe) -> LocalAnswerPlan:
+    """Clasifica la pregunta, busca en el catálogo y arma el prompt de respuesta."""
     # FASE 1: Clasificar la intención de la pregunta
-    intent = classify_question_intent(question, pipe)
+    with phase("classify"):
+        intent = classify_question_intent(question, pipe, catalog)
     
     # FASE 2: Buscar en el catálogo según la intención
-    relevant_products = search_catalog_by_intent(intent, question, products)
+    with phase("retrieve"):
+        relevant_products = search_catalog_by_intent(intent, question, catalog)
     
     logger.info(f"[local] productos filtrados: {len(relevant_products)}")
     
     # Manejar preguntas sobre categorías disponibles
     if intent.get("tipo") == "categorias_disponibles":
-        categories = get_available_categories(products)
+        categories = catalog.index.categories
         categories_text = "\n".join([f"• {cat.capitalize()}" for cat in categories])
-        return (
+        return LocalAnswerPlan(question=question, intent=intent, direct_response=(
             f"¡Claro! Tenemos productos en las siguientes categorías:\n\n"
             f"{categories_text}\n\n"
             f"¿Te gustaría ver productos de alguna categoría en particular?"
-        )
+        ))
     
     # Manejar preguntas fuera del catálogo
     if intent.get("tipo") == "fuera_catalogo":
-        return "Hola! Soy tu asistente de ventas. Estoy aquí para ayudarte con información sobre nuestros productos. ¿Qué te gustaría saber?"
+        return LocalAnswerPlan(question=question, intent=intent, direct_response=(
+            "Hola! Soy tu asistente de ventas. Estoy aquí para ayudarte con información sobre nuestros productos. ¿Qué te gustaría saber?"
+        ))
     
     if not relevant_products:
-        return "Lo siento, no encontré productos que coincidan con tu búsqueda. ¿Puedo ayudarte con algo más?"
+        return LocalAnswerPlan(question=question, intent=intent, direct_response=(
+            "Lo siento, no encontré productos que coincidan con tu búsqueda. ¿Puedo ayudarte con algo más?"
+        ))
     
     # Detectar si pregunta por información detallada
     detail_keywords = ['detalles', 'detalle', 'información', 'info', 'características', 'más sobre', 
@@ -468,33 +1003,41 @@ def generate_local(question: str, products: List[Dict[str, Any]]) -> str:
         asking_details = True
         logger.info(f"[local] producto específico por intent: {specific_product['name']}")
     
-    # Preparar información detallada de productos para el prompt del modelo
-    products_info = []
-    for p in relevant_products:
-        if asking_details or specific_product:
-            # Información completa para el modelo
-            products_info.append(
-                f"{p['name']}: ${p['price']:.2f}, "
-                f"Categoría: {p.get('category', 'N/A')}, "
-                f"Stock: {p.get('stock', 0)} unidades, "
-                f"Descripción: {p.get('description', 'N/A')}"
-            )
-        else:
-            # Información básica
-            products_info.append(f"{p['name']}: ${p['price']:.2f}")
+    # Categoría: total real de la categoría (no de la lista recortada); 0 si los productos no salieron
+    # de la categoría sino del fallback por términos o palabras clave
+    category_total = 0
+    if STRUCTURED_ANSWERS and not specific_product and intent.get("tipo") == "categoria" and intent.get("categoria"):
+        constraints, _ = extract_constraints(question)
+        category_total = catalog.index.category_size(intent["categoria"], constraints)
+    
+    # Producto concreto o categoría: la respuesta se arma con los datos, sin pedírsela al modelo
+    if STRUCTURED_ANSWERS and (specific_product or category_total):
+        plan = LocalAnswerPlan(
+            question=question,
+            intent=intent,
+            relevant_products=relevant_products,
+            asking_details=asking_details,
+            specific_product=specific_product,
+            category_total=category_total,
+        )
+        with phase("postprocess"):
+            plan.direct_response = render_structured_answer(plan, catalog)
+        logger.info(f"[local] respuesta estructurada sin modelo ({len(plan.direct_response)} chars)")
+        return plan
     
-    products_text = "\n".join(products_info)
+    # FASE 3: Armar el prompt de respuesta
+    prompt_start = time.perf_counter()
     
-    # Prompt optimizado para Qwen2.5 - IMPORTANTE: Solo responder con info del catálogo
+    # Prompt optimizado para Qwen2.5 - IMPORTANTE: Solo responder con info del catálogo.
+    # Cada prompt es prefijo fijo + encabezado + líneas de productos + pregunta; las líneas
+    # (ya tokenizadas por versión del catálogo) entran hasta LOCAL_PROMPT_TOKEN_BUDGET
+    detailed = bool(asking_details or specific_product)
     if specific_product:
         # Prompt para producto específico (formato Qwen)
-        prompt = (
-            f"<|im_start|>system\n"
-            f"Eres un asistente de ventas profesional y amable. Siempre respondes en español.\n"
-            f"REGLA IMPORTANTE: Solo puedes mencionar información que esté en el catálogo. NO inventes datos.<|im_end|>\n"
-            f"<|im_start|>user\n"
-            f"Información del producto:\n{products_text}\n\n"
-            f"El cliente pregunta: {question}\n\n"
+        prompt_prefix = ANSWER_PREFIX_PRODUCT
+        header = "Información del producto:\n"
+        tail = (
+            f"\n\nEl cliente pregunta: {question}\n\n"
             f"Por favor, presenta la información del producto {specific_product['name']} en formato bullets (•) con doble salto de línea:\n"
             f"• Nombre\n• Precio\n• Categoría\n• Stock disponible\n• Descripción<|im_end|>\n"
             f"<|im_start|>assistant\n"
@@ -502,184 +1045,349 @@ def generate_local(question: str, products: List[Dict[str, Any]]) -> str:
     elif intent.get("tipo") == "categoria" and intent.get("categoria"):
         # Prompt para categoría específica (formato Qwen)
         categoria_nombre = intent.get("categoria").capitalize()
-        prompt = (
-            f"<|im_start|>system\n"
-            f"Eres un asistente de ventas amable. Siempre respondes en español.\n"
-            f"REGLA IMPORTANTE: Solo menciona productos que estén en el catálogo. NO inventes productos ni datos.<|im_end|>\n"
-            f"<|im_start|>user\n"
-            f"Productos de la categoría '{categoria_nombre}':\n{products_text}\n\n"
-            f"Pregunta: {question}\n\n"
+        prompt_prefix = ANSWER_PREFIX_CATALOG
+        header = f"Productos de la categoría '{categoria_nombre}':\n"
+        tail = (
+            f"\n\nPregunta: {question}\n\n"
             f"Por favor, presenta los productos de {categoria_nombre} con nombre y precio usando formato bullets (•). Sé amable y menciona cuántos productos hay disponibles.<|im_end|>\n"
             f"<|im_start|>assistant\n"
         )
     elif asking_details:
         # Prompt para información detallada (formato Qwen)
-        prompt = (
-            f"<|im_start|>system\n"
-            f"Eres un asistente de ventas amable. Siempre respondes en español.\n"
-            f"REGLA IMPORTANTE: Solo menciona productos e información que esté en el catálogo. NO inventes datos.<|im_end|>\n"
-            f"<|im_start|>user\n"
-            f"Productos disponibles:\n{products_text}\n\n"
-            f"Pregunta: {question}\n\n"
+        prompt_prefix = ANSWER_PREFIX_DETAILS
+        header = "Productos disponibles:\n"
+        tail = (
+            f"\n\nPregunta: {question}\n\n"
             f"Por favor, lista los productos con toda su información (nombre, precio, categoría, stock, descripción) usando formato bullets (•).<|im_end|>\n"
             f"<|im_start|>assistant\n"
         )
     else:
         # Prompt para consulta general (formato Qwen)
-        prompt = (
-            f"<|im_start|>system\n"
-            f"Eres un asistente de ventas amable. Siempre respondes en español.\n"
-            f"REGLA IMPORTANTE: Solo menciona productos que estén en el catálogo. NO inventes productos ni datos.<|im_end|>\n"
-            f"<|im_start|>user\n"
-            f"Productos disponibles:\n{products_text}\n\n"
-            f"Pregunta: {question}\n\n"
+        prompt_prefix = ANSWER_PREFIX_CATALOG
+        header = "Productos disponibles:\n"
+        tail = (
+            f"\n\nPregunta: {question}\n\n"
             f"Por favor, lista los productos relevantes con nombre y precio usando formato bullets (•). Sé breve y amable.<|im_end|>\n"
             f"<|im_start|>assistant\n"
         )
+    assembled = get_prompt_assembler(pipe).assemble(catalog, prompt_prefix, header, relevant_products, detailed, tail)
     
-    logger.info(f"[local] generando respuesta con modelo {HF_MODEL_ID.split('/')[-1]}...")
+    # Ajustar parámetros según el tipo de consulta (optimizado para Qwen2.5-1.5B)
+    if specific_product or asking_details:
+        max_tokens = 350  # Qwen2.5 es eficiente y conciso
+        temp = 0.6        # Balance entre creatividad y precisión
+    else:
+        max_tokens = 250  # Suficiente para listas
+        temp = 0.7        # Natural pero controlado
     
-    try:
-        # Ajustar parámetros según el tipo de consulta (optimizado para Qwen2.5-1.5B)
-        if specific_product or asking_details:
-            max_tokens = 350  # Qwen2.5 es eficiente y conciso
-            temp = 0.6        # Balance entre creatividad y precisión
+    record_phase("prompt", time.perf_counter() - prompt_start)
+    return LocalAnswerPlan(
+        question=question,
+        intent=intent,
+        relevant_products=relevant_products,
+        asking_details=asking_details,
+        specific_product=specific_product,
+        prompt=assembled.text,
+        prompt_prefix=prompt_prefix,
+        input_ids=assembled.input_ids,
+        prompt_tokens=assembled.tokens,
+        max_tokens=max_tokens,
+        temperature=temp,
+    )
+
+
+def clean_local_output(text: str) -> str:
+    """Quita el prompt y los tokens especiales de Qwen de la salida del pipeline."""
+    # Limpiar el prompt de la respuesta (formato Qwen)
+    # Qwen devuelve todo el prompt + respuesta
+    if "<|im_start|>assistant" in text:
+        text = text.split("<|im_start|>assistant")[-1].strip()
+    
+    # Remover tokens especiales de Qwen
+    text = text.replace("<|im_end|>", "").strip()
+    text = text.replace("<|im_start|>", "").strip()
+    
+    # Limpiar prefijos residuales
+    text = text.lstrip(": ").strip()
+    
+    return text.strip()
+
+
+def is_valid_model_answer(model_response: str) -> bool:
+    """Rechaza respuestas muy cortas o claramente en inglés."""
+    # Solo rechazar si es CLARAMENTE inglés (frases completas, no palabras sueltas)
+    english_phrases = ['yes we have', 'sure we have', 'we can help', 'our store', 'available in', 'here are the']
+    is_english = any(phrase in model_response.lower() for phrase in english_phrases)
+    
+    # Verificar si tiene contenido en español
+    spanish_indicators = ['¡', '¿', 'á', 'é', 'í', 'ó', 'ú', 'ñ', 'tenemos', 'productos', 'precio', 'disponible']
+    has_spanish = any(indicator in model_response.lower() for indicator in spanish_indicators)
+    
+    return not (len(model_response) < 10 or (is_english and not has_spanish))
+
+
+def structured_answer(
+    plan: LocalAnswerPlan,
+    catalog: CatalogSnapshot,
+    specific_intro: str,
+    list_intro: str,
+    products: Optional[List[Dict[str, Any]]] = None,
+) -> str:
+    """Respuesta armada directamente con los datos del catálogo (sin modelo).
+
+    Sin `products`, lista los resultados del filtro por palabras clave.
+    """
+    if plan.specific_product:
+        # Si es un producto específico, mostrar solo ese con toda la info
+        filtered_products = [plan.specific_product]
+    elif products is not None:
+        filtered_products = products
+    else:
+        # Usar fallback con filtrado inteligente
+        filtered_products = filter_relevant_products(plan.question, catalog, max_products=8)
+    
+    products_display = []
+    for p in filtered_products:
+        if plan.asking_details:
+            # Información completa en formato bullets con saltos de línea
+            products_display.append(
+                f"• {p['name']}\n\n"
+                f"• Precio: ${p['price']:.2f}\n\n"
+                f"• Categoría: {p.get('category', 'N/A')}\n\n"
+                f"• Stock disponible: {p.get('stock', 0)} unidades\n\n"
+                f"• Descripción: {p.get('description', 'N/A')}"
+            )
         else:
-            max_tokens = 250  # Suficiente para listas
-            temp = 0.7        # Natural pero controlado
-        
-        result = pipe(
-            prompt,
-            max_new_tokens=max_tokens,
-            temperature=temp,
-            do_sample=True,
-            top_p=0.9,
-            repetition_penalty=1.05,  # Qwen2.5 maneja muy bien las repeticiones
-            pad_token_id=pipe.tokenizer.eos_token_id
+            # Solo nombre y precio
+            products_display.append(f"• {p['name']} - ${p['price']:.2f}")
+    
+    separator = "\n\n" if plan.asking_details else "\n"
+    products_list_str = separator.join(products_display)
+    
+    if plan.specific_product:
+        return f"{specific_intro}\n\n{products_list_str}"
+    return f"{list_intro}\n\n{products_list_str}"
+
+
+# Frases de introducción de las respuestas estructuradas (la primera es la que se usa sin variaciones)
+STRUCTURED_SPECIFIC_INTROS = (
+    "¡Claro! Aquí está toda la información:",
+    "¡Por supuesto! Estos son los detalles del producto:",
+    "¡Con gusto! Esto es lo que tenemos:",
+)
+STRUCTURED_CATEGORY_INTROS = (
+    "¡Claro! En {categoria} tenemos {total} productos:",
+    "¡Por supuesto! Estos son los productos de {categoria} ({total} en total):",
+    "¡Con gusto! Mira lo que tenemos en {categoria} ({total} productos):",
+)
+# Productos listados como máximo en una respuesta de categoría
+STRUCTURED_MAX_PRODUCTS = 15
+
+
+def _pick_phrase(phrases: Tuple[str, ...], question: str) -> str:
+    if not STRUCTURED_ANSWER_VARIATIONS:
+        return phrases[0]
+    # Elegida por la pregunta normalizada: la misma pregunta recibe siempre la misma frase
+    return phrases[zlib.crc32(normalize_question(question).encode("utf-8")) % len(phrases)]
+
+
+def render_structured_answer(plan: LocalAnswerPlan, catalog: CatalogSnapshot) -> str:
+    """Respuesta de producto_especifico o categoria a partir del catálogo, con el formato del fallback."""
+    products = plan.relevant_products[:STRUCTURED_MAX_PRODUCTS]
+    categoria = (plan.intent.get("categoria") or "").capitalize()
+    list_intro = _pick_phrase(STRUCTURED_CATEGORY_INTROS, plan.question).format(
+        categoria=categoria, total=plan.category_total
+    )
+    return structured_answer(
+        plan, catalog,
+        _pick_phrase(STRUCTURED_SPECIFIC_INTROS, plan.question),
+        list_intro,
+        products=products,
+    )
+
+
+def finalize_local_answer(plan: LocalAnswerPlan, catalog: CatalogSnapshot, model_response: str) -> Tuple[str, bool]:
+    """Valida la respuesta del modelo. Devuelve (respuesta, si se usó la del modelo)."""
+    logger.info(f"[local] respuesta del modelo: {model_response[:100]}...")
+    
+    if not is_valid_model_answer(model_response):
+        logger.warning(f"[local] respuesta del modelo inválida (inglés o muy corta), usando fallback estructurado")
+        LOCAL_ANSWERS.labels("rejected").inc()
+        response = structured_answer(
+            plan, catalog,
+            "¡Claro! Aquí está toda la información:",
+            "¡Claro! Estos son nuestros productos:",
         )
-        
-        # Extraer texto generado
-        if isinstance(result, list) and len(result) > 0:
-            text = result[0].get("generated_text", "")
-        else:
-            text = str(result)
-        
-        # Limpiar el prompt de la respuesta (formato Qwen)
-        # Qwen devuelve todo el prompt + respuesta
-        if "<|im_start|>assistant" in text:
-            text = text.split("<|im_start|>assistant")[-1].strip()
-        
-        # Remover tokens especiales de Qwen
-        text = text.replace("<|im_end|>", "").strip()
-        text = text.replace("<|im_start|>", "").strip()
-        
-        # Limpiar prefijos residuales
-        text = text.lstrip(": ").strip()
-        
-        model_response = text.strip()
-        
-        logger.info(f"[local] respuesta del modelo: {model_response[:100]}...")
-        
-        # Validar si la respuesta es útil
-        # Solo rechazar si es CLARAMENTE inglés (frases completas, no palabras sueltas)
-        english_phrases = ['yes we have', 'sure we have', 'we can help', 'our store', 'available in', 'here are the']
-        is_english = any(phrase in model_response.lower() for phrase in english_phrases)
-        
-        # Verificar si tiene contenido en español
-        spanish_indicators = ['¡', '¿', 'á', 'é', 'í', 'ó', 'ú', 'ñ', 'tenemos', 'productos', 'precio', 'disponible']
-        has_spanish = any(indicator in model_response.lower() for indicator in spanish_indicators)
-        
-        if len(model_response) < 10 or (is_english and not has_spanish):
-            logger.warning(f"[local] respuesta del modelo inválida (inglés o muy corta), usando fallback estructurado")
-            # Usar fallback con filtrado inteligente
-            if specific_product:
-                # Si es un producto específico, mostrar solo ese con toda la info
-                filtered_products = [specific_product]
-            else:
-                filtered_products = filter_relevant_products(question, products, max_products=8)
-            
-            products_display = []
-            for p in filtered_products:
-                if asking_details:
-                    # Información completa en formato bullets con saltos de línea
-                    products_display.append(
-                        f"• {p['name']}\n\n"
-                        f"• Precio: ${p['price']:.2f}\n\n"
-                        f"• Categoría: {p.get('category', 'N/A')}\n\n"
-                        f"• Stock disponible: {p.get('stock', 0)} unidades\n\n"
-                        f"• Descripción: {p.get('description', 'N/A')}"
-                    )
-                else:
-                    # Solo nombre y precio
-                    products_display.append(f"• {p['name']} - ${p['price']:.2f}")
-            
-            separator = "\n\n" if asking_details else "\n"
-            products_list_str = separator.join(products_display)
-            
-            if specific_product:
-                response = f"¡Claro! Aquí está toda la información:\n\n{products_list_str}"
-            else:
-                response = f"¡Claro! Estos son nuestros productos:\n\n{products_list_str}"
-        else:
-            # Usar la respuesta del modelo
-            logger.info(f"[local] usando respuesta del modelo ({len(model_response)} chars)")
-            response = model_response[:800]  # Limitar a 800 caracteres
+        return response, False
+    
+    # Usar la respuesta del modelo
+    logger.info(f"[local] usando respuesta del modelo ({len(model_response)} chars)")
+    LOCAL_ANSWERS.labels("model").inc()
+    return model_response[:800], True  # Limitar a 800 caracteres
+
+
+def error_fallback_answer(plan: LocalAnswerPlan, catalog: CatalogSnapshot) -> str:
+    """Respuesta estructurada cuando el modelo falla."""
+    LOCAL_ANSWERS.labels("error").inc()
+    return structured_answer(
+        plan, catalog,
+        "¡Por supuesto! Aquí está toda la información:",
+        "¡Por supuesto! Mira lo que tenemos:",
+    )
+
+
+def _answer_generation_kwargs(plan: LocalAnswerPlan, pipe) -> Dict[str, Any]:
+    return dict(
+        max_new_tokens=plan.max_tokens,
+        temperature=plan.temperature,
+        do_sample=True,
+        top_p=0.9,
+        repetition_penalty=1.05,  # Qwen2.5 maneja muy bien las repeticiones
+        pad_token_id=pipe.tokenizer.eos_token_id
+    )
+
+
+def generate_local(question: str, catalog: CatalogSnapshot, on_done=None) -> str:
+    """Genera una respuesta natural usando el modelo con información de productos filtrados.
+
+    `on_done(respuesta)` se llama con las respuestas directas y con las del modelo, como en
+    stream_local(); nunca con un fallback (modelo rechazado o con error): el próximo intento puede
+    usar el modelo.
+    """
+    pipe = load_local_model()
+    plan = plan_local_answer(question, catalog, pipe)
+    if plan.direct_response is not None:
+        LOCAL_ANSWERS.labels("direct").inc()
+        if on_done is not None:
+            on_done(plan.direct_response)
+        return plan.direct_response
+    
+    logger.info(f"[local] generando respuesta con modelo {HF_MODEL_ID.split('/')[-1]}...")
+    
+    try:
+        with inference_gate.model_slot():
+            generate_start = time.perf_counter()
+            with phase("generate"):
+                text = generate_text(pipe, plan.prompt, prefix=plan.prompt_prefix, input_ids=plan.input_ids,
+                                     **_answer_generation_kwargs(plan, pipe))
+            generate_seconds = time.perf_counter() - generate_start
+        with phase("postprocess"):
+            answer = clean_local_output(text)
+            response, used_model = finalize_local_answer(plan, catalog, answer)
+        record_generation("local", plan.prompt_tokens, count_tokens(pipe, answer), generate_seconds)
             
+    except AdmissionRejected:
+        # Cola de inferencia saturada: el proveedor responde 429/503
+        raise
     except Exception as e:
         logger.warning(f"[local] error en modelo, usando fallback estructurado: {e}")
-        # Fallback con filtrado
-        if specific_product:
-            # Si es un producto específico, mostrar solo ese con toda la info
-            filtered_products = [specific_product]
-        else:
-            filtered_products = filter_relevant_products(question, products, max_products=8)
-        
-        products_display = []
-        for p in filtered_products:
-            if asking_details:
-                # Información completa en formato bullets con saltos de línea
-                products_display.append(
-                    f"• {p['name']}\n\n"
-                    f"• Precio: ${p['price']:.2f}\n\n"
-                    f"• Categoría: {p.get('category', 'N/A')}\n\n"
-                    f"• Stock disponible: {p.get('stock', 0)} unidades\n\n"
-                    f"• Descripción: {p.get('description', 'N/A')}"
-                )
-            else:
-                # Solo nombre y precio
-                products_display.append(f"• {p['name']} - ${p['price']:.2f}")
-        
-        separator = "\n\n" if asking_details else "\n"
-        products_list_str = separator.join(products_display)
-        
-        if specific_product:
-            response = f"¡Por supuesto! Aquí está toda la información:\n\n{products_list_str}"
-        else:
-            response = f"¡Por supuesto! Mira lo que tenemos:\n\n{products_list_str}"
+        # Fallback con filtrado (no se guarda en cache: el próximo intento puede usar el modelo)
+        return error_fallback_answer(plan, catalog)
     
     logger.info(f"[local] respuesta generada ({len(response)} chars)")
+    if on_done is not None and used_model:
+        on_done(response)
     
     return response
 
-@app.post("/api/chat")
-def chat(message: ChatMessage):
-    products = load_products()
-    if not products:
-        raise HTTPException(status_code=500, detail="No se pudo cargar el catálogo de productos")
+
+def create_streamer(tokenizer):
+    """Streamer de transformers que entrega solo el texto nuevo (se importa al primer uso)."""
+    streamer_cls = TextIteratorStreamer
+    if streamer_cls is None:
+        from transformers import TextIteratorStreamer as streamer_cls
+    return streamer_cls(tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+
+def stream_generation(
+    pipe, prompt: str, errors: List[Exception], input_ids: Optional[List[int]] = None, **generate_kwargs,
+) -> Iterator[str]:
+    """Fragmentos de texto de una generación local; si falla, el error se agrega a `errors`.
+
+    Con `input_ids` y el modelo en este proceso se genera desde esos ids, como en generate_text().
+    """
+    workers = _local_model_cache.get("workers")
+    if workers is not None:
+        try:
+            yield from workers.stream(prompt, **generate_kwargs)
+        except Exception as e:
+            errors.append(e)
+        return
     
-    logger.info("[chat] received message: %s", (message.content or "").strip()[:120])
+    streamer = create_streamer(pipe.tokenizer)
     
-    # Si USE_LOCAL_MODEL=true, usar modelo local
-    if USE_LOCAL_MODEL:
-        logger.info("[chat] usando modelo LOCAL con transformers")
+    def run_generation():
         try:
-            response_text = generate_local(message.content, products)
-            return {"response": response_text}
+            if input_ids is not None and _input_ids_enabled(pipe):
+                generate_from_ids(pipe, input_ids, streamer=streamer, **generate_kwargs)
+            else:
+                pipe(prompt, streamer=streamer, **generate_kwargs)
         except Exception as e:
-            logger.error(f"[chat] error generando respuesta: {e}")
-            raise HTTPException(status_code=500, detail=f"Error generando respuesta: {str(e)}")
+            errors.append(e)
+            streamer.end()
+    
+    thread = threading.Thread(target=run_generation, daemon=True)
+    thread.start()
+    yield from streamer
+    thread.join()
+
+
+def stream_local(question: str, catalog: CatalogSnapshot, on_done=None) -> Iterator[str]:
+    """Versión en streaming de generate_local(): emite eventos SSE a medida que el modelo genera.
+
+    `on_done(respuesta)` se llama al terminar con las respuestas directas y con las del modelo
+    (no con el fallback de una respuesta rechazada o de un error).
+    """
+    pipe = load_local_model()
+    plan = plan_local_answer(question, catalog, pipe)
+    if plan.direct_response is not None:
+        LOCAL_ANSWERS.labels("direct").inc()
+        yield sse_event("token", {"text": plan.direct_response})
+        yield sse_event("done", {"response": plan.direct_response, "replaced": False})
+        if on_done is not None:
+            on_done(plan.direct_response)
+        return
+    
+    logger.info(f"[local] generando respuesta en streaming con modelo {HF_MODEL_ID.split('/')[-1]}...")
     
-    # Si USE_LOCAL_MODEL=false, usar API de Hugging Face (requiere cuota)
+    errors: List[Exception] = []
+    cleaner = StreamCleaner(lstrip_chars=": ")
+    emitted = []
+    with inference_gate.model_slot():
+        generate_start = time.perf_counter()
+        # Los streamers no admiten beam search: forzar num_beams=1
+        chunks = stream_generation(pipe, plan.prompt, errors, input_ids=plan.input_ids, num_beams=1,
+                                   **_answer_generation_kwargs(plan, pipe))
+        for chunk in chunks:
+            text = cleaner.feed(chunk)
+            if text:
+                emitted.append(text)
+                yield sse_event("token", {"text": text})
+        generate_seconds = time.perf_counter() - generate_start
+    tail = cleaner.flush()
+    if tail:
+        emitted.append(tail)
+        yield sse_event("token", {"text": tail})
+    record_phase("generate", generate_seconds)
+    if not errors:
+        record_generation("local", plan.prompt_tokens, count_tokens(pipe, "".join(emitted)), generate_seconds)
+    
+    with phase("postprocess"):
+        if errors:
+            logger.warning(f"[local] error en modelo, usando fallback estructurado: {errors[0]}")
+            response, used_model = error_fallback_answer(plan, catalog), False
+        else:
+            response, used_model = finalize_local_answer(plan, catalog, "".join(emitted).strip())
+    
+    logger.info(f"[local] respuesta generada en streaming ({len(response)} chars)")
+    # Si el modelo falló o su respuesta se descartó, el cliente reemplaza lo mostrado
+    yield sse_event("done", {"response": response, "replaced": not used_model})
+    if on_done is not None and used_model:
+        on_done(response)
+
+
+def _remote_settings() -> Tuple[Optional[str], str, str, Optional[str]]:
+    """Credenciales y modelo de los proveedores remotos: (api_key, api_base, modelo, hf_token)."""
     openai_api_key = os.environ.get("OPENAI_API_KEY") or os.environ.get("HF_TOKEN")
     openai_api_base = os.environ.get("OPENAI_API_BASE", "https://router.huggingface.co/v1")
     openai_model = os.environ.get("OPENAI_MODEL") or os.environ.get("HF_MODEL_ID", "gpt-3.5-turbo")
@@ -695,84 +1403,187 @@ def chat(message: ChatMessage):
     logger.info("[chat] HF_TOKEN(masked)=%s", _mask_token(hf_token))
     uvicorn_logger.info("[chat] HF_MODEL_ID=%s", HF_MODEL_ID)
     uvicorn_logger.info("[chat] HF_TOKEN(masked)=%s", _mask_token(hf_token))
+    return openai_api_key, openai_api_base, openai_model, hf_token
+
+
+def _sse_response(events, cache_status: Optional[str] = None) -> StreamingResponse:
+    # Evita que proxies (nginx) acumulen el stream antes de enviarlo
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if cache_status:
+        headers["X-Cache"] = cache_status
+    return StreamingResponse(events, media_type="text/event-stream", headers=headers)
 
-    messages = build_messages(message.content, products)
 
+def get_provider() -> ChatProvider:
+    """Proveedor que genera las respuestas según la configuración (local, OpenAI-compatible o HF).
+
+    Las credenciales remotas se leen en cada request, como hasta ahora.
+    """
+    if USE_LOCAL_MODEL:
+        return LocalTransformersProvider(HF_MODEL_ID, generate_local, stream_local)
+    openai_api_key, openai_api_base, openai_model, hf_token = _remote_settings()
     # OpenAI-compatible path (Router HF si OPENAI_API_BASE=router y se usa HF_TOKEN)
     if openai_api_key:
-        try:
-            logger.info("[chat] using OpenAI-compatible provider: %s | model=%s", openai_api_base, openai_model)
-            uvicorn_logger.info("[chat] using OpenAI-compatible provider: %s | model=%s", openai_api_base, openai_model)
-            url = openai_api_base.rstrip('/') + "/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {openai_api_key}",
-                "Content-Type": "application/json",
-            }
-            payload = {
-                "model": openai_model,
-                "messages": messages,
-                "max_tokens": 400,
-                "temperature": 0.7,
-            }
-            with httpx.Client(timeout=60) as client:
-                resp = client.post(url, headers=headers, json=payload)
-                if resp.status_code != 200:
-                    logger.error("[chat] OpenAI-compatible error %s: %s", resp.status_code, resp.text)
-                    # Manejo especial para error 402 (sin créditos)
-                    if resp.status_code == 402:
-                        raise HTTPException(
-                            status_code=402,
-                            detail="Has excedido tus créditos mensuales en Hugging Face. Por favor cambia HF_MODEL_ID a un modelo gratuito como 'mistralai/Mistral-7B-Instruct-v0.2' o suscríbete a HF Pro."
-                        )
-                    raise HTTPException(status_code=resp.status_code, detail=resp.text)
-                data = resp.json()
-                text = data.get("choices", [{}])[0].get("message", {}).get("content")
-                if not text:
-                    text = str(data)
-                # Strip <think>...</think>
-                cleaned = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip()
-                logger.info("[chat] sending response (%d chars)", len(cleaned))
-                uvicorn_logger.info("[chat] sending response (%d chars)", len(cleaned))
-                return {"response": cleaned}
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.exception("[chat] OpenAI-compatible failure: %r", e)
-            raise HTTPException(status_code=500, detail=str(e))
-
+        return OpenAICompatibleProvider(openai_api_key, openai_api_base, openai_model, get_http_client, build_messages)
     # Fallback HF path
+    return HFInferenceProvider(HF_MODEL_ID, lambda: get_hf_client(hf_token), build_prompt)
+
+
+def _cache_status(hit: bool) -> Optional[str]:
+    """Valor de la cabecera X-Cache (None si la cache de respuestas está deshabilitada)."""
+    if not response_cache.enabled:
+        return None
+    return "HIT" if hit else "MISS"
+
+
+@app.post("/api/catalog/reload")
+def reload_catalog():
+    """Fuerza la recarga del catálogo desde disco (p. ej. tras desplegar un products.json nuevo)."""
+    catalog = catalog_store.reload()
+    if not catalog.products:
+        raise HTTPException(status_code=500, detail="No se pudo cargar el catálogo de productos")
+    return {"version": catalog.version, "products": len(catalog.products)}
+
+
+def _backend_name() -> str:
+    """Quién genera las respuestas (etiqueta de las métricas): local, openai o hf."""
+    if USE_LOCAL_MODEL:
+        return "local"
+    return "openai" if (os.environ.get("OPENAI_API_KEY") or os.environ.get("HF_TOKEN")) else "hf"
+
+
+@contextmanager
+def track_request(endpoint: str):
+    """Cuenta el request y su duración en las métricas (en streaming, hasta empezar a emitir)."""
+    backend = _backend_name()
+    status = "200"
+    start = time.perf_counter()
     try:
-        client = InferenceClient(api_key=hf_token, base_url="https://router.huggingface.co/hf-inference")
-        prompt = build_prompt(message.content, products)
-        logger.info("[chat] invoking HF text_generation ...")
-        uvicorn_logger.info("[chat] invoking HF text_generation ...")
-        tg = client.text_generation(
-            prompt,
-            model=HF_MODEL_ID,
-            max_new_tokens=400,
-            temperature=0.7,
-            return_full_text=False,
-            do_sample=True,
-            top_p=0.95,
-            repetition_penalty=1.1,
-            stop_sequences=["</s>", "[/INST]"],
-        )
-        text = tg if isinstance(tg, str) else getattr(tg, "generated_text", str(tg))
-        logger.info("[chat] HF text_generation received")
-        uvicorn_logger.info("[chat] HF text_generation received")
-        cleaned = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip()
-        logger.info("[chat] sending response (%d chars)", len(cleaned))
-        uvicorn_logger.info("[chat] sending response (%d chars)", len(cleaned))
-        return {"response": cleaned}
-    except Exception as e1:
-        logger.exception("[chat] HF failure: %r", e1)
-        detail = str(e1)
-        if "410" in detail or "403" in detail:
-            detail = (
-                "El modelo configurado no está disponible o está restringido. "
-                "Prueba cambiando HF_MODEL_ID a un modelo público o utiliza un proveedor OpenAI-compatible."
-            )
-        raise HTTPException(status_code=500, detail=detail)
+        yield
+    except HTTPException as e:
+        status = str(e.status_code)
+        raise
+    except Exception:
+        status = "500"
+        raise
+    finally:
+        REQUESTS.labels(endpoint, backend, status).inc()
+        REQUEST_SECONDS.labels(endpoint, backend).observe(time.perf_counter() - start)
+
+
+@app.get("/health")
+def health():
+    """Liveness: el proceso responde."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness: hay catálogo y el backend configurado puede responder."""
+    catalog = catalog_store.get()
+    checks = {"catalog": bool(catalog.products)}
+    if USE_LOCAL_MODEL:
+        checks["transformers"] = TRANSFORMERS_AVAILABLE
+        if LOCAL_MODEL_PRELOAD:
+            # No recibir tráfico hasta que el modelo esté cargado y caliente
+            checks["model"] = _model_status["state"] == "ready"
+        if _local_model_cache["workers"] is not None:
+            checks["workers"] = _local_model_cache["workers"].alive()
+    else:
+        checks["credentials"] = bool(os.environ.get("OPENAI_API_KEY") or os.environ.get("HF_TOKEN"))
+    is_ready = all(checks.values())
+    body = {
+        "status": "ready" if is_ready else "not_ready",
+        "backend": _backend_name(),
+        "catalog_version": catalog.version,
+        "products": len(catalog.products),
+        "checks": checks,
+    }
+    if USE_LOCAL_MODEL:
+        body["model"] = dict(_model_status)
+        body["queue"] = {"active": inference_gate.active, "waiting": inference_gate.waiting}
+    if SEMANTIC_SEARCH:
+        store = get_semantic_store()
+        body["semantic"] = {"catalog_version": store.version, **store.last_build}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    """Métricas en formato Prometheus."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.post("/api/chat")
+async def chat(message: ChatMessage, response: Response):
+    with track_request("chat"):
+        return await _chat(message, response)
+
+
+async def _chat(message: ChatMessage, response: Response):
+    with phase("catalog"):
+        # En el threadpool: si cambió el archivo, get() recarga el catálogo
+        catalog = await run_in_threadpool(catalog_store.get)
+    products = catalog.products
+    if not products:
+        raise HTTPException(status_code=500, detail="No se pudo cargar el catálogo de productos")
+    
+    logger.info("[chat] received message: %s", (message.content or "").strip()[:120])
+    
+    provider = get_provider()
+    model_id = provider.model_id()
+    
+    cached = response_cache.get(message.content, catalog.version, model_id)
+    cache_status = _cache_status(cached is not None)
+    if cache_status:
+        response.headers["X-Cache"] = cache_status
+    if cached is not None:
+        logger.info("[chat] respuesta desde cache (%d chars)", len(cached))
+        return {"response": cached}
+    
+    def store_response(text: str) -> None:
+        response_cache.set(message.content, catalog.version, model_id, text)
+    
+    response_text = await provider.answer(message.content, catalog, on_done=store_response)
+    return {"response": response_text}
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(message: ChatMessage):
+    """Como /api/chat pero emite la respuesta con Server-Sent Events a medida que se genera.
+
+    Eventos: `token` ({"text"}) por cada fragmento, `done` ({"response", "replaced"})
+    con la respuesta final (si `replaced` es true, el cliente debe sustituir lo que
+    mostró: el modelo falló o su respuesta fue descartada) y `error` ({"detail"}).
+    """
+    with track_request("chat_stream"):
+        return await _chat_stream(message)
+
+
+async def _chat_stream(message: ChatMessage):
+    with phase("catalog"):
+        # En el threadpool: si cambió el archivo, get() recarga el catálogo
+        catalog = await run_in_threadpool(catalog_store.get)
+    if not catalog.products:
+        raise HTTPException(status_code=500, detail="No se pudo cargar el catálogo de productos")
+    
+    logger.info("[chat] received message (stream): %s", (message.content or "").strip()[:120])
+    
+    provider = get_provider()
+    model_id = provider.model_id()
+    
+    cached = response_cache.get(message.content, catalog.version, model_id)
+    if cached is not None:
+        logger.info("[chat] respuesta desde cache (%d chars)", len(cached))
+        events = [sse_event("token", {"text": cached}), sse_event("done", {"response": cached, "replaced": False})]
+        return _sse_response(iter(events), cache_status=_cache_status(True))
+    
+    def store_response(text: str) -> None:
+        response_cache.set(message.content, catalog.version, model_id, text)
+    
+    events = await provider.stream(message.content, catalog, on_done=store_response)
+    return _sse_response(events, cache_status=_cache_status(False))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+import re
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class AttributeConstraints:
+    """Restricciones de precio y disponibilidad pedidas en la pregunta.
+
+    Los límites de precio son opcionales; `*_inclusive` indica si el valor exacto
+    cumple ("hasta 100" sí, "menos de 100" no).
+    """
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_inclusive: bool = True
+    max_inclusive: bool = True
+    in_stock: bool = False
+
+    @property
+    def has_price(self) -> bool:
+        return self.min_price is not None or self.max_price is not None
+
+    def accepts_price(self, price: Any) -> bool:
+        if not self.has_price:
+            return True
+        if type(price) not in (int, float):
+            return False
+        if self.min_price is not None and (price < self.min_price or (price == self.min_price and not self.min_inclusive)):
+            return False
+        if self.max_price is not None and (price > self.max_price or (price == self.max_price and not self.max_inclusive)):
+            return False
+        return True
+
+    def accepts_stock(self, stock: Any) -> bool:
+        return not self.in_stock or (type(stock) in (int, float) and stock > 0)
+
+    def matches(self, p: Dict[str, Any]) -> bool:
+        """El producto cumple todas las restricciones (sin precio o stock numérico no cumple las suyas)."""
+        return self.accepts_price(p.get('price')) and self.accepts_stock(p.get('stock'))
+
+
+# Un precio: "100", "$100", "99,90", "1.500", "100 dólares". El número no puede seguir con
+# otra cifra ("15" de "15.6") ni con una unidad ("20 horas", "64 gb"): eso no es un precio
+_NUMBER = r"\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d+(?:[.,]\d+)?"
+_UNITS = (
+    r"horas?|hs?|minutos?|min|d[ií]as?|meses|años?|pulgadas?|\"|cm|mm|m|metros?|km|kg|g|gramos?|litros?|l|ml|"
+    r"gb|tb|mb|mah|w|watts?|v|voltios?|hz|mhz|ghz|mp|megap[ií]xeles|px|%|x|unidades|productos|art[ií]culos|piezas"
+)
+_PRICE = (
+    rf"(\$|us\$|usd|€)?\s*({_NUMBER})(?![.,]?\d)(?!\s*(?:{_UNITS})(?!\w))"
+    r"\s*(\$|€|usd|d[oó]lares|pesos|euros)?"
+)
+
+# (patrón, límite que fija, incluye el valor exacto); en orden: "no más de" antes que "más de"
+_PRICE_PATTERNS = [
+    (rf"entre\s+{_PRICE}\s+y\s+{_PRICE}", "range", True),
+    (rf"(?:no\s+m[aá]s\s+de|hasta|como\s+m[aá]ximo|m[aá]ximo(?:\s+de)?|<=)\s*{_PRICE}", "max", True),
+    (rf"(?:menos\s+de|menor(?:es)?\s+(?:a|de|que)|por\s+debajo\s+de|inferior(?:es)?\s+a|<)\s*{_PRICE}", "max", False),
+    (rf"(?:desde|a\s+partir\s+de|como\s+m[ií]nimo|m[ií]nimo(?:\s+de)?|>=)\s*{_PRICE}", "min", True),
+    (rf"(?:m[aá]s\s+de|mayor(?:es)?\s+(?:a|de|que)|por\s+encima\s+de|superior(?:es)?\s+a|>)\s*{_PRICE}", "min", False),
+]
+_PRICE_REGEXES = [(re.compile(rf"(?<!\w){pattern}(?!\w)"), bound, inclusive) for pattern, bound, inclusive in _PRICE_PATTERNS]
+# Sin símbolo de moneda, un número solo es un precio si la pregunta habla de precio
+# ("¿cuáles cuestan menos de 100?", "baratas, hasta 40")
+_PRICE_WORDS_REGEX = re.compile(
+    r"(?<!\w)(?:precios?|cuest(?:a|an|e|en)|valen|barat(?:o|a|os|as|ísim[oa]s?)|econ[oó]mic[oa]s?|"
+    r"presupuesto|pagar|gastar)(?!\w)"
+)
+# Atributos que se miden con números: "talla hasta 38", "pantalla de más de 15" no son precios
+_MEASURED_WORDS = {
+    'talla', 'tallas', 'numero', 'número', 'tamaño', 'pantalla', 'bateria', 'batería', 'capacidad', 'memoria',
+    'almacenamiento', 'ram', 'peso', 'medida', 'altura', 'ancho', 'largo', 'resolucion', 'resolución', 'potencia',
+}
+# Solo frases explícitas de stock: "disponible" o "quedan" sueltos también se usan para preguntar
+# por un producto ("¿el reloj está disponible en negro?", "¿cuántas quedan?")
+_STOCK_REGEX = re.compile(
+    r"(?<!\w)(?:(?:en|con|hay|tienen?|tengan)\s+stock|en\s+existencias?|(?:hay|quedan?)\s+disponibles?\s+de)(?!\w)"
+)
+
+
+def _number(text: str) -> float:
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+(?:,\d+)?", text):
+        # Separador de miles con punto: "1.500" o "1.500,50"
+        text = text.replace(".", "")
+    return float(text.replace(",", "."))
+
+
+def _is_price(match: "re.Match", text: str, price_words: bool) -> bool:
+    """El número (o rango) de `match` es un precio: con moneda, o en una pregunta sobre precios
+    y sin un atributo medible justo antes ("talla hasta 38")."""
+    groups = match.groups()
+    # Cada precio son tres grupos: moneda antes, número, moneda después
+    if any(groups[i] or groups[i + 2] for i in range(0, len(groups), 3)):
+        return True
+    if not price_words:
+        return False
+    before = text[:match.start()].split()
+    return not before or before[-1].strip("¿?¡!.,;:()") not in _MEASURED_WORDS
+
+
+def extract_constraints(question: str) -> Tuple[Optional[AttributeConstraints], str]:
+    """Restricciones de precio/stock de la pregunta y el resto del texto (sin ellas).
+
+    El resto es lo que se usa para buscar por palabras: en "zapatillas de menos de
+    $100" queda "zapatillas de". Un número cuenta como precio con un símbolo o
+    nombre de moneda ("$100", "100 pesos"), o sin él si la pregunta habla de precio
+    ("cuestan", "barato"); nunca si le sigue una unidad ("20 horas", "15.6
+    pulgadas"). Devuelve (None, pregunta) si no hay restricciones.
+    """
+    text = question.lower()
+    price_words = _PRICE_WORDS_REGEX.search(text) is not None
+    limits: Dict[str, Tuple[float, bool]] = {}
+    for regex, bound, inclusive in _PRICE_REGEXES:
+
+        def take(match: "re.Match") -> str:
+            if not _is_price(match, text, price_words):
+                return match.group(0)
+            if bound == "range":
+                low, high = sorted((_number(match.group(2)), _number(match.group(5))))
+                limits.setdefault("min", (low, True))
+                limits.setdefault("max", (high, True))
+            else:
+                limits.setdefault(bound, (_number(match.group(2)), inclusive))
+            return " "
+
+        text = regex.sub(take, text)
+    in_stock = _STOCK_REGEX.search(text) is not None
+    text = _STOCK_REGEX.sub(" ", text)
+    if not limits and not in_stock:
+        return None, question
+    min_price, min_inclusive = limits.get("min", (None, True))
+    max_price, max_inclusive = limits.get("max", (None, True))
+    constraints = AttributeConstraints(min_price, max_price, min_inclusive, max_inclusive, in_stock)
+    return constraints, " ".join(text.split())
+
+
+class AttributeIndex:
+    """Índices de precio y stock de un catálogo en memoria, por categoría y global.
+
+    Por cada categoría (y para todo el catálogo, con la clave None) guarda las
+    posiciones ordenadas por precio junto a un array paralelo de precios, así un
+    rango de precio es un par de bisect; además las posiciones con stock > 0 en el
+    orden del catálogo. Los productos sin precio numérico no entran en las
+    búsquedas por precio y los que no tienen stock numérico cuentan como agotados.
+    """
+
+    def __init__(self, products: Sequence[Dict[str, Any]], by_category: Dict[str, Sequence[int]]):
+        self.prices: Dict[Optional[str], array] = {}
+        self.price_positions: Dict[Optional[str], array] = {}
+        self.in_stock_positions: Dict[Optional[str], array] = {}
+        # Precio por posición (NaN si no es numérico) y stock > 0 por posición
+        self._price = array('d', (_numeric(p.get('price'), math.nan) for p in products))
+        self._stock = array('b', (1 if _numeric(p.get('stock'), 0) > 0 else 0 for p in products))
+        groups: Dict[Optional[str], Sequence[int]] = dict(by_category)
+        groups[None] = range(len(self._price))
+        for category, positions in groups.items():
+            priced = sorted((pos for pos in positions if not math.isnan(self._price[pos])), key=self._price.__getitem__)
+            self.prices[category] = array('d', (self._price[pos] for pos in priced))
+            self.price_positions[category] = array('I', priced)
+            self.in_stock_positions[category] = array('I', (pos for pos in positions if self._stock[pos]))
+
+    def accepts(self, pos: int, constraints: AttributeConstraints) -> bool:
+        """El producto en `pos` cumple las restricciones (sin leer el producto)."""
+        if constraints.in_stock and not self._stock[pos]:
+            return False
+        if not constraints.has_price:
+            return True
+        price = self._price[pos]
+        return not math.isnan(price) and constraints.accepts_price(price)
+
+    def positions(self, constraints: AttributeConstraints, category: Optional[str] = None) -> Iterator[int]:
+        """Posiciones que cumplen las restricciones: por precio ascendente si hay rango, si no en orden del catálogo."""
+        key = category.lower() if category is not None else None
+        if not constraints.has_price:
+            positions = self.in_stock_positions.get(key, ()) if constraints.in_stock else ()
+            return iter(positions)
+        prices = self.prices.get(key, array('d'))
+        start, end = 0, len(prices)
+        if constraints.min_price is not None:
+            start = (bisect_left if constraints.min_inclusive else bisect_right)(prices, constraints.min_price)
+        if constraints.max_price is not None:
+            end = (bisect_right if constraints.max_inclusive else bisect_left)(prices, constraints.max_price)
+        positions = self.price_positions.get(key, array('I'))
+        matches = (positions[i] for i in range(start, end))
+        if constraints.in_stock:
+            return (pos for pos in matches if self._stock[pos])
+        return matches
+
+
+def _numeric(value: Any, default: float) -> float:
+    return value if type(value) in (int, float) else default
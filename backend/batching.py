@@ -0,0 +1,114 @@
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict, Hashable, List
+
+logger = logging.getLogger("backend")
+
+
+def _processor_key(processor: Any) -> Hashable:
+    # Los processors sin `batch_key` (con estado propio de un request) no se agrupan
+    key = getattr(processor, "batch_key", None)
+    if key is None:
+        raise TypeError(f"{type(processor).__name__} sin batch_key")
+    return (type(processor).__name__, key)
+
+
+def generation_key(kwargs: Dict[str, Any]) -> Hashable:
+    """Clave de los parámetros de generación; TypeError si no se pueden comparar.
+
+    Los logits processors se comparan por su tipo y su `batch_key` (no por
+    identidad), así las clasificaciones con decodificación restringida se agrupan.
+    """
+    items = []
+    for name, value in sorted(kwargs.items()):
+        if name == "logits_processor":
+            value = tuple(_processor_key(p) for p in value)
+        items.append((name, value))
+    key = tuple(items)
+    hash(key)
+    return key
+
+
+class _Pending:
+    __slots__ = ("prompt", "kwargs", "key", "future")
+
+    def __init__(self, prompt: str, kwargs: Dict[str, Any]):
+        self.prompt = prompt
+        self.kwargs = kwargs
+        # Solo se agrupan prompts con los mismos parámetros de generación (los que no
+        # se pueden comparar van solos)
+        try:
+            self.key = generation_key(kwargs)
+        except TypeError:
+            self.key = object()
+        self.future: Future = Future()
+
+
+class BatchScheduler:
+    """Micro-batching dinámico para el pipeline local de transformers.
+
+    Los requests llaman a `submit()` desde sus hilos y quedan esperando. Un hilo
+    dedicado junta los prompts que llegan durante `max_wait_ms` (o hasta
+    `max_batch_size`), los agrupa por parámetros de generación y ejecuta cada grupo
+    como un único `generate` con padding; después reparte los resultados.
+    """
+
+    def __init__(self, pipe, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.pipe = pipe
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.batched_prompts = 0
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="local-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, **generate_kwargs) -> Any:
+        """Encola el prompt y bloquea hasta tener el resultado (mismo formato que `pipe(prompt)`)."""
+        pending = _Pending(prompt, generate_kwargs)
+        self._queue.put(pending)
+        return pending.future.result()
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.batched_prompts / self.batches if self.batches else 0.0
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups: Dict[tuple, List[_Pending]] = {}
+            for pending in batch:
+                groups.setdefault(pending.key, []).append(pending)
+            for items in groups.values():
+                self._run(items)
+
+    def _run(self, items: List[_Pending]) -> None:
+        try:
+            if len(items) == 1:
+                outputs = [self.pipe(items[0].prompt, **items[0].kwargs)]
+            else:
+                # Los logits processors del primero (recién creados) sirven para todo el batch
+                outputs = self.pipe([p.prompt for p in items], batch_size=len(items), **items[0].kwargs)
+            self.batches += 1
+            self.batched_prompts += len(items)
+            if len(items) > 1:
+                logger.info(f"[batch] {len(items)} prompts en un solo generate (promedio {self.average_batch_size:.2f})")
+            for pending, output in zip(items, outputs):
+                pending.future.set_result(output)
+        except Exception as e:
+            for pending in items:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
@@ -0,0 +1,85 @@
+"""Filtros de precio y stock: índice de atributos (bisect) contra un recorrido lineal.
+
+Para cada tamaño de catálogo sintético mide la latencia media de las consultas
+de QUERIES (rangos de precio y stock, por categoría y en todo el catálogo) con:
+
+    lineal    recorrido de todos los productos con AttributeConstraints.matches y orden por precio
+    índice    CatalogIndex.by_attributes (bisect sobre los precios ordenados)
+    sqlite    SQLiteCatalogIndex.by_attributes (índices B-tree de la base)
+
+Antes comprueba que los tres devuelvan los mismos productos en el mismo orden.
+
+Uso (desde backend/):
+    python -m benchmarks.attributes [--sizes 10000,100000,1000000] [--limit 100] [--repeat 20]
+"""
+import argparse
+import os
+import tempfile
+import time
+from itertools import islice
+
+from attributes import extract_constraints
+from catalog import CatalogIndex
+from catalog_sqlite import SQLiteCatalogIndex, import_products
+from benchmarks.data import synthetic_catalog
+
+# (pregunta de la que salen las restricciones, categoría)
+QUERIES = [
+    ("zapatillas de menos de $100", "calzado"),
+    ("entre $50 y $150 en stock", "electrónica"),
+    ("desde 200 dólares", None),
+    ("precio no más de 20", None),
+    ("qué hay en stock", "ropa"),
+]
+
+
+def linear(products, constraints, category, limit):
+    matches = (p for p in products
+               if (category is None or p.get('category', '').lower() == category) and constraints.matches(p))
+    if constraints.has_price:
+        # sorted es estable: a igual precio, el orden del catálogo
+        return sorted(matches, key=lambda p: p['price'])[:limit]
+    return list(islice(matches, limit))
+
+
+def per_query_ms(fn, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for constraints, category in queries:
+            fn(constraints, category)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    queries = [(extract_constraints(question)[0], category) for question, category in QUERIES]
+    print(f"{'productos':>10} {'índice (s)':>11} {'lineal (ms)':>12} {'índice (ms)':>12} {'sqlite (ms)':>12}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        products = synthetic_catalog(size)
+        start = time.perf_counter()
+        index = CatalogIndex(products)
+        build_s = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "catalog.db")
+            import_products(products, db_path)
+            db = SQLiteCatalogIndex(db_path)
+
+            for constraints, category in queries:
+                expected = [p['id'] for p in linear(products, constraints, category, args.limit)]
+                assert [p['id'] for p in index.by_attributes(constraints, category, args.limit)] == expected
+                assert [p['id'] for p in db.by_attributes(constraints, category, args.limit)] == expected
+
+            repeat_linear = max(1, args.repeat * 10000 // size)
+            linear_ms = per_query_ms(lambda c, cat: linear(products, c, cat, args.limit), queries, repeat_linear)
+            index_ms = per_query_ms(lambda c, cat: index.by_attributes(c, cat, args.limit), queries, args.repeat)
+            sqlite_ms = per_query_ms(lambda c, cat: db.by_attributes(c, cat, args.limit), queries, args.repeat)
+        print(f"{size:>10} {build_s:>11.2f} {linear_ms:>12.2f} {index_ms:>12.3f} {sqlite_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
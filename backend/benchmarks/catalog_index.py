@@ -0,0 +1,96 @@
+"""Compara el scan lineal original contra el índice invertido del catálogo.
+
+Uso (desde backend/):
+    python -m benchmarks.catalog_index [--sizes 50,1000,10000,100000] [--repeat 20]
+"""
+import argparse
+import logging
+import string
+import time
+from typing import List, Dict, Any
+
+import app
+from catalog import CatalogSnapshot, CatalogIndex, normalize_word
+from benchmarks.data import synthetic_catalog
+
+# Consultas con términos que aparecen en una fracción fija del catálogo (posting lists
+# que crecen con él) y consultas selectivas (posting lists de tamaño casi constante)
+COMMON_QUESTIONS = [
+    "¿Tienes zapatillas para correr?",
+    "Mochila para Portátil",
+    "Busco una camiseta de algodón azul",
+    "Necesito auriculares inalámbricos",
+]
+SELECTIVE_QUESTIONS = [
+    "¿Tienes el M43 en stock?",
+    "Busco el M7",
+    "¿Tienes la referencia M21?",
+]
+
+_STOP_WORDS = {'que', 'qué', 'cual', 'cuál', 'tiene', 'tienes', 'hay', 'vende', 'vendes',
+               'me', 'puedes', 'puede', 'mostrar', 'ver', 'busco', 'quiero', 'necesito',
+               'un', 'una', 'el', 'la', 'los', 'las', 'de', 'del', 'para', 'con'}
+
+
+def linear_filter(question: str, products: List[Dict[str, Any]], max_products: int = 10) -> List[Dict[str, Any]]:
+    """Implementación original de filter_relevant_products (scan completo por request)."""
+    translator = str.maketrans('', '', string.punctuation + '¿¡')
+    question_clean = question.lower().translate(translator)
+    keywords = [normalize_word(w) for w in question_clean.split() if w not in _STOP_WORDS and len(w) > 2]
+    scored = []
+    for product in products:
+        score = 0
+        name_words = [normalize_word(w) for w in product.get('name', '').lower().split()]
+        category_words = [normalize_word(w) for w in product.get('category', '').lower().split()]
+        desc_words = [normalize_word(w) for w in product.get('description', '').lower().split()]
+        all_words = name_words + category_words + desc_words
+        for keyword in keywords:
+            if keyword in all_words:
+                score += 10
+                if keyword in name_words:
+                    score += 20
+                if keyword in category_words:
+                    score += 15
+        if score > 0:
+            scored.append((score, product))
+    scored.sort(reverse=True, key=lambda x: x[0])
+    return [p for _, p in scored[:max_products]] or products[:max_products]
+
+
+def _per_call_ms(fn, questions: List[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in questions:
+            fn(q)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(questions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger("backend").setLevel(logging.WARNING)
+
+    print(f"{'productos':>10} {'build índice (s)':>17} {'lineal (ms)':>12} {'índice (ms)':>12} {'selectivas (ms)':>16}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        products = synthetic_catalog(size)
+        start = time.perf_counter()
+        index = CatalogIndex(products)
+        build_s = time.perf_counter() - start
+        catalog = CatalogSnapshot(version=1, products=products, index=index, path="<bench>", mtime_ns=0, size=0, loaded_at=0.0)
+
+        for q in COMMON_QUESTIONS + SELECTIVE_QUESTIONS:
+            assert app.filter_relevant_products(q, catalog) == linear_filter(q, products), q
+
+        indexed = lambda q: app.filter_relevant_products(q, catalog)
+        linear_repeat = max(1, min(args.repeat, 200_000 // size))
+        linear_ms = _per_call_ms(lambda q: linear_filter(q, products), COMMON_QUESTIONS, linear_repeat)
+        indexed_ms = _per_call_ms(indexed, COMMON_QUESTIONS, args.repeat)
+        selective_ms = _per_call_ms(indexed, SELECTIVE_QUESTIONS, args.repeat)
+        print(f"{size:>10} {build_s:>17.3f} {linear_ms:>12.3f} {indexed_ms:>12.3f} {selective_ms:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Memoria del catálogo: lista de dicts (cargador original) contra columnas.
+
+Para cada tamaño se genera un catálogo sintético en JSON y, en un proceso nuevo por
+representación, se carga y se mide con tracemalloc la memoria que queda retenida
+(después de un gc) y el pico durante la carga:
+
+    dicts     read_products_file(): la lista de dicts del JSON
+    columnas  ProductColumns sobre esa lista (los dicts se liberan)
+    índice    CatalogIndex completo, lo que guarda un snapshot (columnas + índice invertido)
+
+Uso (desde backend/):
+    python -m benchmarks.catalog_memory [--sizes 10000,100000,1000000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.data import synthetic_catalog
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAYOUTS = {
+    "dicts": "read_products_file(path)",
+    "columnas": "ProductColumns(read_products_file(path))",
+    "índice": "CatalogIndex(read_products_file(path))",
+}
+
+# Se ejecuta en el proceso medido; imprime una línea JSON con los resultados
+_CHILD = """
+import gc, json, time, tracemalloc
+from catalog import CatalogIndex, read_products_file
+from catalog_columns import ProductColumns
+path = {path!r}
+tracemalloc.start()
+start = time.perf_counter()
+catalog = {expr}
+seconds = time.perf_counter() - start
+gc.collect()
+current, peak = tracemalloc.get_traced_memory()
+print(json.dumps({{"retained": current, "peak": peak, "seconds": seconds}}))
+"""
+
+
+def _measure(path: str, layout: str) -> dict:
+    code = _CHILD.format(path=path, expr=LAYOUTS[layout])
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS))
+    args = parser.parse_args()
+
+    print(f"{'productos':>10} {'representación':>15} {'retenida (MB)':>14} {'bytes/producto':>15} "
+          f"{'pico (MB)':>10} {'carga (s)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            path = os.path.join(tmp, f"products-{size}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"products": synthetic_catalog(size)}, f, ensure_ascii=False)
+            for layout in args.layouts.split(","):
+                r = _measure(path, layout)
+                print(f"{size:>10} {layout:>15} {r['retained'] / 2**20:>14.1f} {r['retained'] / size:>15.0f} "
+                      f"{r['peak'] / 2**20:>10.1f} {r['seconds']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
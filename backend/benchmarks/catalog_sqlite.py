@@ -0,0 +1,118 @@
+"""Catálogo JSON en memoria contra catálogo SQLite (FTS5) según el tamaño del catálogo.
+
+Para cada tamaño se genera un catálogo sintético, se importa a SQLite y, en un
+proceso nuevo por backend, se carga con CatalogStore y se miden el tiempo de carga,
+el RSS y la latencia media de filter_relevant_products() y de las búsquedas de
+search_catalog_by_intent(). Antes se comprueba que ambos backends devuelvan los
+mismos productos.
+
+Uso (desde backend/):
+    python -m benchmarks.catalog_sqlite [--sizes 1000,10000,100000] [--repeat 20]
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import app
+from catalog import CatalogStore
+from benchmarks.data import synthetic_catalog
+from catalog_sqlite import import_products
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "¿Tienes zapatillas para correr?",
+    "Mochila para Portátil",
+    "Busco una camiseta de algodón azul",
+    "¿Tienes el M43 en stock?",
+]
+INTENTS = [
+    {"tipo": "producto_especifico", "terminos": ["mochila", "portátil"], "categoria": "accesorios"},
+    {"tipo": "categoria", "terminos": ["zapatillas"], "categoria": "calzado"},
+    {"tipo": "categoria", "terminos": ["auriculares", "monitor"], "categoria": None},
+]
+
+# Se ejecuta en el proceso medido; imprime una línea JSON con los resultados
+_CHILD = """
+import json, logging, sys, time
+logging.getLogger("backend").setLevel(logging.WARNING)
+import app
+from catalog import CatalogStore
+start = time.perf_counter()
+catalog = CatalogStore({path!r}, check_interval=0).get()
+load = time.perf_counter() - start
+questions, intents, repeat = {questions!r}, {intents!r}, {repeat}
+
+def per_call_ms(fn, items):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(items))
+
+filter_ms = per_call_ms(lambda q: app.filter_relevant_products(q, catalog), questions)
+intent_ms = per_call_ms(lambda i: app.search_catalog_by_intent(i, "", catalog), intents)
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+print(json.dumps({{"load": load, "rss_mb": rss_kb / 1024, "filter_ms": filter_ms, "intent_ms": intent_ms,
+                  "products": len(catalog.products)}}))
+"""
+
+
+def _measure(path: str, repeat: int) -> dict:
+    code = _CHILD.format(path=path, questions=QUESTIONS, intents=INTENTS, repeat=repeat)
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _check_same_results(json_path: str, db_path: str) -> None:
+    json_catalog = CatalogStore(json_path, check_interval=0).get()
+    sqlite_catalog = CatalogStore(db_path, check_interval=0).get()
+    assert json_catalog.index.categories == sqlite_catalog.index.categories
+    for q in QUESTIONS:
+        assert app.filter_relevant_products(q, json_catalog) == app.filter_relevant_products(q, sqlite_catalog), q
+    for intent in INTENTS:
+        expected = app.search_catalog_by_intent(intent, "", json_catalog)
+        assert expected == app.search_catalog_by_intent(intent, "", sqlite_catalog), intent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger("backend").setLevel(logging.WARNING)
+
+    print(f"{'productos':>10} {'backend':>8} {'import (s)':>11} {'carga (s)':>10} {'RSS (MB)':>9} "
+          f"{'filtro (ms)':>12} {'intención (ms)':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            products = synthetic_catalog(size)
+            json_path = os.path.join(tmp, f"products-{size}.json")
+            db_path = os.path.join(tmp, f"catalog-{size}.db")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"products": products}, f, ensure_ascii=False)
+            del products
+            start = time.perf_counter()
+            import_products(synthetic_catalog(size), db_path)
+            import_s = time.perf_counter() - start
+            _check_same_results(json_path, db_path)
+
+            for backend, path, imported in (("json", json_path, None), ("sqlite", f"sqlite:///{db_path}", import_s)):
+                r = _measure(path, args.repeat)
+                imported_text = f"{imported:.2f}" if imported is not None else "-"
+                print(f"{size:>10} {backend:>8} {imported_text:>11} {r['load']:>10.2f} {r['rss_mb']:>9.1f} "
+                      f"{r['filter_ms']:>12.3f} {r['intent_ms']:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
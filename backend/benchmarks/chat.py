@@ -0,0 +1,174 @@
+"""Benchmark de punta a punta de /api/chat sin red ni GPU.
+
+La app corre en el mismo proceso (httpx.ASGITransport). En modo `local` el modelo
+es un pipeline falso con latencia por token; en modo `openai` las preguntas van a un
+servidor OpenAI-compatible falso levantado en localhost. Reporta la latencia por
+fase (p50/p95/p99) y el throughput.
+
+Uso (desde backend/):
+    python -m benchmarks.chat [--mode local|openai] [--requests 200] [--concurrency 8]
+        [--stream] [--corpus benchmarks/corpus.jsonl --corpus ../test_classification.py]
+        [--tokens-per-second 200] [--latency-ms 200] [--batch-size 1] [--max-concurrency N]
+        [--workers 1] [--cpu-bound]
+"""
+import argparse
+import ast
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from typing import Dict, List
+
+import httpx
+
+import app
+from admission import InferenceGate
+from batching import BatchScheduler
+from workers import InferenceWorkerPool
+from metrics import PHASES, collect_phases
+from benchmarks.fake_openai import FakeOpenAIServer, FAKE_MODEL
+from benchmarks.stubs import StubPipeline, StubStreamer, install_stub_model, stub_pipeline
+
+BENCHMARKS_DIR = os.path.dirname(__file__)
+DEFAULT_CORPORA = [
+    os.path.join(BENCHMARKS_DIR, "corpus.jsonl"),
+    os.path.join(os.path.dirname(os.path.dirname(BENCHMARKS_DIR)), "test_classification.py"),
+]
+
+
+def load_corpus(path: str) -> List[str]:
+    """Preguntas de un .jsonl (campos message, content o title) o de los test_cases de un script .py."""
+    if path.endswith(".py"):
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "test_cases" for t in node.targets):
+                return [case["message"] for case in ast.literal_eval(node.value)]
+        return []
+
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            text = entry.get("message") or entry.get("content") or entry.get("title")
+            if text:
+                questions.append(text)
+    return questions
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(pct / 100.0 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+async def run(args) -> Dict[str, List[float]]:
+    questions = []
+    for path in args.corpus or DEFAULT_CORPORA:
+        questions.extend(load_corpus(path))
+    if not questions:
+        raise SystemExit("El corpus está vacío")
+
+    server = None
+    if args.mode == "local":
+        pipe_kwargs = dict(tokens_per_second=args.tokens_per_second, cpu_bound=args.cpu_bound)
+        pipe = StubPipeline(**pipe_kwargs)
+        install_stub_model(app, pipe)
+        if args.workers > 1:
+            workers = InferenceWorkerPool(pipe, functools.partial(stub_pipeline, **pipe_kwargs), args.workers,
+                                          streamer_factory=StubStreamer)
+            app._local_model_cache["workers"] = workers
+            # Como en la precarga: los workers arrancan antes de medir
+            app.warm_up_local_model(pipe)
+        elif args.batch_size > 1:
+            app._local_model_cache["scheduler"] = BatchScheduler(pipe, max_batch_size=args.batch_size)
+        # Cola de inferencia: por defecto tantas generaciones simultáneas como workers o tamaño del batch
+        max_concurrency = args.max_concurrency if args.max_concurrency is not None else max(1, args.batch_size, args.workers)
+        app.inference_gate = InferenceGate(
+            max_concurrency, max_queue=app.LOCAL_QUEUE_MAX_SIZE, max_wait=app.LOCAL_QUEUE_MAX_WAIT,
+        )
+    else:
+        server = FakeOpenAIServer(latency_ms=args.latency_ms, tokens_per_second=args.tokens_per_second).start()
+        app.USE_LOCAL_MODEL = False
+        os.environ.update(OPENAI_API_BASE=server.base_url, OPENAI_API_KEY="benchmark", OPENAI_MODEL=FAKE_MODEL)
+
+    path = "/api/chat/stream" if args.stream else "/api/chat"
+    samples: Dict[str, List[float]] = {name: [] for name in PHASES + ("total",)}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    errors = []
+
+    async def one(client: httpx.AsyncClient, question: str) -> None:
+        async with semaphore:
+            with collect_phases() as phases:
+                start = time.perf_counter()
+                resp = await client.post(path, json={"content": question})
+                await resp.aread()
+                total = time.perf_counter() - start
+            if resp.status_code != 200:
+                errors.append(f"{resp.status_code} {resp.text[:120]}")
+                return
+            samples["total"].append(total)
+            for name, seconds in phases.items():
+                samples.setdefault(name, []).append(seconds)
+
+    transport = httpx.ASGITransport(app=app.app)
+    async with app.app.router.lifespan_context(app.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Calentamiento: primera carga del catálogo, clasificador por reglas, etc.
+            await one(client, questions[0])
+            for values in samples.values():
+                values.clear()
+            errors.clear()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(client, questions[i % len(questions)]) for i in range(args.requests)))
+            elapsed = time.perf_counter() - start
+
+    if server is not None:
+        server.stop()
+
+    print(f"modo={args.mode} endpoint={path} requests={args.requests} concurrencia={args.concurrency} "
+          f"preguntas distintas={len(set(questions))}")
+    print(f"{'fase':<12} {'n':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    for name, values in samples.items():
+        if not values:
+            continue
+        ms = [v * 1000 for v in values]
+        print(f"{name:<12} {len(ms):>6} {percentile(ms, 50):>10.2f} {percentile(ms, 95):>10.2f} {percentile(ms, 99):>10.2f}")
+    ok = len(samples["total"])
+    print(f"throughput: {ok / elapsed:.1f} req/s ({ok} ok, {len(errors)} errores en {elapsed:.2f} s)")
+    for error in errors[:5]:
+        print(f"  error: {error}")
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("local", "openai"), default="local")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="usar /api/chat/stream")
+    parser.add_argument("--corpus", action="append", help="archivo .jsonl o .py con test_cases (se puede repetir)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="velocidad de generación simulada")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="modo openai: tiempo hasta el primer token")
+    parser.add_argument("--batch-size", type=int, default=1, help="modo local: micro-batching (1 = deshabilitado)")
+    parser.add_argument("--workers", type=int, default=1, help="modo local: procesos de inferencia (1 = en el proceso)")
+    parser.add_argument("--cpu-bound", action="store_true", help="modo local: el modelo falso ocupa la CPU en vez de dormir")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="modo local: generaciones simultáneas de la cola de inferencia (0 = sin límite)")
+    args = parser.parse_args()
+
+    logging.getLogger("backend").setLevel(logging.WARNING)
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
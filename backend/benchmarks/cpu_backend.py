@@ -0,0 +1,84 @@
+"""Memoria y tokens/s del modelo local con cada backend de CPU (auto vs int8 dinámico).
+
+Cada backend se mide en un proceso nuevo que carga el modelo con
+load_local_model() (LOCAL_CPU_BACKEND=<backend>), así el RSS no se mezcla entre
+ellos. Se reporta el tiempo de carga, el RSS antes y después de cargar y los
+tokens/s de generación greedy sobre los prompts de respuesta del corpus. Necesita
+transformers y torch; con int8, la primera ejecución cuantiza y guarda el modelo
+y las siguientes lo cargan de la cache.
+
+Uso (desde backend/):
+    python -m benchmarks.cpu_backend [--backends auto,int8] [--questions 10] [--max-new-tokens 64]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en el proceso medido; imprime una línea JSON con los resultados
+_CHILD = """
+import json, logging, os, time
+import app
+from benchmarks.chat import DEFAULT_CORPORA, load_corpus
+from benchmarks.speculative import answer_prompts, run
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+logging.getLogger("backend").setLevel(logging.WARNING)
+from cpu_backend import quantized_cache_path
+cached = app.LOCAL_CPU_BACKEND == "int8" and os.path.exists(
+    quantized_cache_path(app.LOCAL_QUANTIZED_CACHE_DIR, app.HF_MODEL_ID)
+)
+rss_before = rss_mb()
+start = time.perf_counter()
+pipe = app.load_local_model()
+load_seconds = time.perf_counter() - start
+rss_loaded = rss_mb()
+questions = []
+for path in DEFAULT_CORPORA:
+    questions.extend(load_corpus(path))
+prompts = answer_prompts(pipe, list(dict.fromkeys(questions))[:{questions}])
+run(pipe.model, pipe.tokenizer, prompts[:1], 8)
+_, tokens, seconds = run(pipe.model, pipe.tokenizer, prompts, {max_new_tokens})
+print(json.dumps({{
+    "cached": cached, "load": load_seconds, "rss_before": rss_before, "rss_loaded": rss_loaded,
+    "rss_peak": rss_mb(), "tokens": tokens, "seconds": seconds,
+}}))
+"""
+
+
+def measure(backend: str, questions: int, max_new_tokens: int) -> dict:
+    env = dict(os.environ, USE_LOCAL_MODEL="true", LOCAL_MODEL_PRELOAD="false", LOCAL_CPU_BACKEND=backend,
+               USE_8BIT_QUANTIZATION="false", LOCAL_DRAFT_MODEL_ID="", LOCAL_WORKERS="1")
+    code = _CHILD.format(questions=questions, max_new_tokens=max_new_tokens)
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"falló el backend {backend}:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="auto,int8")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'carga (s)':>10} {'modelo (MB)':>12} {'RSS (MB)':>10} {'tokens/s':>10}")
+    for backend in args.backends.split(","):
+        r = measure(backend, args.questions, args.max_new_tokens)
+        name = f"{backend}{' (cache)' if r['cached'] else ''}"
+        print(f"{name:<8} {r['load']:>10.1f} {r['rss_loaded'] - r['rss_before']:>12.0f} {r['rss_peak']:>10.0f} "
+              f"{r['tokens'] / r['seconds'] if r['seconds'] else 0.0:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import json
+import random
+from typing import List, Dict, Any
+
+BASE_PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "products.json")
+
+# Palabras extra para que los catálogos grandes no sean solo copias del original
+_COLORS = ["rojo", "verde", "gris", "blanco", "negro", "azul", "beige", "morado", "naranja", "rosa"]
+_MATERIALS = ["algodón", "cuero", "lino", "poliéster", "lana", "aluminio", "acero", "bambú"]
+
+
+def base_products() -> List[Dict[str, Any]]:
+    with open(BASE_PRODUCTS_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)["products"]
+
+
+def synthetic_catalog(size: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Genera `size` productos a partir de products.json con variantes de nombre y descripción.
+
+    Los primeros productos son exactamente los del catálogo real, así las consultas
+    de ejemplo siguen teniendo respuesta; el resto son variantes con un código de
+    modelo único, color y material.
+    """
+    rng = random.Random(seed)
+    base = base_products()
+    products = []
+    for i in range(size):
+        p = dict(base[i % len(base)])
+        if i >= len(base):
+            color = rng.choice(_COLORS)
+            material = rng.choice(_MATERIALS)
+            p["name"] = f"{p['name']} {color.capitalize()} M{i}"
+            p["description"] = f"{p['description']} Modelo M{i} de {material}."
+            p["price"] = round(p["price"] * rng.uniform(0.5, 1.5), 2)
+            p["stock"] = rng.randint(0, 200)
+        p["id"] = i + 1
+        products.append(p)
+    return products
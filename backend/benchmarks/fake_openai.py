@@ -0,0 +1,131 @@
+"""Servidor OpenAI-compatible falso (/chat/completions) para medir el camino remoto sin red.
+
+Uso independiente (desde backend/):
+    python -m benchmarks.fake_openai [--port 8089] [--latency-ms 200] [--tokens-per-second 50]
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+FAKE_MODEL = "fake-model"
+
+
+def _answer_words(messages: List[dict], answer_tokens: int) -> List[str]:
+    """Respuesta determinista en español: nombra los primeros productos del contexto."""
+    context = "\n".join(str(m.get("content", "")) for m in messages)
+    names = [line[2:].split(" | ")[0] for line in context.splitlines() if line.startswith("- ")]
+    text = "¡Claro! Tenemos " + ", ".join(names[:5]) + "." if names else "¡Claro! ¿En qué puedo ayudarte?"
+    words = text.split(" ")
+    filler = "Estos productos están disponibles con envío rápido y garantía".split(" ")
+    while len(words) < answer_tokens:
+        words.extend(filler)
+    return words[:answer_tokens]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeOpenAIServer"
+
+    def log_message(self, format, *args):  # noqa: A002 - silencio: el benchmark hace sus propios logs
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", "0"))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        words = _answer_words(body.get("messages", []), self.server.answer_tokens)
+        self.server.requests += 1
+
+        time.sleep(self.server.latency)
+        if body.get("stream"):
+            self._stream(words, body.get("model", FAKE_MODEL))
+            return
+
+        time.sleep(len(words) * self.server.token_interval)
+        payload = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": body.get("model", FAKE_MODEL),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": length // 4, "completion_tokens": len(words), "total_tokens": length // 4 + len(words)},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, words: List[str], model: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(self.server.token_interval)
+            delta = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}], "model": model}
+            self._chunk(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Responde /chat/completions (normal y stream) con latencia y velocidad de tokens configurables.
+
+    `latency_ms` es el tiempo hasta el primer token; luego cada token tarda
+    1/`tokens_per_second` (0 = instantáneo).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 200.0,
+                 tokens_per_second: float = 50.0, answer_tokens: int = 60):
+        super().__init__((host, port), _Handler)
+        self.latency = latency_ms / 1000.0
+        self.token_interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(port=args.port, latency_ms=args.latency_ms,
+                              tokens_per_second=args.tokens_per_second, answer_tokens=args.answer_tokens)
+    print(f"OPENAI_API_BASE={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Armado del prompt de respuesta local: f-strings + tokenizar todo contra PromptAssembler.
+
+Para preguntas de ejemplo (con sus productos ya buscados) mide por request:
+
+    original    formatear las líneas de todos los productos y tokenizar el prompt entero
+    armador     PromptAssembler con las líneas ya tokenizadas (solo se tokenizan encabezado y pregunta)
+
+y muestra los tokens del prompt y cuántos productos entran en el presupuesto.
+Antes comprueba que, sin presupuesto, el texto sea el mismo y que los ids
+concatenados coincidan con tokenizar el prompt completo.
+
+Por defecto usa el tokenizer falso de los benchmarks (una palabra = un token); con
+--tokenizer se usa el de transformers (p. ej. el de HF_MODEL_ID).
+
+Uso (desde backend/):
+    python -m benchmarks.prompt [--tokenizer MODEL_ID] [--budget 1024] [--repeat 200]
+"""
+import argparse
+import logging
+import time
+
+import app
+from catalog import CatalogIndex, CatalogSnapshot
+from context import PromptAssembler, product_prompt_line
+from benchmarks.data import synthetic_catalog
+from benchmarks.stubs import StubTokenizer
+
+# (pregunta, intención, líneas detalladas)
+CASES = [
+    ("¿Qué zapatillas tienes?", {"tipo": "categoria", "terminos": ["zapatillas"], "categoria": "calzado"}, False),
+    ("Detalles de los productos de electrónica",
+     {"tipo": "categoria", "terminos": ["electronica"], "categoria": "electrónica"}, True),
+    ("Busco una mochila", {"tipo": "general", "terminos": ["mochila"], "categoria": None}, False),
+]
+
+
+def original_prompt(tokenizer, prefix, header, products, detailed, tail):
+    products_text = "\n".join(product_prompt_line(p, detailed) for p in products)
+    text = f"{prefix}{header}{products_text}{tail}"
+    return text, tokenizer.encode(text, add_special_tokens=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokenizer", default=None, help="tokenizer de transformers (por defecto, uno falso)")
+    parser.add_argument("--budget", type=int, default=app.LOCAL_PROMPT_TOKEN_BUDGET)
+    parser.add_argument("--size", type=int, default=10000, help="productos del catálogo sintético")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.getLogger("backend").setLevel(logging.WARNING)
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    else:
+        tokenizer = StubTokenizer()
+    products = synthetic_catalog(args.size)
+    catalog = CatalogSnapshot(version=1, products=products, index=CatalogIndex(products), path="<bench>",
+                              mtime_ns=0, size=0, loaded_at=0.0)
+
+    print(f"{'pregunta':<42} {'productos':>9} {'en prompt':>9} {'tokens':>7} {'original (ms)':>14} {'armador (ms)':>13}")
+    for question, intent, detailed in CASES:
+        found = app.search_catalog_by_intent(intent, question, catalog)
+        prefix = app.ANSWER_PREFIX_DETAILS if detailed else app.ANSWER_PREFIX_CATALOG
+        header = "Productos disponibles:\n"
+        tail = f"\n\nPregunta: {question}\n\nPor favor, lista los productos.<|im_end|>\n<|im_start|>assistant\n"
+
+        unlimited = PromptAssembler(tokenizer, token_budget=0).assemble(catalog, prefix, header, found, detailed, tail)
+        text, ids = original_prompt(tokenizer, prefix, header, found, detailed, tail)
+        assert unlimited.text == text and unlimited.input_ids == list(ids)
+
+        assembler = PromptAssembler(tokenizer, token_budget=args.budget)
+        prompt = assembler.assemble(catalog, prefix, header, found, detailed, tail)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            original_prompt(tokenizer, prefix, header, found, detailed, tail)
+        original_ms = (time.perf_counter() - start) * 1000 / args.repeat
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            assembler.assemble(catalog, prefix, header, found, detailed, tail)
+        assembler_ms = (time.perf_counter() - start) * 1000 / args.repeat
+        print(f"{question[:42]:<42} {len(found):>9} {prompt.products:>9} {prompt.tokens:>7} "
+              f"{original_ms:>14.3f} {assembler_ms:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
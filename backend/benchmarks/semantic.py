@@ -0,0 +1,119 @@
+"""Búsqueda semántica: cálculo incremental de embeddings y latencia del top-K.
+
+Para cada tamaño de catálogo sintético mide con EmbeddingStore:
+    - el cálculo inicial de todos los embeddings,
+    - la reapertura con el catálogo sin cambios (solo se mapea el .npy),
+    - el recálculo tras modificar `--changed` de los productos (solo esos se codifican),
+    - la latencia de un top-K sobre la matriz memory-mapped (sin contar la codificación de la pregunta).
+
+Por defecto usa un encoder falso (bolsa de trigramas con hashing, dimensión 384)
+para medir la parte de numpy y disco sin descargar modelos; con --model se usa
+sentence-transformers y además se muestran los resultados de preguntas con
+sinónimos que el filtro por keywords no encuentra.
+
+Uso (desde backend/):
+    python -m benchmarks.semantic [--sizes 10000,100000,1000000] [--changed 0.01] [--model MODEL_ID]
+"""
+import argparse
+import logging
+import tempfile
+import time
+import zlib
+from typing import List
+
+import numpy as np
+
+import app
+from catalog import CatalogIndex, CatalogSnapshot
+from semantic import EmbeddingStore, load_sentence_encoder
+from benchmarks.data import synthetic_catalog
+
+SYNONYM_QUESTIONS = [
+    "¿Tienes laptops?",
+    "Busco tenis para correr",
+    "¿Venden audífonos?",
+    "Necesito un bolso para la computadora",
+]
+
+
+def hashing_encoder(dim: int = 384):
+    """Encoder falso y determinista: trigramas de caracteres proyectados con hashing."""
+    def encode(texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = f"  {text.lower()} "
+            for i in range(len(text) - 2):
+                vectors[row, zlib.crc32(text[i:i + 3].encode("utf-8")) % dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+    return encode
+
+
+def _snapshot(products, version: int, indexed: bool = False) -> CatalogSnapshot:
+    # El índice invertido solo hace falta para comparar con el filtro por keywords
+    index = CatalogIndex(products) if indexed else None
+    return CatalogSnapshot(version=version, products=products, index=index, path="<bench>",
+                           mtime_ns=0, size=0, loaded_at=0.0)
+
+
+def _changed_catalog(products, fraction: float):
+    changed = [dict(p) for p in products]
+    step = max(1, int(1 / fraction)) if fraction > 0 else len(changed) + 1
+    for pos in range(0, len(changed), step):
+        changed[pos]["description"] = changed[pos]["description"] + " Nueva temporada."
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--changed", type=float, default=0.01, help="fracción de productos modificados")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--model", default=None, help="modelo de sentence-transformers (por defecto, encoder falso)")
+    args = parser.parse_args()
+
+    logging.getLogger("backend").setLevel(logging.WARNING)
+    factory = (lambda: load_sentence_encoder(args.model)) if args.model else hashing_encoder
+
+    print(f"{'productos':>10} {'inicial (s)':>12} {'reapertura (s)':>15} {'incremental (s)':>16} "
+          f"{'codificados':>12} {'top-K (ms)':>11}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        products = synthetic_catalog(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = EmbeddingStore(tmp, args.model or "hashing", factory)
+            catalog = _snapshot(products, 1)
+            initial = store.build(catalog)
+            initial_s = store.last_build["seconds"]
+
+            reopened = EmbeddingStore(tmp, args.model or "hashing", factory)
+            reopened.build(_snapshot(products, 2))
+            reopen_s = reopened.last_build["seconds"]
+
+            changed = _snapshot(_changed_catalog(products, args.changed), 3)
+            embeddings = reopened.build(changed)
+            incremental_s, encoded = reopened.last_build["seconds"], reopened.last_build["encoded"]
+
+            # Las filas reutilizadas son idénticas a las del cálculo inicial
+            untouched = np.flatnonzero(embeddings.digests == initial.digests)
+            assert np.array_equal(embeddings.vectors[untouched[:1000]], initial.vectors[untouched[:1000]])
+
+            queries = reopened.encoder()(SYNONYM_QUESTIONS * (args.queries // len(SYNONYM_QUESTIONS) + 1))
+            start = time.perf_counter()
+            for query in queries[:args.queries]:
+                embeddings.top_k(query, args.top_k)
+            top_k_ms = (time.perf_counter() - start) * 1000 / args.queries
+            print(f"{size:>10} {initial_s:>12.2f} {reopen_s:>15.2f} {incremental_s:>16.2f} "
+                  f"{encoded:>12} {top_k_ms:>11.2f}")
+
+            if args.model and size == min(int(s) for s in args.sizes.split(",")):
+                indexed = _snapshot(changed.products, 3, indexed=True)
+                for question in SYNONYM_QUESTIONS:
+                    keyword = [p["name"] for p in app.filter_relevant_products(question, indexed, max_products=3)]
+                    hits = embeddings.top_k(reopened.encode_query(question), 3)
+                    semantic = [changed.products[pos]["name"] for pos, _ in hits]
+                    print(f"    {question}\n      keywords:  {keyword}\n      semántica: {semantic}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Tokens/s de la generación de respuestas con y sin modelo borrador (speculative decoding).
+
+Necesita transformers y torch y descarga los modelos. Los prompts son los de
+respuesta del backend para las preguntas del corpus. Se decodifica en greedy,
+así que con el borrador la salida debe ser idéntica: se reporta cuántas lo son.
+
+Uso (desde backend/):
+    python -m benchmarks.speculative [--model Qwen/Qwen2.5-1.5B-Instruct]
+        [--draft Qwen/Qwen2.5-0.5B-Instruct] [--draft-tokens 5] [--questions 20] [--max-new-tokens 128]
+"""
+import argparse
+import logging
+import time
+from typing import List
+
+import app
+from benchmarks.chat import DEFAULT_CORPORA, load_corpus
+
+
+def answer_prompts(pipe, questions: List[str]) -> List[str]:
+    """Prompts de respuesta del backend (las preguntas con respuesta directa no generan)."""
+    catalog = app.catalog_store.reload()
+    prompts = []
+    for question in questions:
+        plan = app.plan_local_answer(question, catalog, pipe)
+        if plan.prompt:
+            prompts.append(plan.prompt)
+    return prompts
+
+
+def run(model, tokenizer, prompts: List[str], max_new_tokens: int, draft=None) -> tuple:
+    import torch
+    outputs, tokens, seconds = [], 0, 0.0
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        start = time.perf_counter()
+        with torch.no_grad():
+            output = model.generate(
+                **inputs, max_new_tokens=max_new_tokens, do_sample=False, num_beams=1,
+                pad_token_id=tokenizer.eos_token_id, assistant_model=draft,
+            )
+        seconds += time.perf_counter() - start
+        new_ids = output[0, inputs.input_ids.shape[1]:]
+        tokens += len(new_ids)
+        outputs.append(new_ids.tolist())
+    return outputs, tokens, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=app.HF_MODEL_ID)
+    parser.add_argument("--draft", default=app.LOCAL_DRAFT_MODEL_ID or "Qwen/Qwen2.5-0.5B-Instruct")
+    parser.add_argument("--draft-tokens", type=int, default=app.LOCAL_DRAFT_TOKENS)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+    logging.getLogger("backend").setLevel(logging.WARNING)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype="auto")
+    draft = AutoModelForCausalLM.from_pretrained(args.draft, torch_dtype="auto").to(model.device)
+    draft.generation_config.num_assistant_tokens = args.draft_tokens
+    draft.generation_config.num_assistant_tokens_schedule = "constant"
+
+    questions = []
+    for path in DEFAULT_CORPORA:
+        questions.extend(load_corpus(path))
+    pipe = pipeline("text-generation", model=model, tokenizer=tokenizer)
+    prompts = answer_prompts(pipe, list(dict.fromkeys(questions))[:args.questions])
+    if not prompts:
+        raise SystemExit("Ninguna pregunta del corpus necesita generar")
+
+    # Calentamiento de ambos modelos
+    run(model, tokenizer, prompts[:1], 8)
+    run(model, tokenizer, prompts[:1], 8, draft=draft)
+
+    baseline, base_tokens, base_seconds = run(model, tokenizer, prompts, args.max_new_tokens)
+    assisted, assist_tokens, assist_seconds = run(model, tokenizer, prompts, args.max_new_tokens, draft=draft)
+    identical = sum(a == b for a, b in zip(baseline, assisted))
+
+    print(f"modelo={args.model} borrador={args.draft} tokens especulativos={args.draft_tokens} prompts={len(prompts)}")
+    print(f"{'modo':<12} {'tokens':>8} {'segundos':>10} {'tokens/s':>10}")
+    print(f"{'sin borrador':<12} {base_tokens:>8} {base_seconds:>10.2f} {base_tokens / base_seconds:>10.1f}")
+    print(f"{'con borrador':<12} {assist_tokens:>8} {assist_seconds:>10.2f} {assist_tokens / assist_seconds:>10.1f}")
+    print(f"speedup: {base_seconds / assist_seconds:.2f}x; salidas idénticas: {identical}/{len(prompts)}")
+
+
+if __name__ == "__main__":
+    main()
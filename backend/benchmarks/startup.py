@@ -0,0 +1,95 @@
+"""Tiempo de arranque y memoria en reposo del backend en cada modo.
+
+Cada modo se mide en un proceso nuevo: se importa la app y se ejecuta su lifespan
+(lo que hace uvicorn antes de aceptar requests). Se reporta el tiempo total del
+proceso, el de `import app` + lifespan, el RSS en reposo y si transformers/torch
+quedaron importados. En modo `local` la precarga del modelo está apagada; con
+--import-local-backend también se mide la importación de transformers y torch que
+hace la primera carga del modelo (sin descargar pesos).
+
+Uso (desde backend/):
+    python -m benchmarks.startup [--modes openai,hf,local] [--repeat 3] [--import-local-backend]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODE_ENV = {
+    "openai": {"USE_LOCAL_MODEL": "false", "OPENAI_API_KEY": "benchmark", "HF_TOKEN": ""},
+    "hf": {"USE_LOCAL_MODEL": "false", "OPENAI_API_KEY": "", "HF_TOKEN": "benchmark"},
+    "local": {"USE_LOCAL_MODEL": "true", "LOCAL_MODEL_PRELOAD": "false", "OPENAI_API_KEY": "", "HF_TOKEN": ""},
+}
+
+# Se ejecuta en el proceso medido; imprime una línea JSON con los resultados
+_CHILD = """
+import asyncio, json, logging, sys, time
+start = time.perf_counter()
+import app
+async def _lifespan():
+    async with app.app.router.lifespan_context(app.app):
+        pass
+asyncio.run(_lifespan())
+startup = time.perf_counter() - start
+import_local = None
+if {import_local} and app.TRANSFORMERS_AVAILABLE:
+    t = time.perf_counter()
+    import transformers, torch
+    import_local = time.perf_counter() - t
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+if not rss_kb:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "startup": startup,
+    "import_local": import_local,
+    "rss_mb": rss_kb / 1024,
+    "ml_imported": "torch" in sys.modules or "transformers" in sys.modules,
+}}))
+"""
+
+
+def measure(mode: str, import_local_backend: bool) -> Dict[str, float]:
+    env = dict(os.environ, **MODE_ENV[mode])
+    code = _CHILD.format(import_local=import_local_backend and mode == "local")
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="openai,hf,local")
+    parser.add_argument("--repeat", type=int, default=3, help="procesos por modo (se reporta la mediana)")
+    parser.add_argument("--import-local-backend", action="store_true",
+                        help="modo local: medir también la importación de transformers y torch")
+    args = parser.parse_args()
+
+    print(f"{'modo':<8} {'proceso (ms)':>13} {'app (ms)':>10} {'RSS (MB)':>10} {'torch/transformers':>19} {'import ML (ms)':>15}")
+    for mode in args.modes.split(","):
+        runs: List[Dict[str, float]] = [measure(mode, args.import_local_backend) for _ in range(args.repeat)]
+
+        def median(key: str) -> float:
+            return sorted(r[key] for r in runs)[len(runs) // 2]
+
+        import_local = median("import_local") * 1000 if runs[0]["import_local"] is not None else None
+        print(f"{mode:<8} {median('process') * 1000:>13.0f} {median('startup') * 1000:>10.0f} "
+              f"{median('rss_mb'):>10.1f} {'sí' if runs[0]['ml_imported'] else 'no':>19} "
+              f"{(f'{import_local:.0f}' if import_local is not None else '-'):>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Modelo local falso para los benchmarks: determinista, sin torch y con latencia simulada."""
+import json
+import queue
+import re
+import time
+import zlib
+from typing import Any, Dict, List, Union
+
+from constrained import register_tokenizer
+
+# Piezas de StubTokenizer: una palabra con los espacios que la siguen (o espacios al inicio)
+_PIECES = re.compile(r"\S+\s*|\s+")
+
+# Respuesta de clasificación del modelo falso (las reglas resuelven la mayoría antes)
+STUB_INTENT = {"tipo": "general", "terminos": [], "categoria": None}
+
+
+class StubTokenizer:
+    """Un token por palabra con los espacios que la siguen (el id es un hash de la pieza).
+
+    decode() devuelve el texto tal cual, como los tokenizers byte-level.
+    """
+    name_or_path = "stub"
+    eos_token_id = 0
+    pad_token_id = 0
+
+    def __init__(self):
+        self._pieces: Dict[int, str] = {}
+
+    def encode(self, text: str, add_special_tokens: bool = True) -> List[int]:
+        ids = []
+        for piece in _PIECES.findall(text):
+            token = zlib.crc32(piece.encode("utf-8"))
+            self._pieces[token] = piece
+            ids.append(token)
+        return ids
+
+    def decode(self, ids: List[int], skip_special_tokens: bool = True, **kwargs: Any) -> str:
+        return "".join(self._pieces.get(i, "") for i in ids)
+
+
+class StubStreamer:
+    """Sustituto de TextIteratorStreamer: el pipeline falso le entrega texto, no ids."""
+
+    def __init__(self, tokenizer=None, skip_prompt: bool = True, skip_special_tokens: bool = True, **kwargs):
+        self._queue: "queue.Queue" = queue.Queue()
+
+    def put_text(self, text: str) -> None:
+        self._queue.put(text)
+
+    def end(self) -> None:
+        self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            text = self._queue.get()
+            if text is None:
+                return
+            yield text
+
+
+def _answer_for(prompt: str) -> str:
+    """Respuesta en español con los productos del prompt (líneas con precio)."""
+    user_part = prompt.split("<|im_start|>user", 1)[-1]
+    products = [line.split(":")[0].strip() for line in user_part.splitlines() if "$" in line]
+    bullets = "\n".join(f"• {name}" for name in products[:8]) or "• Sin productos"
+    return f"¡Claro! Tenemos estos productos disponibles:\n{bullets}\n¿Te gustaría saber el precio de alguno?"
+
+
+class StubPipeline:
+    """Imita el pipeline de text-generation de transformers.
+
+    La latencia se simula por tokens (palabras): `prefill_tokens_per_second` para el
+    prompt y `tokens_per_second` para la salida. Un batch cuesta lo mismo que su
+    prompt más largo, como un generate con padding. Con `cpu_bound` la latencia se
+    consume ocupando la CPU (y el GIL) en lugar de dormir, como un modelo real.
+    """
+
+    def __init__(self, tokens_per_second: float = 200.0, prefill_tokens_per_second: float = 5000.0, cpu_bound: bool = False):
+        self.tokenizer = StubTokenizer()
+        self.tokens_per_second = tokens_per_second
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.cpu_bound = cpu_bound
+        self.calls = 0
+        self.generated_tokens = 0
+
+    def _output(self, prompt: str, max_new_tokens: int) -> List[str]:
+        if "Eres un clasificador" in prompt:
+            text = json.dumps(STUB_INTENT, ensure_ascii=False)
+        else:
+            text = _answer_for(prompt)
+        words = text.split(" ")[:max_new_tokens]
+        return [w + " " for w in words[:-1]] + words[-1:]
+
+    def _sleep(self, prompt_tokens: int, new_tokens: int) -> None:
+        seconds = 0.0
+        if self.prefill_tokens_per_second > 0:
+            seconds += prompt_tokens / self.prefill_tokens_per_second
+        if self.tokens_per_second > 0:
+            seconds += new_tokens / self.tokens_per_second
+        if not self.cpu_bound:
+            time.sleep(seconds)
+            return
+        deadline = time.thread_time() + seconds
+        while time.thread_time() < deadline:
+            pass
+
+    def __call__(self, prompts: Union[str, List[str]], streamer=None, **kwargs: Any):
+        self.calls += 1
+        max_new_tokens = kwargs.get("max_new_tokens") or 250
+        single = isinstance(prompts, str)
+        batch = [prompts] if single else list(prompts)
+        outputs = [self._output(p, max_new_tokens) for p in batch]
+        self.generated_tokens += sum(len(o) for o in outputs)
+
+        if streamer is not None:
+            # Streaming: solo prompts sueltos, como en stream_local()
+            self._sleep(len(batch[0].split()), 0)
+            for piece in outputs[0]:
+                self._sleep(0, 1)
+                streamer.put_text(piece)
+            streamer.end()
+            return None
+
+        self._sleep(max(len(p.split()) for p in batch), max(len(o) for o in outputs))
+        results: List[List[Dict[str, str]]] = [
+            [{"generated_text": p + "".join(o) + "<|im_end|>"}] for p, o in zip(batch, outputs)
+        ]
+        return results[0] if single else results
+
+
+def stub_pipeline(**kwargs: Any) -> StubPipeline:
+    """Loader de los workers de inferencia: como build_local_pipeline() pero con el modelo falso."""
+    pipe = StubPipeline(**kwargs)
+    register_tokenizer(pipe.tokenizer)
+    return pipe
+
+
+def install_stub_model(app_module, pipe: StubPipeline) -> None:
+    """Hace que el backend use `pipe` como modelo local (sin cargar transformers)."""
+    app_module.USE_LOCAL_MODEL = True
+    app_module.LOCAL_PREFIX_CACHE = False
+    app_module.TextIteratorStreamer = StubStreamer
+    app_module.load_local_model = lambda: pipe
+    # Como _load_local_model(): antes de crear workers, para los logits processors
+    register_tokenizer(pipe.tokenizer)
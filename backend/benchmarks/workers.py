@@ -0,0 +1,80 @@
+"""Memoria del modelo local con 1, 2 y 4 procesos de inferencia (LOCAL_WORKERS).
+
+Cada configuración se mide en un proceso nuevo que carga el modelo con
+load_local_model() y lo calienta con warm_up_local_model() (una generación en
+cada worker). Se suma la memoria del proceso principal y de sus workers: el RSS
+cuenta las páginas compartidas en cada proceso que las mapea, el PSS las reparte
+entre ellos, así que el PSS total es la memoria que ocupa realmente el conjunto.
+Con los pesos en memoria compartida el PSS total apenas crece con los workers.
+Necesita transformers y torch (y /proc/<pid>/smaps_rollup, Linux).
+
+Uso (desde backend/):
+    python -m benchmarks.workers [--workers 1,2,4] [--backend auto]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en el proceso medido; imprime una línea JSON con los resultados
+_CHILD = """
+import json, logging, os, time
+import app
+
+def memory_mb(pid):
+    rss = pss = 0
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Rss:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Pss:"):
+                pss = int(line.split()[1])
+    return rss / 1024, pss / 1024
+
+logging.getLogger("backend").setLevel(logging.WARNING)
+start = time.perf_counter()
+pipe = app.load_local_model()
+app.warm_up_local_model(pipe)
+seconds = time.perf_counter() - start
+workers = app._local_model_cache["workers"]
+pids = [os.getpid()] + ([p.pid for p in workers._processes] if workers is not None else [])
+usage = [memory_mb(pid) for pid in pids]
+print(json.dumps({
+    "seconds": seconds, "processes": len(pids),
+    "rss": sum(rss for rss, _ in usage), "pss": sum(pss for _, pss in usage),
+    "main_rss": usage[0][0],
+}))
+if workers is not None:
+    workers.close()
+"""
+
+
+def measure(workers: int, backend: str) -> dict:
+    env = dict(os.environ, USE_LOCAL_MODEL="true", LOCAL_MODEL_PRELOAD="false", LOCAL_CPU_BACKEND=backend,
+               USE_8BIT_QUANTIZATION="false", LOCAL_DRAFT_MODEL_ID="", LOCAL_WORKERS=str(workers))
+    out = subprocess.run([sys.executable, "-c", _CHILD], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"falló la medición con {workers} workers:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--backend", default="auto", help="LOCAL_CPU_BACKEND (auto o int8)")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'procesos':>9} {'carga (s)':>10} {'RSS principal (MB)':>19} "
+          f"{'RSS total (MB)':>15} {'PSS total (MB)':>15}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        r = measure(workers, args.backend)
+        print(f"{workers:>7} {r['processes']:>9} {r['seconds']:>10.1f} {r['main_rss']:>19.0f} "
+              f"{r['rss']:>15.0f} {r['pss']:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
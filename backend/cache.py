@@ -0,0 +1,115 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from catalog import normalize_question
+
+
+class TTLCache:
+    """Cache LRU acotada por tamaño y por TTL, segura para usar desde varios hilos.
+
+    Con `maxsize <= 0` la cache queda deshabilitada: `get()` siempre falla y `set()`
+    no guarda nada, así el código que la usa no necesita ramas especiales.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class ResponseCache:
+    """Respuestas completas por (pregunta normalizada, versión del catálogo, modelo).
+
+    La versión de catálogo solo avanza: con una más nueva que la última vista se
+    vacía la cache (las respuestas anteriores ya no podrían devolverse y solo
+    ocuparían sitio); un request que todavía usa una versión anterior no lee ni
+    guarda nada, y tampoco vacía la cache.
+    """
+
+    def __init__(self, maxsize: int = 0, ttl: Optional[float] = 600.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._cache.enabled
+
+    def _current(self, catalog_version: int) -> bool:
+        """Avanza a `catalog_version` si es nueva; False si es anterior a la última vista."""
+        with self._lock:
+            if self._version is not None and catalog_version < self._version:
+                return False
+            if catalog_version != self._version:
+                self._cache.clear()
+                self._version = catalog_version
+        return True
+
+    @staticmethod
+    def _key(question: str, catalog_version: int, model_id: str) -> tuple:
+        return (normalize_question(question), catalog_version, model_id)
+
+    def get(self, question: str, catalog_version: int, model_id: str) -> Optional[str]:
+        if not self.enabled or not self._current(catalog_version):
+            return None
+        return self._cache.get(self._key(question, catalog_version, model_id))
+
+    def set(self, question: str, catalog_version: int, model_id: str, response: str) -> None:
+        if not self.enabled or not response or not self._current(catalog_version):
+            return
+        self._cache.set(self._key(question, catalog_version, model_id), response)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "catalog_version": self._version}
@@ -0,0 +1,402 @@
+import os
+import json
+import time
+import threading
+import weakref
+import logging
+import heapq
+import itertools
+import string
+from array import array
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Sequence, Tuple
+
+from attributes import AttributeConstraints, AttributeIndex
+from catalog_columns import ProductColumns
+
+logger = logging.getLogger("backend")
+
+DEFAULT_PRODUCTS_PATH = os.path.join(os.path.dirname(__file__), "products.json")
+
+# PRODUCTS_PATH con este esquema (o con una de estas extensiones) usa el catálogo en SQLite
+SQLITE_SCHEME = "sqlite:///"
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+
+# Campos en los que aparece un token (flags de las posting lists)
+FIELD_NAME = 1
+FIELD_CATEGORY = 2
+FIELD_DESCRIPTION = 4
+# Cada entrada de una posting list es (posición << _SCORE_BITS) | puntos del token en ese producto
+_SCORE_BITS = 6
+_SCORE_MASK = (1 << _SCORE_BITS) - 1
+
+# Pesos de relevancia de filter_relevant_products()
+SCORE_ANY_FIELD = 10
+SCORE_NAME_BONUS = 20
+SCORE_CATEGORY_BONUS = 15
+
+
+# Acentos que se eliminan al normalizar texto
+ACCENT_REPLACEMENTS = {'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u', 'ñ': 'n'}
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation + '¿¡')
+
+
+def normalize_word(word: str) -> str:
+    """Normaliza una palabra eliminando plurales y acentos para mejor matching."""
+    # Remover acentos comunes
+    for old, new in ACCENT_REPLACEMENTS.items():
+        word = word.replace(old, new)
+    
+    # Convertir plurales comunes a singular
+    if word.endswith('es') and len(word) > 3:
+        word = word[:-2]  # zapatos -> zapato, camisetas -> camiseta
+    elif word.endswith('s') and len(word) > 3:
+        word = word[:-1]  # gorras -> gorra
+    
+    return word
+
+
+def normalize_question(question: str) -> str:
+    """Forma canónica de una pregunta (minúsculas, sin signos ni acentos) para usar como clave de cache."""
+    text = question.lower().translate(PUNCTUATION_TABLE)
+    for old, new in ACCENT_REPLACEMENTS.items():
+        text = text.replace(old, new)
+    return " ".join(text.split())
+
+
+def get_available_categories(products: List[Dict[str, Any]]) -> List[str]:
+    """Extrae las categorías únicas del catálogo de productos."""
+    categories = set()
+    for p in products:
+        if 'category' in p and p['category']:
+            categories.add(p['category'])
+    return sorted(list(categories))
+
+
+def _in_name(score: int) -> bool:
+    """Los puntos de una entrada de posting list incluyen el bonus de nombre."""
+    return score - SCORE_ANY_FIELD in (SCORE_NAME_BONUS, SCORE_NAME_BONUS + SCORE_CATEGORY_BONUS)
+
+
+def _unpack(entries: Iterable[int], name_only: bool) -> Iterator[int]:
+    """Posiciones de entradas de posting lists (con `name_only`, solo las que están en el nombre)."""
+    if name_only:
+        return (entry >> _SCORE_BITS for entry in entries if _in_name(entry & _SCORE_MASK))
+    return (entry >> _SCORE_BITS for entry in entries)
+
+
+def _distinct(positions: Iterable[int]) -> Iterator[int]:
+    """Posiciones ordenadas sin las repetidas consecutivas."""
+    last = None
+    for pos in positions:
+        if pos != last:
+            yield pos
+            last = pos
+
+
+def _field_score(flags: int) -> int:
+    score = SCORE_ANY_FIELD
+    if flags & FIELD_NAME:
+        score += SCORE_NAME_BONUS
+    if flags & FIELD_CATEGORY:
+        score += SCORE_CATEGORY_BONUS
+    return score
+
+
+class CatalogIndex:
+    """Índice invertido del catálogo, construido una sola vez por snapshot.
+
+    Guarda token normalizado -> array de (posición del producto, puntos según los
+    campos en que aparece) para que puntuar por keywords sea un merge de posting
+    lists, y un mapa categoría -> posiciones para las búsquedas por intención. Las
+    búsquedas por texto también salen de las posting lists (no se guarda una copia
+    normalizada de cada nombre y descripción). Los productos quedan en columnas
+    (ProductColumns): los dicts originales se pueden liberar después de construirlo.
+    """
+
+    def __init__(self, products: Sequence[Dict[str, Any]]):
+        postings: Dict[str, Dict[int, int]] = {}
+        by_category: Dict[str, List[int]] = {}
+        # Palabra -> token: las palabras se repiten mucho entre productos y normalize_word() es lo más caro
+        normalized: Dict[str, str] = {}
+
+        for pos, p in enumerate(products):
+            name = p.get('name', '').lower()
+            category = p.get('category', '').lower()
+            description = p.get('description', '').lower()
+
+            for words, field in ((name, FIELD_NAME), (category, FIELD_CATEGORY), (description, FIELD_DESCRIPTION)):
+                for w in words.split():
+                    token = normalized.get(w)
+                    if token is None:
+                        token = normalized[w] = normalize_word(w)
+                    posting = postings.setdefault(token, {})
+                    posting[pos] = posting.get(pos, 0) | field
+
+            by_category.setdefault(category, []).append(pos)
+
+        typecode = 'I' if len(products) << _SCORE_BITS < 2 ** 32 else 'Q'
+        self.postings: Dict[str, array] = {
+            token: array(typecode, sorted(pos << _SCORE_BITS | _field_score(flags) for pos, flags in posting.items()))
+            for token, posting in postings.items()
+        }
+        # Todos los tokens en una cadena (separados por "\n") para buscar subcadenas con str.find
+        self._vocabulary = "\n" + "\n".join(self.postings) + "\n"
+        self.by_category: Dict[str, array] = {category: array('I', positions) for category, positions in by_category.items()}
+        self.attributes = AttributeIndex(products, self.by_category)
+        self.categories = get_available_categories(products)
+        self.products = products if isinstance(products, ProductColumns) else ProductColumns(products)
+        # Importado aquí: intent_rules depende de este módulo
+        from intent_rules import ProductNameIndex
+        self.product_names = ProductNameIndex(products, self.products)
+
+    def top_by_keywords(
+        self, keywords: Iterable[str], limit: int, constraints: Optional[AttributeConstraints] = None,
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Puntúa con los pesos 10/20/15 y devuelve los `limit` mejores (score, producto).
+
+        Igual que el scan lineal: cada keyword (con repeticiones) suma si aparece en
+        algún campo, con bonus por nombre y categoría; los empates respetan el orden
+        del catálogo. Con `constraints` solo compiten los productos que las cumplen.
+        """
+        scores: Dict[int, int] = {}
+        get = scores.get
+        for keyword in keywords:
+            for entry in self.postings.get(keyword, ()):
+                pos = entry >> _SCORE_BITS
+                scores[pos] = get(pos, 0) + (entry & _SCORE_MASK)
+        candidates = scores.items()
+        if constraints is not None:
+            candidates = [(pos, score) for pos, score in candidates if self.attributes.accepts(pos, constraints)]
+        best = heapq.nsmallest(limit, candidates, key=lambda item: (-item[1], item[0]))
+        return [(score, self.products[pos]) for pos, score in best]
+
+    def _positions(self, term: str, name_only: bool) -> Iterator[int]:
+        """Posiciones, ascendentes y sin repetir, donde cada palabra de `term` (normalizada) está dentro
+        de una palabra del producto.
+
+        Recorre el vocabulario, no los productos (como una búsqueda por subcadena:
+        "port" encuentra los tokens "portatil" y "deportiva") y mezcla las posting
+        lists de los tokens que la contienen, así con un límite se corta en cuanto
+        hay suficientes. Con `name_only` solo cuentan las palabras del nombre.
+        """
+        postings = [self._containing_word(word) for word in term.lower().split()]
+        if not postings:
+            return iter(())
+        first = _distinct(_unpack(heapq.merge(*postings[0]), name_only))
+        if len(postings) == 1:
+            return first
+        others = [set(_unpack(itertools.chain.from_iterable(entries), name_only)) for entries in postings[1:]]
+        return (pos for pos in first if all(pos in other for other in others))
+
+    def _containing_word(self, word: str) -> List[array]:
+        """Posting lists de los tokens que contienen la palabra normalizada."""
+        needle = normalize_word(word)
+        vocabulary = self._vocabulary
+        found = []
+        i = vocabulary.find(needle) if needle else -1
+        while i != -1:
+            start = vocabulary.rfind("\n", 0, i) + 1
+            end = vocabulary.find("\n", i)
+            found.append(self.postings[vocabulary[start:end]])
+            i = vocabulary.find(needle, end)
+        return found
+
+    def name_contains_all(self, terms: List[str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Productos con todos los términos en palabras de su nombre (como mucho `limit`, en orden del catálogo)."""
+        if not terms:
+            return list(itertools.islice(self.products, limit))
+        others = [set(self._positions(term, True)) for term in terms[1:]]
+        matches = (pos for pos in self._positions(terms[0], True) if all(pos in other for other in others))
+        return [self.products[pos] for pos in itertools.islice(matches, limit)]
+
+    def text_contains_any(
+        self, terms: List[str], limit: Optional[int] = None, constraints: Optional[AttributeConstraints] = None,
+    ) -> List[Dict[str, Any]]:
+        """Productos con alguno de los términos en su nombre, descripción o categoría (como mucho `limit`)."""
+        positions = _distinct(heapq.merge(*(self._positions(term, False) for term in terms)))
+        if constraints is not None:
+            positions = (pos for pos in positions if self.attributes.accepts(pos, constraints))
+        return [self.products[pos] for pos in itertools.islice(positions, limit)]
+
+    def in_category(self, category: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Productos cuya categoría coincide exactamente, sin distinguir mayúsculas (como mucho `limit`)."""
+        positions = self.by_category.get(category.lower(), [])
+        return [self.products[pos] for pos in positions[:limit]]
+
+    def category_size(self, category: str, constraints: Optional[AttributeConstraints] = None) -> int:
+        """Cantidad de productos de la categoría (los que cumplen `constraints`, si se pasan), sin límite."""
+        if constraints is None:
+            return len(self.by_category.get(category.lower(), ()))
+        return sum(1 for _ in self.attributes.positions(constraints, category))
+
+    def by_attributes(
+        self, constraints: AttributeConstraints, category: Optional[str] = None, limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Productos (de `category`, o de todo el catálogo) que cumplen las restricciones de precio y stock.
+
+        Con un rango de precio salen del más barato al más caro; solo con stock, en
+        el orden del catálogo.
+        """
+        positions = self.attributes.positions(constraints, category)
+        return [self.products[pos] for pos in itertools.islice(positions, limit)]
+
+
+def read_products_file(path: str) -> List[Dict[str, Any]]:
+    """Lee y parsea el archivo JSON del catálogo ({"products": [...]})."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("products", [])
+
+
+def catalog_source(path: str) -> Tuple[str, str]:
+    """("json" | "sqlite", ruta en disco) según el esquema o la extensión de PRODUCTS_PATH."""
+    if path.startswith(SQLITE_SCHEME):
+        return "sqlite", path[len(SQLITE_SCHEME):]
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return "sqlite", path
+    return "json", path
+
+
+def product_key(p: Dict[str, Any]) -> int:
+    """Identidad de un producto dentro de un snapshot, para memorizar datos derivados.
+
+    Los productos de los snapshots son vistas (ProductView del catálogo JSON,
+    ProductRow de SQLite) que se crean en cada acceso: se identifican por
+    `position`, su fila en el catálogo. Un dict suelto, sin `position`, por `id()`.
+    """
+    position = getattr(p, "position", None)
+    return id(p) if position is None else position
+
+
+def product_dict(p: Dict[str, Any]) -> Dict[str, Any]:
+    """El producto como dict simple, para serializarlo (las vistas no son dicts ni hashables)."""
+    to_dict = getattr(p, "to_dict", None)
+    return p if to_dict is None else to_dict()
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Foto inmutable del catálogo. Nunca se modifica: una recarga crea una nueva."""
+    version: int
+    products: Sequence[Dict[str, Any]]
+    # CatalogIndex o SQLiteCatalogIndex (mismas búsquedas)
+    index: Any
+    path: str
+    mtime_ns: int
+    size: int
+    loaded_at: float
+
+
+class CatalogStore:
+    """Mantiene el catálogo y lo recarga cuando cambia el archivo.
+
+    `path` es un JSON ({"products": [...]}, se carga entero con su índice en
+    memoria) o una base SQLite (`sqlite:///ruta` o extensión .db/.sqlite, creada con
+    `python -m catalog_sqlite`), que se consulta en disco con sus propios índices.
+
+    Los requests solo leen `get()`, que devuelve la referencia al snapshot actual.
+    Cada `check_interval` segundos se compara mtime/tamaño del archivo (un `stat`,
+    sin abrirlo) y, si cambió, un hilo en segundo plano lo parsea, construye el
+    índice y reemplaza el snapshot de forma atómica incrementando `version`;
+    mientras tanto los requests siguen usando el snapshot anterior. Solo la primera
+    carga bloquea. Con `check_interval <= 0` solo se recarga con `reload()`, que es
+    síncrono.
+    """
+
+    def __init__(self, path: str, check_interval: float = 2.0):
+        self.path = path
+        self.backend, self.file_path = catalog_source(path)
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        # Recarga en segundo plano en curso (como mucho una)
+        self._reloader: Optional[threading.Thread] = None
+        self._reloader_lock = threading.Lock()
+
+    def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.reload()
+        if self.check_interval > 0 and time.monotonic() - self._last_check >= self.check_interval:
+            return self._reload_if_changed()
+        return snapshot
+
+    def reload(self, force: bool = True) -> CatalogSnapshot:
+        """Recarga el catálogo desde disco. Si falla, conserva el snapshot anterior."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            try:
+                stat = os.stat(self.file_path)
+            except OSError as e:
+                logger.warning(f"[catalog] no se pudo acceder a {self.file_path}: {e}")
+                return self._keep_or_empty()
+
+            current = self._snapshot
+            if not force and current is not None and (stat.st_mtime_ns, stat.st_size) == (current.mtime_ns, current.size):
+                return current
+
+            try:
+                index = self._open_index()
+            except Exception:
+                logger.exception("Error loading products")
+                return self._keep_or_empty()
+            products = index.products
+
+            self._version += 1
+            snapshot = CatalogSnapshot(
+                version=self._version,
+                products=products,
+                index=index,
+                path=self.path,
+                mtime_ns=stat.st_mtime_ns,
+                size=stat.st_size,
+                loaded_at=time.time(),
+            )
+            close = getattr(index, "close", None)
+            if close is not None:
+                # Conexiones de la base: se cierran cuando el snapshot deja de usarse (reemplazado y sin requests)
+                weakref.finalize(snapshot, close)
+            self._snapshot = snapshot
+            logger.info(f"[catalog] catálogo v{snapshot.version} cargado: {len(products)} productos desde {self.path} ({self.backend})")
+            return snapshot
+
+    def _open_index(self):
+        if self.backend == "sqlite":
+            # Importado aquí: catalog_sqlite depende de este módulo
+            from catalog_sqlite import SQLiteCatalogIndex
+            return SQLiteCatalogIndex(self.file_path)
+        return CatalogIndex(read_products_file(self.file_path))
+
+    def _reload_if_changed(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if self._lock.locked():
+            # Ya se está recargando; no bloquear el camino caliente
+            return snapshot
+        self._last_check = time.monotonic()
+        try:
+            stat = os.stat(self.file_path)
+            changed = (stat.st_mtime_ns, stat.st_size) != (snapshot.mtime_ns, snapshot.size)
+        except OSError:
+            # reload() lo registra y conserva el snapshot
+            changed = True
+        if changed:
+            self._reload_in_background()
+        return snapshot
+
+    def _reload_in_background(self) -> None:
+        with self._reloader_lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return
+            self._reloader = threading.Thread(
+                target=self.reload, kwargs={"force": False}, name="catalog-reload", daemon=True,
+            )
+            self._reloader.start()
+
+    def _keep_or_empty(self) -> CatalogSnapshot:
+        if self._snapshot is not None:
+            return self._snapshot
+        return CatalogSnapshot(version=0, products=[], index=CatalogIndex([]), path=self.path, mtime_ns=0, size=0, loaded_at=time.time())
@@ -0,0 +1,142 @@
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+# Campos con pocos valores distintos: se guardan como códigos a una tabla de valores únicos
+CATEGORICAL_FIELDS = ("category",)
+
+# Valor de las columnas de objetos en los productos que no tienen el campo
+_MISSING = object()
+
+
+class ProductView(Mapping):
+    """Vista de solo lectura de un producto de ProductColumns, con la interfaz de un dict.
+
+    Se crea al acceder (no guarda los valores): `position` es la fila del producto y
+    lo identifica dentro del snapshot (ver catalog.product_key). Compara igual que
+    el dict original.
+    """
+    __slots__ = ("_columns", "position")
+
+    def __init__(self, columns: "ProductColumns", position: int):
+        self._columns = columns
+        self.position = position
+
+    def __getitem__(self, key: str) -> Any:
+        return self._columns.value(key, self.position)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self._columns.value(key, self.position)
+        except KeyError:
+            return default
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in self._columns.fields if self._columns.has(key, self.position))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Copia del producto como dict (para json.dumps o para guardarlo fuera del snapshot)."""
+        product = {}
+        for key in self._columns.fields:
+            try:
+                product[key] = self._columns.value(key, self.position)
+            except KeyError:
+                pass
+        return product
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+class ProductColumns(Sequence):
+    """Catálogo en columnas: una lista (o array tipado) por campo en lugar de un dict por producto.
+
+    Los campos con todos sus valores enteros van a un array('q') y los numéricos
+    mezclados (precios) a un array('d'), así que se leen como float; las categorías
+    se guardan como códigos a una tabla de valores únicos y el resto de campos como
+    listas de objetos. Indexar devuelve un ProductView; los productos sin un campo
+    no lo tienen en la vista, igual que en el dict original.
+    """
+
+    def __init__(self, products: Iterable[Dict[str, Any]]):
+        raw: Dict[str, List[Any]] = {}
+        count = 0
+        for count, p in enumerate(products, start=1):
+            for key, value in p.items():
+                values = raw.get(key)
+                if values is None:
+                    values = raw[key] = [_MISSING] * (count - 1)
+                values.append(value)
+            for key, values in raw.items():
+                if len(values) < count:
+                    values.append(_MISSING)
+
+        self.count = count
+        self.fields: List[str] = list(raw)
+        self._columns: Dict[str, Any] = {}
+        # Campo -> filas sin el campo (solo columnas tipadas; las de objetos guardan _MISSING)
+        self._missing: Dict[str, Set[int]] = {}
+        # Campo categórico -> valores únicos (los códigos de la columna son posiciones aquí)
+        self._tables: Dict[str, List[Any]] = {}
+        for key in self.fields:
+            self._columns[key] = self._build_column(key, raw.pop(key))
+
+    def _build_column(self, key: str, values: List[Any]):
+        present = [v for v in values if v is not _MISSING]
+        typecode = None
+        if all(type(v) is int for v in present):
+            typecode = "q"
+        elif all(type(v) in (int, float) for v in present):
+            typecode = "d"
+        if typecode is not None:
+            missing = {pos for pos, v in enumerate(values) if v is _MISSING}
+            try:
+                column = array(typecode, (0 if v is _MISSING else v for v in values))
+            except OverflowError:
+                return values
+            if missing:
+                self._missing[key] = missing
+            return column
+        if key in CATEGORICAL_FIELDS and all(type(v) is str or v is _MISSING for v in values):
+            codes: Dict[Any, int] = {}
+            column = array("I", (codes.setdefault(v, len(codes)) for v in values))
+            self._tables[key] = list(codes)
+            return column
+        return values
+
+    def value(self, key: str, position: int) -> Any:
+        column = self._columns[key]
+        value = column[position]
+        table = self._tables.get(key)
+        if table is not None:
+            value = table[value]
+        elif key in self._missing and position in self._missing[key]:
+            raise KeyError(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def has(self, key: str, position: int) -> bool:
+        try:
+            self.value(key, position)
+        except KeyError:
+            return False
+        return True
+
+    def column(self, key: str) -> Optional[Any]:
+        """Columna cruda de `key` (array o lista; códigos si es categórica), o None si no existe."""
+        return self._columns.get(key)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [ProductView(self, pos) for pos in range(self.count)[key]]
+        return ProductView(self, range(self.count)[key])
+
+    def __iter__(self) -> Iterator[ProductView]:
+        return (ProductView(self, pos) for pos in range(self.count))
@@ -0,0 +1,404 @@
+"""Catálogo en una base SQLite: búsquedas con FTS5 sin cargar los productos en memoria.
+
+Importar un catálogo JSON (desde backend/):
+    python -m catalog_sqlite products.json catalog.db
+
+y arrancar con PRODUCTS_PATH=sqlite:///catalog.db (o cualquier ruta .db/.sqlite).
+"""
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from attributes import AttributeConstraints
+from intent_rules import NameMatch, product_name_tokens
+from catalog import (
+    SCORE_ANY_FIELD, SCORE_NAME_BONUS, SCORE_CATEGORY_BONUS,
+    get_available_categories, normalize_word, product_dict, read_products_file,
+)
+
+
+SCHEMA_VERSION = 3
+
+# Filas leídas por consulta al recorrer el catálogo completo
+_ITER_BATCH = 1000
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY,
+    category_key TEXT NOT NULL,
+    name_normalized TEXT NOT NULL,
+    text_normalized TEXT NOT NULL,
+    price REAL,
+    stock INTEGER,
+    name_tokens INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX products_by_category ON products (category_key, id);
+CREATE INDEX products_by_price ON products (price);
+CREATE INDEX products_by_category_price ON products (category_key, price);
+CREATE VIRTUAL TABLE products_terms USING fts5 (
+    name, category, description, content='', detail='column'
+);
+CREATE VIRTUAL TABLE products_names USING fts5 (tokens, content='', detail='none');
+CREATE VIRTUAL TABLE products_text USING fts5 (
+    name_normalized, text_normalized, content='products', content_rowid='id',
+    tokenize='trigram case_sensitive 1'
+);
+"""
+
+
+def encode_token(token: str) -> str:
+    """Token normalizado -> término de FTS5.
+
+    Los tokens del índice en memoria son las palabras separadas por espacios
+    (pueden llevar signos); en hexadecimal el tokenizer de FTS5 los toma enteros y
+    el matching es exactamente el mismo.
+    """
+    return token.encode("utf-8").hex()
+
+
+def _field_tokens(text: str) -> str:
+    return " ".join(encode_token(normalize_word(w)) for w in text.split())
+
+
+def _glob_contains(needle: str) -> str:
+    """Patrón GLOB de "contiene `needle`" (los comodines del texto se escapan como clases)."""
+    escaped = "".join(f"[{ch}]" if ch in "*?[" else ch for ch in needle)
+    return f"*{escaped}*"
+
+
+def _numeric(value: Any) -> Optional[float]:
+    # Precio/stock no numérico (o ausente) -> NULL: no cumple ninguna restricción
+    return value if type(value) in (int, float) else None
+
+
+def _attribute_sql(constraints: AttributeConstraints, table: str = "products") -> Tuple[str, List[Any]]:
+    """Condición SQL de las restricciones de precio y stock sobre `table` (los NULL no cumplen)."""
+    clauses, params = [], []
+    if constraints.in_stock:
+        clauses.append(f"{table}.stock > 0")
+    if constraints.min_price is not None:
+        clauses.append(f"{table}.price {'>=' if constraints.min_inclusive else '>'} ?")
+        params.append(constraints.min_price)
+    if constraints.max_price is not None:
+        clauses.append(f"{table}.price {'<=' if constraints.max_inclusive else '<'} ?")
+        params.append(constraints.max_price)
+    return " AND ".join(clauses) or "1", params
+
+
+class ProductRow(dict):
+    """Producto leído de la base; `position` es su fila (estable dentro de un snapshot)."""
+    __slots__ = ("position",)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self)
+
+
+def import_products(products: Iterable[Dict[str, Any]], db_path: str) -> int:
+    """Crea la base del catálogo en `db_path` y devuelve la cantidad de productos.
+
+    Se escribe en un archivo temporal junto al destino y se reemplaza con una
+    operación atómica: el servidor nunca ve una base a medio importar, y el cambio
+    de mtime hace que CatalogStore la recargue.
+    """
+    directory = os.path.dirname(os.path.abspath(db_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".catalog-", suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;" + _SCHEMA)
+            categories = set()
+            # Primera palabra de los nombres -> categorías (ProductNameIndex.heads)
+            heads: Dict[str, set] = {}
+            count = 0
+            for count, p in enumerate(products, start=1):
+                name = p.get('name', '').lower()
+                category = p.get('category', '').lower()
+                description = p.get('description', '').lower()
+                if p.get('category'):
+                    categories.add(p['category'])
+                name_tokens = product_name_tokens(name)
+                if name_tokens:
+                    heads.setdefault(name_tokens[0], set()).add(p.get('category'))
+                conn.execute(
+                    "INSERT INTO products (id, category_key, name_normalized, text_normalized, price, stock, "
+                    "name_tokens, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (count, category, normalize_word(name), normalize_word(f"{name} {description} {category}"),
+                     _numeric(p.get('price')), _numeric(p.get('stock')), len(name_tokens),
+                     json.dumps(product_dict(p), ensure_ascii=False)),
+                )
+                conn.execute(
+                    "INSERT INTO products_terms (rowid, name, category, description) VALUES (?, ?, ?, ?)",
+                    (count, _field_tokens(name), _field_tokens(category), _field_tokens(description)),
+                )
+                conn.execute(
+                    "INSERT INTO products_names (rowid, tokens) VALUES (?, ?)",
+                    (count, " ".join(encode_token(t) for t in name_tokens)),
+                )
+            conn.execute("INSERT INTO products_text (products_text) VALUES ('rebuild')")
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ("schema_version", str(SCHEMA_VERSION)),
+                ("count", str(count)),
+                ("categories", json.dumps(get_available_categories([{"category": c} for c in categories]), ensure_ascii=False)),
+                ("name_heads", json.dumps({head: sorted(cats, key=str) for head, cats in heads.items()}, ensure_ascii=False)),
+            ])
+            conn.commit()
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        os.replace(tmp_path, db_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return count
+
+
+class SQLiteProducts(Sequence):
+    """Lista de solo lectura de los productos de la base, en el orden del catálogo.
+
+    Soporta lo que usa el backend sobre `catalog.products` (len, slices e iteración)
+    leyendo solo las filas pedidas.
+    """
+
+    def __init__(self, index: "SQLiteCatalogIndex", count: int):
+        self._index = index
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            positions = range(self._count)[key]
+            if positions.step == 1:
+                return self._index.fetch_range(positions.start + 1, len(positions))
+            return self._index.fetch([pos + 1 for pos in positions])
+        pos = range(self._count)[key]
+        return self._index.fetch([pos + 1])[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for start in range(1, self._count + 1, _ITER_BATCH):
+            yield from self._index.fetch_range(start, _ITER_BATCH)
+
+
+class SQLiteProductNames:
+    """Búsqueda de productos por los tokens de su nombre (como ProductNameIndex), con el índice FTS5 de nombres.
+
+    Cada token de la pregunta es una consulta a `products_names`; la base cuenta
+    cuántos coinciden por producto y devuelve los dos mejores (para saber si hay
+    empate), sin recorrer los productos en Python.
+    """
+
+    def __init__(self, index: "SQLiteCatalogIndex", heads: Dict[str, List[str]]):
+        self._index = index
+        self.heads = heads
+
+    def best_match(self, tokens: Set[str]) -> Optional[NameMatch]:
+        if not tokens:
+            return None
+        selects = " UNION ALL ".join(["SELECT rowid FROM products_names WHERE products_names MATCH ?"] * len(tokens))
+        sql = (f"WITH hits AS ({selects}) "
+               "SELECT hits.rowid, COUNT(*) AS overlap, products.name_tokens FROM hits "
+               "JOIN products ON products.id = hits.rowid GROUP BY hits.rowid "
+               "HAVING overlap >= 2 OR overlap = products.name_tokens ORDER BY overlap DESC, hits.rowid LIMIT 2")
+        best = self._index._conn().execute(sql, [f'"{encode_token(t)}"' for t in tokens]).fetchall()
+        if not best:
+            return None
+        rowid, overlap, length = best[0]
+        tied = len(best) > 1 and best[1][1] == overlap
+        return NameMatch(self._index.fetch([rowid])[0], overlap, length, tied)
+
+
+def _close_connections(connections: List[sqlite3.Connection], lock: threading.Lock) -> None:
+    with lock:
+        for conn in connections:
+            conn.close()
+        connections.clear()
+
+
+class SQLiteCatalogIndex:
+    """Mismas búsquedas que CatalogIndex, resueltas con consultas a la base.
+
+    La puntuación por keywords usa el índice FTS5 de tokens (nombre, categoría y
+    descripción), las búsquedas por subcadena el índice de trigramas, las del
+    clasificador por nombre de producto el índice FTS5 de nombres y las de
+    categoría y precio índices B-tree; en memoria solo quedan las categorías, las
+    primeras palabras de los nombres y el total de productos.
+
+    La base se abre en solo lectura, con una conexión por hilo. Las conexiones se
+    registran para que `close()` las cierre todas (CatalogStore lo llama cuando el
+    snapshot que usa este índice deja de estar en uso); después de cerrarlo, un
+    hilo que siga consultando abre una conexión nueva.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._uri = Path(path).resolve().as_uri() + "?mode=ro"
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+        # También al liberar el índice sin close()
+        self._finalizer = weakref.finalize(self, _close_connections, self._connections, self._connections_lock)
+        meta = dict(self._conn().execute("SELECT key, value FROM meta"))
+        if meta.get("schema_version") != str(SCHEMA_VERSION):
+            self.close()
+            raise ValueError(f"{path}: versión de esquema {meta.get('schema_version')!r}, se esperaba {SCHEMA_VERSION} "
+                             f"(volver a importar con python -m catalog_sqlite)")
+        self.categories: List[str] = json.loads(meta["categories"])
+        self.products = SQLiteProducts(self, int(meta["count"]))
+        self.product_names = SQLiteProductNames(self, json.loads(meta["name_heads"]))
+
+    def _conn(self) -> sqlite3.Connection:
+        conn, generation = getattr(self._local, "conn", (None, None))
+        if conn is None or generation != self._generation:
+            # check_same_thread=False: close() las cierra desde el hilo que reemplaza el catálogo
+            conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            with self._connections_lock:
+                self._connections.append(conn)
+                generation = self._generation
+            self._local.conn = (conn, generation)
+        return conn
+
+    def close(self) -> None:
+        """Cierra las conexiones abiertas por todos los hilos."""
+        with self._connections_lock:
+            self._generation += 1
+        _close_connections(self._connections, self._connections_lock)
+
+    @staticmethod
+    def _rows(rows: Iterable[Tuple[int, str]]) -> Dict[int, ProductRow]:
+        products = {}
+        for rowid, data in rows:
+            p = ProductRow(json.loads(data))
+            p.position = rowid
+            products[rowid] = p
+        return products
+
+    def fetch(self, rowids: List[int]) -> List[Dict[str, Any]]:
+        """Productos de las filas `rowids`, en ese orden."""
+        if not rowids:
+            return []
+        by_id: Dict[int, ProductRow] = {}
+        conn = self._conn()
+        # Lotes por debajo del límite de parámetros de SQLite
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            by_id.update(self._rows(conn.execute(f"SELECT id, data FROM products WHERE id IN ({placeholders})", chunk)))
+        return [by_id[rowid] for rowid in rowids]
+
+    def fetch_range(self, first: int, count: int) -> List[Dict[str, Any]]:
+        """`count` productos a partir de la fila `first` (en orden del catálogo)."""
+        if count <= 0:
+            return []
+        rows = self._conn().execute("SELECT id, data FROM products WHERE id >= ? ORDER BY id LIMIT ?", (first, count))
+        return list(self._rows(rows).values())
+
+    def top_by_keywords(
+        self, keywords: Iterable[str], limit: int, constraints: Optional[AttributeConstraints] = None,
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Puntúa con los pesos 10/20/15 y devuelve los `limit` mejores (score, producto)."""
+        counts: Dict[str, int] = {}
+        for keyword in keywords:
+            counts[keyword] = counts.get(keyword, 0) + 1
+        if not counts or limit <= 0:
+            return []
+        selects, params = [], []
+        for keyword, repeat in counts.items():
+            term = f'"{encode_token(keyword)}"'
+            for query, score in ((term, SCORE_ANY_FIELD), (f"name : {term}", SCORE_NAME_BONUS),
+                                 (f"category : {term}", SCORE_CATEGORY_BONUS)):
+                selects.append("SELECT rowid, ? AS score FROM products_terms WHERE products_terms MATCH ?")
+                params += [score * repeat, query]
+        where, where_params = "", []
+        if constraints is not None:
+            condition, where_params = _attribute_sql(constraints)
+            where = f"JOIN products ON products.id = hits.rowid WHERE {condition} "
+        sql = (f"WITH hits AS ({' UNION ALL '.join(selects)}) "
+               f"SELECT hits.rowid, SUM(score) AS total FROM hits {where}"
+               "GROUP BY hits.rowid ORDER BY total DESC, hits.rowid LIMIT ?")
+        best = self._conn().execute(sql, params + where_params + [limit]).fetchall()
+        products = self.fetch([rowid for rowid, _ in best])
+        return [(score, p) for (_, score), p in zip(best, products)]
+
+    def name_contains_all(self, terms: List[str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Productos cuyo nombre normalizado contiene todos los términos."""
+        needles = [normalize_word(term) for term in terms]
+        where = " AND ".join(["name_normalized GLOB ?"] * len(needles)) or "1"
+        return self._search(f"SELECT rowid FROM products_text WHERE {where} ORDER BY rowid",
+                            [_glob_contains(n) for n in needles], limit)
+
+    def text_contains_any(
+        self, terms: List[str], limit: Optional[int] = None, constraints: Optional[AttributeConstraints] = None,
+    ) -> List[Dict[str, Any]]:
+        """Productos cuyo nombre, descripción o categoría contiene alguno de los términos."""
+        sql, extra = "SELECT rowid FROM products_text WHERE text_normalized GLOB ? ORDER BY rowid", []
+        if constraints is not None:
+            condition, extra = _attribute_sql(constraints)
+            sql = ("SELECT products_text.rowid FROM products_text JOIN products ON products.id = products_text.rowid "
+                   f"WHERE products_text.text_normalized GLOB ? AND {condition} ORDER BY products_text.rowid")
+        # Una consulta por término, cada una cortada en `limit` (en orden de fila): las
+        # primeras `limit` filas de la unión están entre esas
+        rowids = set()
+        for term in terms:
+            rowids.update(self._rowids(sql, [_glob_contains(normalize_word(term))] + extra, limit))
+        return self.fetch(sorted(rowids)[:limit])
+
+    def in_category(self, category: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Productos cuya categoría coincide exactamente (sin distinguir mayúsculas)."""
+        return self._search("SELECT id FROM products WHERE category_key = ? ORDER BY id", [category.lower()], limit)
+
+    def category_size(self, category: str, constraints: Optional[AttributeConstraints] = None) -> int:
+        """Cantidad de productos de la categoría (los que cumplen `constraints`, si se pasan), sin límite."""
+        condition, params = _attribute_sql(constraints) if constraints is not None else ("1", [])
+        sql = f"SELECT COUNT(*) FROM products WHERE {condition} AND category_key = ?"
+        return self._conn().execute(sql, params + [category.lower()]).fetchone()[0]
+
+    def by_attributes(
+        self, constraints: AttributeConstraints, category: Optional[str] = None, limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Productos (de `category`, o de todo el catálogo) que cumplen las restricciones de precio y stock.
+
+        Mismo orden que CatalogIndex.by_attributes: por precio ascendente si hay
+        rango, si no en el orden del catálogo.
+        """
+        condition, params = _attribute_sql(constraints)
+        if category is not None:
+            condition += " AND category_key = ?"
+            params.append(category.lower())
+        order = "price, id" if constraints.has_price else "id"
+        return self._search(f"SELECT id FROM products WHERE {condition} ORDER BY {order}", params, limit)
+
+    def _rowids(self, sql: str, params: List[Any], limit: Optional[int]) -> List[int]:
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = params + [limit]
+        return [rowid for (rowid,) in self._conn().execute(sql, params)]
+
+    def _search(self, sql: str, params: List[Any], limit: Optional[int]) -> List[Dict[str, Any]]:
+        return self.fetch(self._rowids(sql, params, limit))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Importa un catálogo JSON ({\"products\": [...]}) a una base SQLite.")
+    parser.add_argument("json_path")
+    parser.add_argument("db_path")
+    args = parser.parse_args(argv)
+    count = import_products(read_products_file(args.json_path), args.db_path)
+    print(f"{count} productos importados en {args.db_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
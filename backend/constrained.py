@@ -0,0 +1,194 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# (pieza, texto ya reconocido de la pieza, términos completos, largo del término actual, subestado de la lista)
+GrammarState = Tuple[int, str, int, int, str]
+
+_HEAD, _TERMS, _TAIL, _DONE = range(4)
+
+# Caracter de reemplazo que produce decode() con un carácter UTF-8 a medio generar
+_PARTIAL = "�"
+
+
+class IntentGrammar:
+    """Gramática del JSON de intención, con el formato de los ejemplos del prompt.
+
+        {"tipo": "<tipo>", "terminos": ["...", "..."], "categoria": null | "<categoría>"}
+
+    `tipo` y `categoria` solo pueden tomar los valores conocidos; la lista de
+    términos se acota a `max_terms` cadenas de hasta `max_term_chars` caracteres
+    (sin comillas, barras ni saltos de línea, así el resultado siempre es JSON
+    válido). El texto se valida carácter a carácter con `advance()`.
+    """
+
+    def __init__(
+        self,
+        tipos: Sequence[str],
+        categorias: Sequence[str],
+        default_tipo: str = "general",
+        max_terms: int = 6,
+        max_term_chars: int = 30,
+    ):
+        # La continuación forzada usa la primera opción compatible: la de por defecto va primero
+        ordered = [default_tipo] + [t for t in tipos if t != default_tipo]
+        self.heads = [f'{{"tipo": "{t}", "terminos": [' for t in ordered]
+        self.tails = [', "categoria": null}'] + [f', "categoria": "{c}"}}' for c in categorias]
+        self.max_terms = max_terms
+        self.max_term_chars = max_term_chars
+        self.initial: GrammarState = (_HEAD, "", 0, 0, "")
+        # Identifica la gramática por su contenido (dos gramáticas iguales aceptan lo mismo)
+        self.key = (tuple(self.heads), tuple(self.tails), max_terms, max_term_chars)
+
+    def advance(self, state: Optional[GrammarState], text: str) -> Optional[GrammarState]:
+        """Estado después de consumir `text`, o None si deja de ser un prefijo válido."""
+        for ch in text:
+            if state is None:
+                return None
+            state = self._step(state, ch)
+        return state
+
+    def is_complete(self, state: Optional[GrammarState]) -> bool:
+        return state is not None and state[0] == _DONE
+
+    def _step(self, state: GrammarState, ch: str) -> Optional[GrammarState]:
+        piece, matched, terms, term_len, sub = state
+        if piece in (_HEAD, _TAIL):
+            options = self.heads if piece == _HEAD else self.tails
+            candidate = matched + ch
+            if candidate in options:
+                return (_TERMS, "", 0, 0, "open") if piece == _HEAD else (_DONE, "", terms, 0, "")
+            if any(option.startswith(candidate) for option in options):
+                return (piece, candidate, terms, term_len, sub)
+            return None
+        if piece == _TERMS:
+            if sub in ("open", "item"):
+                if ch == '"' and terms < self.max_terms:
+                    return (_TERMS, "", terms, 0, "in")
+                if ch == "]" and sub == "open":
+                    return (_TAIL, "", terms, 0, "")
+                return None
+            if sub == "in":
+                if ch == '"':
+                    return (_TERMS, "", terms + 1, 0, "after")
+                if ch in '\\\n\r\t' or term_len >= self.max_term_chars:
+                    return None
+                return (_TERMS, "", terms, term_len + 1, "in")
+            if sub == "after":
+                if ch == "," and terms < self.max_terms:
+                    return (_TERMS, "", terms, 0, "comma")
+                if ch == "]":
+                    return (_TAIL, "", terms, 0, "")
+                return None
+            if sub == "comma":
+                return (_TERMS, "", terms, 0, "item") if ch == " " else None
+        return None
+
+    def completion(self, state: GrammarState) -> str:
+        """Texto mínimo que continúa `state` de forma válida (para forzarlo si el modelo no lo propone)."""
+        piece, matched, _, _, sub = state
+        if piece in (_HEAD, _TAIL):
+            options = self.heads if piece == _HEAD else self.tails
+            option = next(o for o in options if o.startswith(matched))
+            return option[len(matched):]
+        if piece == _TERMS:
+            return {"open": "]", "after": "]", "item": '"', "in": '"', "comma": " "}[sub]
+        return ""
+
+
+# Tokenizers registrados, para reconstruir los processors en los workers (cada proceso registra el suyo)
+_tokenizers: Dict[Hashable, Any] = {}
+
+
+def tokenizer_key(tokenizer) -> Hashable:
+    """Identifica al tokenizer entre procesos: por el modelo del que sale (`name_or_path`) o, sin él, por id()."""
+    return getattr(tokenizer, "name_or_path", None) or id(tokenizer)
+
+
+def register_tokenizer(tokenizer) -> Hashable:
+    """Registra el tokenizer para que los processors se puedan enviar a otros procesos."""
+    key = tokenizer_key(tokenizer)
+    _tokenizers[key] = tokenizer
+    return key
+
+
+def _restore_processor(key: Hashable, grammar: IntentGrammar, top_k: int) -> "IntentGrammarProcessor":
+    return IntentGrammarProcessor(_tokenizers[key], grammar, top_k=top_k)
+
+
+class IntentGrammarProcessor:
+    """Logits processor de generate(): decodificación greedy restringida a la gramática.
+
+    En cada paso prueba los `top_k` tokens más probables en orden y deja solo el
+    primero que mantiene el texto dentro de la gramática; si ninguno sirve, fuerza
+    el primer token de la continuación mínima. Cuando el JSON se cierra fuerza EOS,
+    así la generación termina en la llave de cierre sin gastar tokens de más.
+    """
+
+    def __init__(self, tokenizer, grammar: IntentGrammar, top_k: int = 20):
+        self.tokenizer = tokenizer
+        self.grammar = grammar
+        self.top_k = top_k
+        self.forced_tokens = 0
+        self._prompt_length: Optional[int] = None
+        self.tokenizer_key = register_tokenizer(tokenizer)
+
+    def __reduce__(self):
+        return _restore_processor, (self.tokenizer_key, self.grammar, self.top_k)
+
+    @property
+    def batch_key(self) -> Tuple[Hashable, tuple, int]:
+        """Configuración del processor: generaciones con la misma clave se pueden agrupar en un batch.
+
+        Cada fila se decide solo con sus propios tokens, así que un processor nuevo
+        sirve para todas las filas de un generate.
+        """
+        return (self.tokenizer_key, self.grammar.key, self.top_k)
+
+    def _decode(self, ids: List[int]) -> str:
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+    def _delta(self, generated: List[int], base: str, token: int) -> Optional[str]:
+        text = self._decode(generated + [token])
+        if not text.startswith(base):
+            return None
+        new_text = text[len(base):]
+        if not new_text:
+            # Tokens que no agregan texto (especiales): no hacen avanzar la gramática
+            return None
+        # Un carácter a medio generar se acepta: se valida cuando se completa
+        return new_text.rstrip(_PARTIAL)
+
+    def _choose(self, generated: List[int], row_scores) -> int:
+        eos = self.tokenizer.eos_token_id
+        base = self._decode(generated).rstrip(_PARTIAL)
+        state = self.grammar.advance(self.grammar.initial, base)
+        if state is None or self.grammar.is_complete(state):
+            return eos
+
+        for token in row_scores.topk(min(self.top_k, row_scores.shape[-1])).indices.tolist():
+            if token == eos:
+                continue
+            delta = self._delta(generated, base, token)
+            if delta is None:
+                continue
+            # delta vacío: byte parcial de un carácter multibyte
+            if delta == "" or self.grammar.advance(state, delta) is not None:
+                return token
+
+        self.forced_tokens += 1
+        forced = self.grammar.completion(state)
+        token = self.tokenizer.encode(forced, add_special_tokens=False)[0]
+        delta = self._delta(generated, base, token)
+        if delta and self.grammar.advance(state, delta) is not None:
+            return token
+        # La tokenización junta la continuación con otro texto: forzar un carácter
+        return self.tokenizer.encode(forced[0], add_special_tokens=False)[0]
+
+    def __call__(self, input_ids, scores):
+        if self._prompt_length is None:
+            # La primera llamada es antes del primer token generado
+            self._prompt_length = input_ids.shape[1]
+        for row in range(input_ids.shape[0]):
+            token = self._choose(input_ids[row, self._prompt_length:].tolist(), scores[row])
+            scores[row].fill_(float("-inf"))
+            scores[row, token] = 0.0
+        return scores
@@ -0,0 +1,261 @@
+import logging
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple
+
+from catalog import CatalogSnapshot, product_key
+from cache import TTLCache
+
+logger = logging.getLogger("backend")
+
+# Aproximación sin tokenizer: ~4 caracteres por token en español
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_product_line(p: Dict[str, Any]) -> str:
+    """Una línea compacta por producto: nombre | categoría | precio | stock | descripción."""
+    parts = [
+        str(p.get('name', '')),
+        str(p.get('category', 'N/A')),
+        f"${float(p.get('price', 0) or 0):.2f}",
+        f"stock {p.get('stock', 0)}",
+    ]
+    if p.get('description'):
+        parts.append(str(p['description']))
+    return "- " + " | ".join(parts)
+
+
+class CatalogContextBuilder:
+    """Fragmento de catálogo para los prompts remotos, limitado en productos y en tokens.
+
+    Las líneas de cada producto y los fragmentos ya armados se memorizan con la
+    versión del catálogo en la clave. La versión solo avanza: con un catálogo nuevo
+    se descartan las entradas anteriores, y un request que todavía usa un snapshot
+    anterior arma su fragmento sin memorizar nada ni vaciar la cache.
+    """
+
+    def __init__(self, token_budget: int = 1500, cache_size: int = 256, line_cache_size: int = 50000):
+        self.token_budget = token_budget
+        self._version: Optional[int] = None
+        self._lines = TTLCache(maxsize=line_cache_size, ttl=None)
+        self._fragments = TTLCache(maxsize=cache_size, ttl=None)
+        self._lock = threading.Lock()
+
+    def _current(self, catalog: CatalogSnapshot) -> bool:
+        """Avanza a la versión de `catalog` si es nueva; False si es anterior a la última vista."""
+        if catalog.version == self._version:
+            return True
+        with self._lock:
+            if self._version is not None and catalog.version < self._version:
+                return False
+            if catalog.version != self._version:
+                self._lines.clear()
+                self._fragments.clear()
+                self._version = catalog.version
+        return True
+
+    def _line(self, p: Dict[str, Any], version: Optional[int]) -> tuple:
+        key = (version, product_key(p))
+        entry = self._lines.get(key) if version is not None else None
+        if entry is None:
+            line = format_product_line(p)
+            entry = (line, estimate_tokens(line) + 1)
+            if version is not None:
+                self._lines.set(key, entry)
+        return entry
+
+    def fragment(self, catalog: CatalogSnapshot, products: List[Dict[str, Any]]) -> str:
+        """Líneas de `products` (en orden de relevancia) hasta agotar el presupuesto de tokens."""
+        version = catalog.version if self._current(catalog) else None
+        key = (version, tuple(product_key(p) for p in products))
+        cached = self._fragments.get(key) if version is not None else None
+        if cached is not None:
+            return cached
+
+        header = "Categorías: " + ", ".join(catalog.index.categories)
+        lines = [header]
+        used = estimate_tokens(header)
+        for p in products:
+            line, tokens = self._line(p, version)
+            # Siempre al menos un producto, aunque supere el presupuesto
+            if self.token_budget > 0 and used + tokens > self.token_budget and len(lines) > 1:
+                break
+            lines.append(line)
+            used += tokens
+
+        text = "\n".join(lines)
+        if version is not None:
+            self._fragments.set(key, text)
+        return text
+
+
+def product_prompt_line(p: Dict[str, Any], detailed: bool) -> str:
+    """Línea de un producto en los prompts locales: nombre y precio, o con todos los datos."""
+    if detailed:
+        return (
+            f"{p['name']}: ${p['price']:.2f}, "
+            f"Categoría: {p.get('category', 'N/A')}, "
+            f"Stock: {p.get('stock', 0)} unidades, "
+            f"Descripción: {p.get('description', 'N/A')}"
+        )
+    return f"{p['name']}: ${p['price']:.2f}"
+
+
+@dataclass
+class AssembledPrompt:
+    """Prompt de respuesta armado por PromptAssembler."""
+    text: str
+    # Ids del prompt completo (None sin tokenizer)
+    input_ids: Optional[List[int]]
+    tokens: int
+    # Tokens del prefijo fijo al inicio de `input_ids` (para la KV-cache de prefijos)
+    prefix_tokens: int
+    # Productos que entraron en el presupuesto (los primeros de la lista recibida)
+    products: int
+
+
+# Tokens de cada lado de una unión que se vuelven a tokenizar juntos para comprobarla
+_JOIN_WINDOW = 3
+
+
+class PromptAssembler:
+    """Arma los prompts de respuesta locales dentro de un presupuesto de tokens.
+
+    Las líneas de cada producto (básica y detallada) se formatean y tokenizan una
+    sola vez por versión del catálogo (la versión es parte de la clave y solo
+    avanza, como en ResponseCache), y los prefijos fijos una sola vez; en cada
+    request solo se tokenizan el encabezado y el final del prompt (con la pregunta),
+    y los ids se obtienen concatenando. Los productos entran en orden mientras
+    quepan en `token_budget` (siempre al menos uno).
+
+    Concatenar ids da lo mismo que tokenizar el texto entero solo si ningún token
+    cruza la unión entre dos partes. Se comprueba en cada prompt y en cada unión:
+    los últimos y primeros `_JOIN_WINDOW` tokens de las dos partes se decodifican
+    juntos y se vuelven a tokenizar; si no dan los mismos ids, el prompt se
+    tokeniza entero. El resultado se memoriza por tokens de borde, así que en
+    régimen cuesta una búsqueda por unión. Los tokenizers sin `decode()` no se
+    pueden comprobar así y siempre tokenizan el prompt entero.
+    """
+
+    def __init__(self, tokenizer=None, token_budget: int = 1024, cache_size: int = 50000):
+        self.tokenizer = tokenizer
+        self.token_budget = token_budget
+        self._checks_joins = hasattr(tokenizer, "decode")
+        self._version: Optional[int] = None
+        self._lines = TTLCache(maxsize=cache_size, ttl=None)
+        self._joins = TTLCache(maxsize=cache_size, ttl=None)
+        self._prefixes: Dict[str, array] = {}
+        self._lock = threading.Lock()
+
+    def _current(self, catalog: CatalogSnapshot) -> bool:
+        """Avanza a la versión de `catalog` si es nueva; False si es anterior a la última vista."""
+        if catalog.version == self._version:
+            return True
+        with self._lock:
+            if self._version is not None and catalog.version < self._version:
+                return False
+            if catalog.version != self._version:
+                self._lines.clear()
+                self._version = catalog.version
+        return True
+
+    def encode(self, text: str) -> Optional[array]:
+        if self.tokenizer is None:
+            return None
+        return array('I', self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _encoded(self, text: str) -> Tuple[Optional[array], int]:
+        ids = self.encode(text)
+        return ids, len(ids) if ids is not None else estimate_tokens(text)
+
+    def _prefix(self, prefix: str) -> Tuple[Optional[array], int]:
+        ids = self._prefixes.get(prefix)
+        if ids is None and self.tokenizer is not None:
+            ids = self._prefixes.setdefault(prefix, self.encode(prefix))
+        return ids, len(ids) if ids is not None else estimate_tokens(prefix)
+
+    def line(
+        self, p: Dict[str, Any], detailed: bool, version: Optional[int] = None,
+    ) -> Tuple[str, Optional[array], int, Optional[array]]:
+        """(texto, ids, tokens, ids sin el salto) de la línea del producto.
+
+        `ids` y `tokens` incluyen el salto de línea que la separa de la siguiente;
+        los ids sin el salto son para la última línea, que va pegada al final del prompt.
+        Se memoriza bajo la versión del catálogo `version` (None: no se memoriza).
+        """
+        key = (version, product_key(p), detailed)
+        entry = self._lines.get(key) if version is not None else None
+        if entry is None:
+            text = product_prompt_line(p, detailed)
+            entry = (text, *self._encoded(text + "\n"), self.encode(text))
+            if version is not None:
+                self._lines.set(key, entry)
+        return entry
+
+    def _joins_cleanly(self, left: array, right: array) -> bool:
+        """Tokenizar juntos los tokens de borde de `left` y `right` da los mismos ids (o alguna parte está vacía)."""
+        if not left or not right:
+            return True
+        window = left[-_JOIN_WINDOW:] + right[:_JOIN_WINDOW]
+        key = tuple(window)
+        clean = self._joins.get(key)
+        if clean is None:
+            text = self.tokenizer.decode(window.tolist(), skip_special_tokens=False, clean_up_tokenization_spaces=False)
+            clean = self.encode(text) == window
+            self._joins.set(key, clean)
+        return clean
+
+    def _concatenate(self, parts: List[array]) -> Optional[array]:
+        """Las partes concatenadas si todas las uniones son limpias, si no None."""
+        if not self._checks_joins:
+            return None
+        ids = array('I')
+        for part in parts:
+            if not self._joins_cleanly(ids, part):
+                return None
+            ids += part
+        return ids
+
+    def assemble(
+        self, catalog: CatalogSnapshot, prefix: str, header: str,
+        products: List[Dict[str, Any]], detailed: bool, tail: str,
+    ) -> AssembledPrompt:
+        """`prefix` + `header` + una línea por producto (separadas por "\n") + `tail`."""
+        # Un request que todavía usa un snapshot anterior arma su prompt sin memorizar líneas
+        version = catalog.version if self._current(catalog) else None
+        prefix_ids, prefix_tokens = self._prefix(prefix)
+        header_ids, header_tokens = self._encoded(header)
+        tail_ids, tail_tokens = self._encoded(tail)
+        used = prefix_tokens + header_tokens + tail_tokens
+        lines = []
+        for p in products:
+            line = self.line(p, detailed, version)
+            if self.token_budget > 0 and lines and used + line[2] > self.token_budget:
+                break
+            lines.append(line)
+            used += line[2]
+        if len(lines) < len(products):
+            logger.info(f"[prompt] {len(lines)} de {len(products)} productos en el presupuesto de {self.token_budget} tokens")
+
+        # La última línea va sin salto, pegada al final del prompt
+        last = lines[-1][0] if lines else ""
+        text = prefix + header + "".join(line[0] + "\n" for line in lines[:-1]) + last + tail
+        if self.tokenizer is None:
+            return AssembledPrompt(text, None, estimate_tokens(text), prefix_tokens, len(lines))
+
+        parts = [prefix_ids, header_ids] + [line[1] for line in lines[:-1]]
+        if lines and not (self._checks_joins and self._joins_cleanly(lines[-1][3], tail_ids)):
+            # El final se une con la última línea ("." + "\n\n" en un token): se tokenizan juntos
+            parts.append(self.encode(last + tail))
+        else:
+            parts += [lines[-1][3], tail_ids] if lines else [tail_ids]
+        input_ids = self._concatenate(parts)
+        if input_ids is None:
+            logger.debug("[prompt] un token cruza la unión de dos partes: se tokeniza el prompt completo")
+            input_ids = self.encode(text)
+        return AssembledPrompt(text, input_ids.tolist(), len(input_ids), prefix_tokens, len(lines))
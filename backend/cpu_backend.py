@@ -0,0 +1,71 @@
+import os
+import time
+import logging
+
+import torch
+
+logger = logging.getLogger("backend")
+
+
+def quantized_cache_path(cache_dir: str, model_id: str) -> str:
+    """Pesos del modelo cuantizado: dependen del modelo y de las versiones de torch y transformers."""
+    import transformers
+    name = model_id.replace("/", "--")
+    return os.path.join(cache_dir, f"{name}-int8-torch{torch.__version__}-transformers{transformers.__version__}.state.pt")
+
+
+def _quantize(model):
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_quantized(model_cls, model_id: str, path: str):
+    """Arquitectura del modelo (desde su config, sin los pesos fp32) ya cuantizada, con los pesos de `path`."""
+    from transformers import AutoConfig, GenerationConfig
+    model = _quantize(model_cls.from_config(AutoConfig.from_pretrained(model_id)).eval())
+    # weights_only: solo tensores y tipos básicos, el archivo no puede ejecutar código al cargarse
+    model.load_state_dict(torch.load(path, map_location="cpu", weights_only=True))
+    try:
+        # from_config no lee generation_config.json (tokens de fin, penalizaciones del modelo)
+        model.generation_config = GenerationConfig.from_pretrained(model_id)
+    except OSError:
+        pass
+    return model
+
+
+def load_dynamic_int8(model_cls, model_id: str, cache_dir: str):
+    """Modelo con las capas lineales en int8 dinámico (kernels de CPU de torch).
+
+    Los pesos de las nn.Linear se guardan en int8 y las activaciones se cuantizan
+    al vuelo en cada forward. La primera vez se convierte desde los pesos fp32 y
+    se guarda el state_dict cuantizado en `cache_dir`; los siguientes arranques
+    crean el modelo desde la config, lo cuantizan y le cargan esos pesos con
+    `weights_only=True` (nunca se deserializa un módulo completo).
+    """
+    path = quantized_cache_path(cache_dir, model_id)
+    if os.path.exists(path):
+        start = time.perf_counter()
+        try:
+            model = _load_quantized(model_cls, model_id, path)
+        except Exception as e:
+            logger.warning(f"[cpu-int8] no se pudo leer {path}, se vuelve a cuantizar: {e}")
+        else:
+            logger.info(f"[cpu-int8] modelo cuantizado cargado de {path} en {time.perf_counter() - start:.1f} s")
+            return model.eval()
+
+    start = time.perf_counter()
+    model = model_cls.from_pretrained(model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True).eval()
+    model = _quantize(model)
+    logger.info(f"[cpu-int8] {model_id} cuantizado a int8 dinámico en {time.perf_counter() - start:.1f} s")
+    # Escritura atómica: otro proceso nunca lee un archivo a medias
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        torch.save(model.state_dict(), tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"[cpu-int8] guardado en {path}")
+    except Exception as e:
+        logger.warning(f"[cpu-int8] no se pudo guardar el modelo cuantizado en {cache_dir}: {e}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return model
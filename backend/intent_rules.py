@@ -0,0 +1,227 @@
+import threading
+import itertools
+from array import array
+from collections import Counter
+from typing import List, Dict, Any, Iterable, NamedTuple, Optional, Tuple, Set, Sequence
+
+from attributes import extract_constraints
+from catalog import CatalogSnapshot, PUNCTUATION_TABLE, normalize_word
+
+# Vocabulario de cada categoría (también se usa en el prompt de clasificación del modelo)
+CATEGORY_LEXICON = {
+    "ropa": ["camisetas", "pantalones", "vestidos", "sudaderas", "blusas", "faldas", "camperas"],
+    "calzado": ["zapatillas", "zapatos", "botines", "sandalias", "botas", "tenis", "mocasines"],
+    "electrónica": ["laptops", "tablets", "relojes inteligentes", "auriculares", "monitores", "mouse", "bocinas", "cámaras"],
+    "accesorios": ["mochilas", "gafas", "gorras", "cinturones", "riñoneras", "bufandas", "carteras", "sombreros"],
+}
+
+# Tipos de intención que devuelven el clasificador por reglas y el modelo
+INTENT_TYPES = ("categorias_disponibles", "categoria", "producto_especifico", "general", "fuera_catalogo")
+
+_STOP_WORDS = {
+    'que', 'qué', 'cual', 'cuál', 'cuales', 'cuáles', 'tiene', 'tienes', 'tienen', 'hay', 'vende', 'vendes',
+    'venden', 'me', 'mi', 'puedes', 'puede', 'mostrar', 'muestra', 'muestrame', 'muéstrame', 'ver', 'busco',
+    'buscar', 'quiero', 'quisiera', 'necesito', 'un', 'una', 'unos', 'unas', 'el', 'la', 'los', 'las', 'lo',
+    'de', 'del', 'para', 'con', 'por', 'en', 'y', 'o', 'a', 'al', 'sobre', 'dame', 'dime', 'informacion',
+    'información', 'info', 'detalles', 'detalle', 'precio', 'cuanto', 'cuánto', 'cuesta', 'es', 'son',
+    'algun', 'algún', 'alguna', 'tu', 'tus', 'su', 'sus', 'si', 'sí', 'mas', 'más', 'este', 'esta', 'ese',
+    'esa', 'disponible', 'disponibles', 'stock', 'tenéis', 'podrias', 'podrías', 'enseñame', 'enséñame',
+}
+_GREETINGS = {'hola', 'buenas', 'buenos', 'dias', 'días', 'tardes', 'noches', 'gracias', 'adios', 'adiós',
+              'hey', 'saludos', 'chao', 'ok', 'vale'}
+_CATALOG_WORDS = {'producto', 'productos', 'catalogo', 'catálogo', 'todo', 'todos', 'articulos', 'artículos',
+                  'ofrecen', 'ofertas', 'tienda'}
+_CATEGORY_WORDS = {'categoria', 'categorías', 'categorias', 'categoría', 'secciones', 'seccion', 'sección'}
+
+
+def _normalized_set(words) -> Set[str]:
+    return {normalize_word(w) for w in words}
+
+
+STOP_TOKENS = _normalized_set(_STOP_WORDS)
+GREETING_TOKENS = _normalized_set(_GREETINGS)
+CATALOG_TOKENS = _normalized_set(_CATALOG_WORDS)
+CATEGORY_TOKENS = _normalized_set(_CATEGORY_WORDS)
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin signos, y cada palabra normalizada con normalize_word()."""
+    return [normalize_word(w) for w in text.lower().translate(PUNCTUATION_TABLE).split()]
+
+
+def product_name_tokens(name: str) -> List[str]:
+    """Tokens del nombre de un producto sin stop words, sin repetir y en orden."""
+    return list(dict.fromkeys(t for t in tokenize(name) if t not in STOP_TOKENS))
+
+
+class NameMatch(NamedTuple):
+    """Producto cuyo nombre comparte más tokens con la pregunta."""
+    product: Dict[str, Any]
+    # Tokens del nombre que aparecen en la pregunta y tokens del nombre en total
+    overlap: int
+    length: int
+    # Otro producto comparte la misma cantidad de tokens
+    tied: bool
+
+
+def best_name_match(candidates: Iterable[Tuple[int, int, int]]) -> Optional[Tuple[int, int, int, bool]]:
+    """(posición, overlap, largo, empate) del mejor de los candidatos (posición, overlap, largo).
+
+    Cuenta un producto si coinciden al menos dos tokens de su nombre o el nombre
+    entero; gana el de mayor overlap y, a igualdad, el primero del catálogo.
+    """
+    best: Optional[Tuple[int, int, int]] = None
+    tied = False
+    for pos, overlap, length in candidates:
+        if overlap < 2 and overlap != length:
+            continue
+        if best is None or overlap > best[1] or (overlap == best[1] and pos < best[0]):
+            tied = best is not None and overlap == best[1]
+            best = (pos, overlap, length)
+        elif overlap == best[1]:
+            tied = True
+    return None if best is None else (*best, tied)
+
+
+class ProductNameIndex:
+    """Tokens de los nombres de producto -> posiciones, para el clasificador por reglas.
+
+    Se construye una vez con el índice del catálogo (al cargarlo), así clasificar
+    solo recorre las posting lists de los tokens de la pregunta. `heads` guarda las
+    categorías de cada primera palabra de nombre ("zapatilla" -> calzado).
+    """
+
+    def __init__(self, products: Sequence[Dict[str, Any]], views: Optional[Sequence[Dict[str, Any]]] = None):
+        # `views`: los mismos productos como se devuelven en las búsquedas (ProductColumns)
+        postings: Dict[str, List[int]] = {}
+        self.heads: Dict[str, Set[str]] = {}
+        self.products = products if views is None else views
+        self.lengths = array('H')
+        # Palabra -> token (las palabras de los nombres se repiten mucho entre productos)
+        normalized: Dict[str, str] = {}
+        for pos, p in enumerate(products):
+            words = p.get('name', '').lower().translate(PUNCTUATION_TABLE).split()
+            tokens = [normalized.get(w) or normalized.setdefault(w, normalize_word(w)) for w in words]
+            tokens = list(dict.fromkeys(t for t in tokens if t not in STOP_TOKENS))
+            self.lengths.append(min(len(tokens), 0xFFFF))
+            for token in tokens:
+                postings.setdefault(token, []).append(pos)
+            if tokens:
+                self.heads.setdefault(tokens[0], set()).add(p.get('category'))
+        self.postings: Dict[str, array] = {token: array('I', positions) for token, positions in postings.items()}
+
+    def best_match(self, tokens: Set[str]) -> Optional[NameMatch]:
+        counts = Counter(itertools.chain.from_iterable(self.postings.get(t, ()) for t in tokens))
+        lengths = self.lengths
+        best = best_name_match((pos, overlap, lengths[pos]) for pos, overlap in counts.items())
+        if best is None:
+            return None
+        pos, overlap, length, tied = best
+        return NameMatch(self.products[pos], overlap, length, tied)
+
+
+class RuleBasedClassifier:
+    """Clasificador determinista de intenciones construido a partir del catálogo.
+
+    Devuelve la misma estructura que el modelo ({"tipo", "terminos", "categoria"})
+    junto con una confianza entre 0 y 1; por debajo del umbral configurado la
+    pregunta se deriva al modelo.
+    """
+
+    def __init__(self, catalog: CatalogSnapshot):
+        self.version = catalog.version
+        self.categories = catalog.index.categories
+        category_by_key = {normalize_word(c.lower()): c for c in self.categories}
+
+        # token -> categorías en las que aparece (nombre de categoría, vocabulario, nombres de producto)
+        self.category_terms: Dict[str, Set[str]] = {}
+        for key, category in category_by_key.items():
+            self.category_terms.setdefault(key, set()).add(category)
+        for category, words in CATEGORY_LEXICON.items():
+            if category not in self.categories:
+                continue
+            for token in tokenize(" ".join(words)):
+                self.category_terms.setdefault(token, set()).add(category)
+
+        # Nombres de producto: índice construido al cargar el catálogo (en memoria o en SQLite)
+        self.product_names = catalog.index.product_names
+        for head, categories in self.product_names.heads.items():
+            # La primera palabra del nombre es el tipo de producto ("Zapatillas Deportivas",
+            # "Mochila para Portátil"); el resto son modificadores que aparecen en varias categorías
+            if len(head) > 2 and not head.isdigit():
+                self.category_terms.setdefault(head, set()).update(categories)
+
+    def classify(self, question: str) -> Tuple[Dict[str, Any], float]:
+        # Precio y stock ("de menos de 100", "en stock") no son palabras de producto
+        constraints, question = extract_constraints(question)
+        tokens = tokenize(question)
+        token_set = set(tokens)
+        content = [t for t in tokens if t not in STOP_TOKENS and t not in GREETING_TOKENS]
+
+        categories_hit: Dict[str, List[str]] = {}
+        for t in content:
+            for category in self.category_terms.get(t, ()):
+                categories_hit.setdefault(category, []).append(t)
+
+        # 1. "¿Qué categorías tienes?"
+        if token_set & CATEGORY_TOKENS and not categories_hit:
+            return {"tipo": "categorias_disponibles", "terminos": [], "categoria": None}, 0.95
+
+        # 2. Producto concreto: todas (o casi todas) las palabras de su nombre están en la pregunta
+        product_intent = self._match_product(token_set - STOP_TOKENS)
+        if product_intent is not None:
+            return product_intent
+
+        # 3. Una sola categoría mencionada (por nombre, vocabulario o nombres de sus productos)
+        if len(categories_hit) == 1:
+            category, terms = next(iter(categories_hit.items()))
+            return {"tipo": "categoria", "terminos": list(dict.fromkeys(terms)), "categoria": category}, 0.85
+        if len(categories_hit) > 1:
+            category, terms = max(categories_hit.items(), key=lambda item: len(item[1]))
+            return {"tipo": "categoria", "terminos": list(dict.fromkeys(terms)), "categoria": category}, 0.4
+
+        # 4. Preguntas sobre el catálogo en general (o solo por precio/stock: "¿qué hay en stock?")
+        if token_set & CATALOG_TOKENS or (constraints is not None and not content):
+            return {"tipo": "general", "terminos": [], "categoria": None}, 0.85
+
+        # 5. Saludos y mensajes sin relación con productos
+        if token_set & GREETING_TOKENS and not content:
+            return {"tipo": "fuera_catalogo", "terminos": [], "categoria": None}, 0.85
+
+        return {"tipo": "general", "terminos": content, "categoria": None}, 0.2
+
+    def _match_product(self, token_set: Set[str]):
+        match = self.product_names.best_match(token_set)
+        if match is None:
+            return None
+        # Términos: las palabras del nombre que aparecen en la pregunta, en el orden del nombre
+        terms = [t for t in product_name_tokens(match.product.get('name', '')) if t in token_set]
+        if match.tied:
+            confidence = 0.5
+        elif match.overlap == match.length:
+            confidence = 0.9 if match.length > 1 else 0.75
+        else:
+            confidence = 0.8
+        return {"tipo": "producto_especifico", "terminos": terms, "categoria": match.product.get('category')}, confidence
+
+
+class ClassificationStats:
+    """Cuenta cómo se resolvió cada clasificación: reglas, cache o modelo."""
+
+    SOURCES = ("reglas", "cache", "modelo")
+
+    def __init__(self):
+        self.counts = {source: 0 for source in self.SOURCES}
+        self._lock = threading.Lock()
+
+    def record(self, source: str) -> None:
+        with self._lock:
+            self.counts[source] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def share_without_model(self) -> float:
+        total = self.total
+        return (total - self.counts["modelo"]) / total if total else 0.0
@@ -0,0 +1,108 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Fases de una respuesta, en el orden en que ocurren
+PHASES = ("catalog", "classify", "retrieve", "prompt", "generate", "postprocess")
+
+# Tiempos (segundos) por fase del request en curso; None si nadie los está recolectando
+_current_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("current_phases", default=None)
+
+_observers: List[Callable[[str, float], None]] = []
+_observers_lock = threading.Lock()
+
+
+def add_phase_observer(observer: Callable[[str, float], None]) -> None:
+    """Registra `observer(fase, segundos)`, llamado cada vez que termina una fase."""
+    with _observers_lock:
+        _observers.append(observer)
+
+
+def record_phase(name: str, seconds: float) -> None:
+    phases = _current_phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+    for observer in _observers:
+        observer(name, seconds)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Mide el bloque como la fase `name` (se acumula si la fase se repite en el request)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_phases() -> Iterator[Dict[str, float]]:
+    """Recolecta los tiempos por fase de lo que se ejecute dentro del bloque.
+
+    El diccionario se comparte con el contexto actual, así que también recibe las
+    fases medidas en el threadpool (run_in_threadpool copia el contexto).
+    """
+    phases: Dict[str, float] = {}
+    token = _current_phases.set(phases)
+    try:
+        yield phases
+    finally:
+        _current_phases.reset(token)
+
+
+# --- Métricas Prometheus (expuestas en /metrics) ---
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+_TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+PHASE_SECONDS = Histogram(
+    "chat_phase_seconds", "Duración de cada fase de una respuesta", ["phase"], buckets=_LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "chat_request_seconds", "Duración total de los requests de chat", ["endpoint", "backend"], buckets=_LATENCY_BUCKETS,
+)
+REQUESTS = Counter("chat_requests_total", "Requests de chat atendidos", ["endpoint", "backend", "status"])
+PROMPT_TOKENS = Histogram("llm_prompt_tokens", "Tokens del prompt por generación", ["backend"], buckets=_TOKEN_BUCKETS)
+GENERATED_TOKENS = Histogram("llm_generated_tokens", "Tokens generados por generación", ["backend"], buckets=_TOKEN_BUCKETS)
+TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second", "Velocidad de generación (tokens generados / segundo)", ["backend"],
+    buckets=(1, 2, 5, 10, 20, 40, 80, 160, 320, 640, 1280),
+)
+LOCAL_ANSWERS = Counter(
+    "chat_local_answers_total",
+    "Respuestas locales por resultado: model (respuesta del modelo), rejected (descartada, fallback), "
+    "error (el modelo falló, fallback) o direct (sin generar)",
+    ["outcome"],
+)
+INTENT_CLASSIFICATIONS = Counter("chat_intent_classifications_total", "Clasificaciones por origen", ["source"])
+LOCAL_ACTIVE_GENERATIONS = Gauge("local_inference_active", "Generaciones del modelo local en curso")
+LOCAL_QUEUE_DEPTH = Gauge("local_inference_queue_depth", "Requests esperando un lugar para generar con el modelo local")
+LOCAL_QUEUE_WAIT_SECONDS = Histogram(
+    "local_inference_queue_wait_seconds", "Espera en la cola del modelo local hasta poder generar", buckets=_LATENCY_BUCKETS,
+)
+LOCAL_REJECTIONS = Counter(
+    "local_inference_rejected_total",
+    "Requests rechazados por saturación del modelo local: queue_full (429) o timeout (503)",
+    ["reason"],
+)
+
+add_phase_observer(lambda name, seconds: PHASE_SECONDS.labels(name).observe(seconds))
+
+
+def record_generation(backend: str, prompt_tokens: Optional[int], generated_tokens: int, seconds: float) -> None:
+    """Tokens y velocidad de una generación (`prompt_tokens` None si no se conoce)."""
+    if prompt_tokens is not None:
+        PROMPT_TOKENS.labels(backend).observe(prompt_tokens)
+    GENERATED_TOKENS.labels(backend).observe(generated_tokens)
+    if seconds > 0 and generated_tokens > 0:
+        TOKENS_PER_SECOND.labels(backend).observe(generated_tokens / seconds)
+
+
+def render_metrics() -> tuple:
+    """(contenido, content-type) en el formato de texto de Prometheus."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,66 @@
+import copy
+import logging
+from typing import Any, Dict, List, Union
+
+import torch
+
+logger = logging.getLogger("backend")
+
+
+class PrefixKVCache:
+    """Past-key-values precalculados para un prefijo de prompt que no cambia.
+
+    El prefijo (system prompt, ejemplos) se pasa una sola vez por el modelo al
+    crear la cache. En cada `generate()` solo se codifica el sufijo variable (la
+    pregunta) y el modelo continúa desde una copia de la cache del prefijo.
+    """
+
+    def __init__(self, model, tokenizer, prefix: str):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.prefix_ids = tokenizer(prefix, return_tensors="pt", add_special_tokens=False).input_ids.to(model.device)
+        with torch.no_grad():
+            self.past_key_values = model(self.prefix_ids, use_cache=True).past_key_values
+        logger.info(f"[prefix-cache] prefijo de {self.prefix_ids.shape[1]} tokens precalculado")
+
+    @property
+    def prefix_tokens(self) -> int:
+        return self.prefix_ids.shape[1]
+
+    def encode_suffix(self, suffix: str) -> torch.Tensor:
+        return self.tokenizer(suffix, return_tensors="pt", add_special_tokens=False).input_ids.to(self.model.device)
+
+    def generate(self, suffix: str, **generate_kwargs: Any) -> str:
+        """Genera a partir de prefijo + `suffix` y devuelve solo el texto nuevo."""
+        return self.generate_from_ids(self.encode_suffix(suffix), **generate_kwargs)
+
+    def generate_from_ids(self, suffix_ids: Union[torch.Tensor, List[int]], **generate_kwargs: Any) -> str:
+        """Como generate(), con el sufijo ya tokenizado (tensor (1, n) o lista de ids)."""
+        if not isinstance(suffix_ids, torch.Tensor):
+            suffix_ids = torch.tensor([suffix_ids], dtype=self.prefix_ids.dtype, device=self.model.device)
+        input_ids = torch.cat([self.prefix_ids, suffix_ids], dim=-1)
+        # generate() extiende la cache: cada llamada trabaja sobre su propia copia
+        past_key_values = copy.deepcopy(self.past_key_values)
+        with torch.no_grad():
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                **generate_kwargs,
+            )
+        return self.tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+
+
+def generation_kwargs_for_cache(defaults: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Parámetros para model.generate() equivalentes a los del pipeline.
+
+    Combina los valores por defecto del pipeline con los de la llamada. El beam
+    search no se usa con una cache precargada (num_beams=1), y max_length se
+    ignora cuando la llamada define max_new_tokens.
+    """
+    kwargs = {**defaults, **overrides}
+    if "max_new_tokens" in kwargs:
+        kwargs.pop("max_length", None)
+    kwargs["num_beams"] = 1
+    return kwargs
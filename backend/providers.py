@@ -0,0 +1,336 @@
+import re
+import time
+import logging
+import itertools
+from typing import List, Dict, Any, Optional, Callable, Iterator, AsyncIterator, Union
+
+import httpx
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+
+from admission import AdmissionRejected
+from catalog import CatalogSnapshot
+from context import estimate_tokens
+from metrics import phase, record_phase, record_generation
+from streaming import StreamCleaner, sse_event, parse_openai_stream_line
+
+logger = logging.getLogger("backend")
+uvicorn_logger = logging.getLogger("uvicorn.error")
+
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", flags=re.DOTALL)
+
+# Eventos SSE (token/done/error) de una respuesta en streaming
+SSEEvents = Union[Iterator[str], AsyncIterator[str]]
+
+
+class ChatProvider:
+    """Backend que genera las respuestas del chat.
+
+    `answer()` devuelve la respuesta completa y `stream()` los eventos SSE de la
+    respuesta en streaming; en los dos, `on_done(respuesta)` se llama al terminar
+    con una respuesta que se puede guardar en cache (no con la de respaldo si el
+    modelo falló). Los errores antes de empezar a responder se lanzan
+    como HTTPException.
+    """
+
+    name = "base"
+
+    def model_id(self) -> str:
+        """Identifica al modelo que responde (forma parte de la clave de la cache de respuestas)."""
+        raise NotImplementedError
+
+    async def answer(self, question: str, catalog: CatalogSnapshot, on_done=None) -> str:
+        raise NotImplementedError
+
+    async def stream(self, question: str, catalog: CatalogSnapshot, on_done=None) -> SSEEvents:
+        raise NotImplementedError
+
+
+class LocalTransformersProvider(ChatProvider):
+    """Modelo local de transformers, en el threadpool (la generación es CPU/GPU bloqueante).
+
+    `generate(pregunta, catálogo, on_done)` y `stream(pregunta, catálogo, on_done)` son las
+    funciones del pipeline local; transformers y torch solo se importan al cargar
+    el modelo, no al crear el proveedor. Las llamadas al modelo ocupan un lugar de la
+    cola de inferencia (InferenceGate.model_slot); si está saturada se responde
+    429/503 con Retry-After.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        hf_model_id: str,
+        generate: Callable[..., str],
+        stream: Callable[..., Iterator[str]],
+    ):
+        self.hf_model_id = hf_model_id
+        self._generate = generate
+        self._stream = stream
+
+    def model_id(self) -> str:
+        return f"local:{self.hf_model_id}"
+
+    @staticmethod
+    def rejected(e: AdmissionRejected) -> HTTPException:
+        return HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+    async def answer(self, question: str, catalog: CatalogSnapshot, on_done=None) -> str:
+        logger.info("[chat] usando modelo LOCAL con transformers")
+        try:
+            return await run_in_threadpool(self._generate, question, catalog, on_done)
+        except AdmissionRejected as e:
+            raise self.rejected(e)
+        except Exception as e:
+            logger.error(f"[chat] error generando respuesta: {e}")
+            raise HTTPException(status_code=500, detail=f"Error generando respuesta: {str(e)}")
+
+    async def stream(self, question: str, catalog: CatalogSnapshot, on_done=None) -> SSEEvents:
+        logger.info("[chat] usando modelo LOCAL con transformers (streaming)")
+        # Generador síncrono: StreamingResponse lo itera en el threadpool. Pedir el primer
+        # evento aquí para que un rechazo de la cola de inferencia sea un 429/503
+        events = self._stream(question, catalog, on_done=on_done)
+        try:
+            first = await run_in_threadpool(next, events, None)
+        except AdmissionRejected as e:
+            raise self.rejected(e)
+        if first is None:
+            return iter(())
+        return itertools.chain([first], events)
+
+
+async def stream_text_events(
+    chunks: AsyncIterator[str], on_close=None, on_done=None, backend: str = "openai",
+    generate_start: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Convierte fragmentos de texto remotos en eventos SSE limpios (sin <think>).
+
+    `on_done(respuesta)` se llama con la respuesta completa si el stream terminó bien.
+    La fase "generate" se registra una sola vez, desde `generate_start` (el envío de la
+    petición) hasta el último fragmento.
+    """
+    cleaner = StreamCleaner()
+    emitted = []
+    if generate_start is None:
+        generate_start = time.perf_counter()
+    try:
+        async for chunk in chunks:
+            text = cleaner.feed(chunk)
+            if text:
+                emitted.append(text)
+                yield sse_event("token", {"text": text})
+        tail = cleaner.flush()
+        if tail:
+            emitted.append(tail)
+            yield sse_event("token", {"text": tail})
+        generate_seconds = time.perf_counter() - generate_start
+        response = "".join(emitted).strip()
+        record_generation(backend, None, estimate_tokens(response), generate_seconds)
+        logger.info("[chat] streamed response (%d chars)", len(response))
+        yield sse_event("done", {"response": response, "replaced": False})
+        if on_done is not None:
+            on_done(response)
+    except Exception as e:
+        logger.exception("[chat] streaming failure: %r", e)
+        yield sse_event("error", {"detail": str(e)})
+    finally:
+        record_phase("generate", time.perf_counter() - generate_start)
+        if on_close is not None:
+            await on_close()
+
+
+class OpenAICompatibleProvider(ChatProvider):
+    """API /chat/completions (OpenAI, router de Hugging Face, vLLM, etc.) con el cliente HTTP compartido."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: str,
+        api_base: str,
+        model: str,
+        get_client: Callable[[], httpx.AsyncClient],
+        build_messages: Callable[[str, CatalogSnapshot], List[Dict[str, Any]]],
+    ):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        self._get_client = get_client
+        self._build_messages = build_messages
+
+    def model_id(self) -> str:
+        return f"openai:{self.api_base}:{self.model}"
+
+    @property
+    def url(self) -> str:
+        return self.api_base.rstrip('/') + "/chat/completions"
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def request_body(self, messages: List[Dict[str, Any]], stream: bool = False) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": 400,
+            "temperature": 0.7,
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    @staticmethod
+    def error(resp: httpx.Response) -> HTTPException:
+        logger.error("[chat] OpenAI-compatible error %s: %s", resp.status_code, resp.text)
+        # Manejo especial para error 402 (sin créditos)
+        if resp.status_code == 402:
+            return HTTPException(
+                status_code=402,
+                detail="Has excedido tus créditos mensuales en Hugging Face. Por favor cambia HF_MODEL_ID a un modelo gratuito como 'mistralai/Mistral-7B-Instruct-v0.2' o suscríbete a HF Pro."
+            )
+        return HTTPException(status_code=resp.status_code, detail=resp.text)
+
+    async def answer(self, question: str, catalog: CatalogSnapshot, on_done=None) -> str:
+        # La búsqueda en el catálogo (reglas, índices, embeddings, SQLite) es bloqueante
+        messages = await run_in_threadpool(self._build_messages, question, catalog)
+        try:
+            logger.info("[chat] using OpenAI-compatible provider: %s | model=%s", self.api_base, self.model)
+            uvicorn_logger.info("[chat] using OpenAI-compatible provider: %s | model=%s", self.api_base, self.model)
+            generate_start = time.perf_counter()
+            with phase("generate"):
+                resp = await self._get_client().post(self.url, headers=self.headers, json=self.request_body(messages))
+            generate_seconds = time.perf_counter() - generate_start
+            if resp.status_code != 200:
+                raise self.error(resp)
+            with phase("postprocess"):
+                data = resp.json()
+                text = data.get("choices", [{}])[0].get("message", {}).get("content")
+                if not text:
+                    text = str(data)
+                # Strip <think>...</think>
+                cleaned = _THINK_BLOCK.sub("", text).strip()
+            usage = data.get("usage") or {}
+            record_generation(
+                "openai",
+                usage.get("prompt_tokens"),
+                usage.get("completion_tokens") or estimate_tokens(text),
+                generate_seconds,
+            )
+            logger.info("[chat] sending response (%d chars)", len(cleaned))
+            uvicorn_logger.info("[chat] sending response (%d chars)", len(cleaned))
+            if on_done is not None:
+                on_done(cleaned)
+            return cleaned
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("[chat] OpenAI-compatible failure: %r", e)
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def stream(self, question: str, catalog: CatalogSnapshot, on_done=None) -> SSEEvents:
+        logger.info("[chat] streaming from OpenAI-compatible provider: %s | model=%s", self.api_base, self.model)
+        messages = await run_in_threadpool(self._build_messages, question, catalog)
+        client = self._get_client()
+        request = client.build_request(
+            "POST", self.url, headers=self.headers, json=self.request_body(messages, stream=True),
+        )
+        generate_start = time.perf_counter()
+        try:
+            resp = await client.send(request, stream=True)
+        except Exception as e:
+            record_phase("generate", time.perf_counter() - generate_start)
+            logger.exception("[chat] OpenAI-compatible failure: %r", e)
+            raise HTTPException(status_code=500, detail=str(e))
+        if resp.status_code != 200:
+            await resp.aread()
+            await resp.aclose()
+            record_phase("generate", time.perf_counter() - generate_start)
+            raise self.error(resp)
+        return stream_text_events(self._deltas(resp), on_close=resp.aclose, on_done=on_done,
+                                  generate_start=generate_start)
+
+    @staticmethod
+    async def _deltas(resp: httpx.Response) -> AsyncIterator[str]:
+        async for line in resp.aiter_lines():
+            text = parse_openai_stream_line(line)
+            if text:
+                yield text
+
+
+class HFInferenceProvider(ChatProvider):
+    """text_generation de la Inference API de Hugging Face (cliente síncrono, en el threadpool)."""
+
+    name = "hf"
+
+    def __init__(self, hf_model_id: str, get_client: Callable[[], Any], build_prompt: Callable[[str, CatalogSnapshot], str]):
+        self.hf_model_id = hf_model_id
+        self._get_client = get_client
+        self._build_prompt = build_prompt
+
+    def model_id(self) -> str:
+        return f"hf:{self.hf_model_id}"
+
+    def generation_kwargs(self) -> Dict[str, Any]:
+        return dict(
+            model=self.hf_model_id,
+            max_new_tokens=400,
+            temperature=0.7,
+            return_full_text=False,
+            do_sample=True,
+            top_p=0.95,
+            repetition_penalty=1.1,
+            stop_sequences=["</s>", "[/INST]"],
+        )
+
+    @staticmethod
+    def error_detail(e: Exception) -> str:
+        detail = str(e)
+        if "410" in detail or "403" in detail:
+            detail = (
+                "El modelo configurado no está disponible o está restringido. "
+                "Prueba cambiando HF_MODEL_ID a un modelo público o utiliza un proveedor OpenAI-compatible."
+            )
+        return detail
+
+    async def answer(self, question: str, catalog: CatalogSnapshot, on_done=None) -> str:
+        try:
+            client = self._get_client()
+            prompt = await run_in_threadpool(self._build_prompt, question, catalog)
+            logger.info("[chat] invoking HF text_generation ...")
+            uvicorn_logger.info("[chat] invoking HF text_generation ...")
+            generate_start = time.perf_counter()
+            with phase("generate"):
+                tg = await run_in_threadpool(client.text_generation, prompt, **self.generation_kwargs())
+            text = tg if isinstance(tg, str) else getattr(tg, "generated_text", str(tg))
+            record_generation("hf", estimate_tokens(prompt), estimate_tokens(text), time.perf_counter() - generate_start)
+            logger.info("[chat] HF text_generation received")
+            uvicorn_logger.info("[chat] HF text_generation received")
+            with phase("postprocess"):
+                cleaned = _THINK_BLOCK.sub("", text).strip()
+            logger.info("[chat] sending response (%d chars)", len(cleaned))
+            uvicorn_logger.info("[chat] sending response (%d chars)", len(cleaned))
+            if on_done is not None:
+                on_done(cleaned)
+            return cleaned
+        except Exception as e1:
+            logger.exception("[chat] HF failure: %r", e1)
+            raise HTTPException(status_code=500, detail=self.error_detail(e1))
+
+    async def stream(self, question: str, catalog: CatalogSnapshot, on_done=None) -> SSEEvents:
+        generate_start = None
+        try:
+            client = self._get_client()
+            logger.info("[chat] invoking HF text_generation (stream) ...")
+            prompt = await run_in_threadpool(self._build_prompt, question, catalog)
+            generate_start = time.perf_counter()
+            tokens = await run_in_threadpool(client.text_generation, prompt, stream=True, **self.generation_kwargs())
+            # Pedir el primer token aquí para que los errores del proveedor sean errores HTTP
+            first = await run_in_threadpool(next, tokens, "")
+        except Exception as e1:
+            if generate_start is not None:
+                record_phase("generate", time.perf_counter() - generate_start)
+            logger.exception("[chat] HF failure: %r", e1)
+            raise HTTPException(status_code=500, detail=self.error_detail(e1))
+        return stream_text_events(iterate_in_threadpool(itertools.chain([first], tokens)), on_done=on_done,
+                                  backend="hf", generate_start=generate_start)
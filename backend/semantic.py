@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import CatalogSnapshot, product_key
+
+logger = logging.getLogger("backend")
+
+# Textos -> matriz (n, d) float32 con filas de norma 1
+Encoder = Callable[[List[str]], np.ndarray]
+
+
+def product_text(p: Dict[str, Any]) -> str:
+    """Texto de un producto que se convierte en embedding."""
+    return f"{p.get('name', '')}. {p.get('category', '')}. {p.get('description', '')}"
+
+
+def text_digest(text: str) -> int:
+    """Huella de 64 bits del texto: si no cambia, el embedding guardado sigue valiendo."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def load_sentence_encoder(model_id: str, batch_size: int = 64) -> Encoder:
+    """Encoder de sentence-transformers en CPU (embeddings normalizados)."""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_id, device="cpu")
+
+    def encode(texts: List[str]) -> np.ndarray:
+        vectors = model.encode(texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    return encode
+
+
+class ProductEmbeddings:
+    """Embeddings de una versión del catálogo: fila i = producto en la posición i."""
+
+    def __init__(self, version: int, vectors: np.ndarray, digests: np.ndarray):
+        self.version = version
+        self.vectors = vectors
+        self.digests = digests
+
+    def top_k(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """(posición, similitud coseno) de los `k` productos más cercanos, de mayor a menor."""
+        n = len(self.vectors)
+        if n == 0 or k <= 0:
+            return []
+        scores = self.vectors @ query
+        if k < n:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(n)
+        # Empates en el orden del catálogo, igual que el filtro por keywords
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(int(pos), float(scores[pos])) for pos in order]
+
+
+class EmbeddingStore:
+    """Embeddings de los productos en disco (.npy memory-mapped) para la búsqueda semántica.
+
+    En `directory` se guardan la matriz de embeddings, la huella del texto de cada
+    producto y el modelo con el que se calcularon. Con una versión nueva del
+    catálogo se reconstruyen en segundo plano: las filas cuyo texto no cambió se
+    copian de la matriz anterior y solo se calculan las de productos nuevos o
+    modificados; si el catálogo no cambió respecto a lo que hay en disco, la matriz
+    se abre tal cual. Mientras tanto `get()` devuelve None y el backend busca solo
+    por keywords.
+    """
+
+    def __init__(self, directory: str, model_id: str, encoder_factory: Callable[[], Encoder], batch_size: int = 256):
+        self.directory = directory
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self._encoder_factory = encoder_factory
+        self._encoder: Optional[Encoder] = None
+        self._encoder_lock = threading.Lock()
+        self._current: Optional[ProductEmbeddings] = None
+        self._pending: Optional[CatalogSnapshot] = None
+        self._building = False
+        self._lock = threading.Lock()
+        self.last_build: Dict[str, Any] = {}
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, "embeddings.npy")
+
+    @property
+    def digests_path(self) -> str:
+        return os.path.join(self.directory, "digests.npy")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    @property
+    def version(self) -> Optional[int]:
+        """Versión del catálogo de los embeddings disponibles (None si todavía no hay)."""
+        current = self._current
+        return current.version if current is not None else None
+
+    def encoder(self) -> Encoder:
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None:
+                    self._encoder = self._encoder_factory()
+        return self._encoder
+
+    def encode_query(self, text: str) -> np.ndarray:
+        return self.encoder()([text])[0]
+
+    def get(self, catalog: CatalogSnapshot) -> Optional[ProductEmbeddings]:
+        """Embeddings de esta versión del catálogo, o None si todavía se están calculando."""
+        current = self._current
+        if current is not None and current.version == catalog.version:
+            return current
+        self.refresh(catalog)
+        return None
+
+    def refresh(self, catalog: CatalogSnapshot) -> None:
+        """Programa la reconstrucción para `catalog` (en un hilo, una a la vez)."""
+        with self._lock:
+            self._pending = catalog
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build_pending, name="embeddings-build", daemon=True).start()
+
+    def _build_pending(self) -> None:
+        while True:
+            with self._lock:
+                catalog, self._pending = self._pending, None
+                if catalog is None:
+                    self._building = False
+                    return
+            if self._current is not None and self._current.version == catalog.version:
+                continue
+            try:
+                self._current = self.build(catalog)
+            except Exception as e:
+                logger.exception(f"[semantic] falló el cálculo de embeddings del catálogo v{catalog.version}: {e}")
+
+    def _load_previous(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model_id") != self.model_id:
+                return None
+            vectors = np.load(self.vectors_path, mmap_mode="r")
+            digests = np.load(self.digests_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if len(vectors) != len(digests) or len(vectors) != meta.get("count"):
+            return None
+        return vectors, digests
+
+    def _save(self, name: str, write: Callable[[str], None]) -> str:
+        # Escritura atómica: el archivo anterior sigue mapeado por quien lo esté usando
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def build(self, catalog: CatalogSnapshot) -> ProductEmbeddings:
+        """Calcula (o reutiliza) los embeddings de `catalog` y los deja mapeados desde disco."""
+        start = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        digests = np.fromiter((text_digest(product_text(p)) for p in catalog.products), dtype=np.uint64,
+                              count=len(catalog.products))
+        previous = self._load_previous()
+        if previous is not None and np.array_equal(previous[1], digests):
+            logger.info(f"[semantic] embeddings de {len(digests)} productos reutilizados de {self.vectors_path}")
+            self.last_build = {"products": len(digests), "encoded": 0, "seconds": round(time.perf_counter() - start, 2)}
+            return ProductEmbeddings(catalog.version, previous[0], previous[1])
+
+        # Fila anterior de cada producto cuyo texto no cambió (-1 si hay que calcularlo)
+        source = np.full(len(digests), -1, dtype=np.int64)
+        if previous is not None and len(previous[1]):
+            old_digests = previous[1]
+            order = np.argsort(old_digests, kind="stable")
+            sorted_digests = old_digests[order]
+            found = np.minimum(np.searchsorted(sorted_digests, digests), len(sorted_digests) - 1)
+            hit = sorted_digests[found] == digests
+            source[hit] = order[found[hit]]
+        missing = np.flatnonzero(source < 0)
+
+        dim = previous[0].shape[1] if previous is not None and len(previous[0]) else None
+        if dim is None:
+            dim = self.encode_query("").shape[-1]
+        tmp_path = f"{self.vectors_path}.tmp-{os.getpid()}"
+        vectors = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(digests), dim))
+        reused = np.flatnonzero(source >= 0)
+        for begin in range(0, len(reused), 65536):
+            rows = reused[begin:begin + 65536]
+            vectors[rows] = previous[0][source[rows]]
+
+        encoder = self.encoder() if len(missing) else None
+        for begin in range(0, len(missing), self.batch_size):
+            rows = missing[begin:begin + self.batch_size]
+            products = self._products_at(catalog, rows)
+            vectors[rows] = encoder([product_text(p) for p in products])
+        vectors.flush()
+        del vectors
+        # Sin meta.json los archivos no se reutilizan: si el proceso muere a mitad de
+        # los reemplazos, el próximo arranque recalcula todo en vez de mezclar versiones
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        os.replace(tmp_path, self.vectors_path)
+        self._save("digests.npy", lambda path: _write_npy(path, digests))
+        self._save("meta.json", lambda path: _write_json(path, {"model_id": self.model_id, "count": len(digests), "dim": dim}))
+
+        seconds = time.perf_counter() - start
+        self.last_build = {"products": len(digests), "encoded": int(len(missing)), "seconds": round(seconds, 2)}
+        logger.info(f"[semantic] embeddings del catálogo v{catalog.version}: {len(missing)} calculados, "
+                    f"{len(reused)} reutilizados en {seconds:.1f} s")
+        return ProductEmbeddings(catalog.version, np.load(self.vectors_path, mmap_mode="r"), digests)
+
+    @staticmethod
+    def _products_at(catalog: CatalogSnapshot, rows: np.ndarray) -> List[Dict[str, Any]]:
+        return [catalog.products[int(pos)] for pos in rows]
+
+    def search(
+        self, question: str, catalog: CatalogSnapshot, limit: int, min_score: float = 0.0,
+    ) -> Optional[List[Tuple[float, Dict[str, Any]]]]:
+        """(similitud, producto) de los `limit` productos más cercanos a la pregunta, o None si no hay embeddings.
+
+        Los productos con similitud menor que `min_score` se descartan.
+        """
+        embeddings = self.get(catalog)
+        if embeddings is None:
+            return None
+        hits = embeddings.top_k(self.encode_query(question), limit)
+        return [(score, catalog.products[pos]) for pos, score in hits if score >= min_score]
+
+
+def _write_npy(path: str, array: np.ndarray) -> None:
+    # Con un archivo abierto: np.save agregaría ".npy" al nombre temporal
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def fuse_rankings(
+    keyword: List[Tuple[int, Dict[str, Any]]],
+    semantic: List[Tuple[float, Dict[str, Any]]],
+    weight: float,
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Combina los resultados por keywords y por similitud en un solo ranking.
+
+    Cada producto recibe `weight` * similitud + (1 - `weight`) * score de keywords
+    normalizado por el mejor score (0 si no aparece en esa lista). Con `weight` 1
+    solo cuenta la similitud.
+    """
+    best_keyword = max((score for score, _ in keyword), default=0) or 1
+    combined: Dict[Any, List[Any]] = {}
+    for rank, (score, p) in enumerate(semantic):
+        combined[product_key(p)] = [weight * score, rank, p]
+    for rank, (score, p) in enumerate(keyword):
+        entry = combined.setdefault(product_key(p), [0.0, len(semantic) + rank, p])
+        entry[0] += (1 - weight) * score / best_keyword
+    ranked = sorted(combined.values(), key=lambda entry: (-entry[0], entry[1]))
+    return [p for _, _, p in ranked[:limit]]
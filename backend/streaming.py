@@ -0,0 +1,90 @@
+import json
+from typing import Any, Dict, Optional
+
+# Marcadores que nunca deben llegar al cliente
+_SPECIAL_TOKENS = ("<|im_end|>", "<|im_start|>")
+_THINK_OPEN = "<think>"
+_THINK_CLOSE = "</think>"
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Serializa un evento Server-Sent Events con payload JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class StreamCleaner:
+    """Limpieza incremental de la salida del modelo mientras se transmite.
+
+    Hace lo mismo que la limpieza de las respuestas completas (quitar bloques
+    <think>...</think> y los tokens especiales de Qwen) pero sobre fragmentos que
+    pueden cortar un marcador por la mitad: el final de cada fragmento que podría
+    ser el comienzo de un marcador se retiene hasta el siguiente `feed()`.
+    """
+
+    def __init__(self, lstrip_chars: str = ""):
+        self.lstrip_chars = lstrip_chars
+        self._buffer = ""
+        self._in_think = False
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        out = []
+        while True:
+            if self._in_think:
+                end = self._buffer.find(_THINK_CLOSE)
+                if end < 0:
+                    # Descartar el razonamiento, conservando un posible "</thi" partido
+                    self._buffer = self._buffer[-(len(_THINK_CLOSE) - 1):]
+                    break
+                self._buffer = self._buffer[end + len(_THINK_CLOSE):]
+                self._in_think = False
+                continue
+            start = self._buffer.find(_THINK_OPEN)
+            if start >= 0:
+                out.append(self._buffer[:start])
+                self._buffer = self._buffer[start + len(_THINK_OPEN):]
+                self._in_think = True
+                continue
+            keep = self._partial_marker_length(self._buffer)
+            out.append(self._buffer[:len(self._buffer) - keep])
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            break
+        return self._emit("".join(out))
+
+    def flush(self) -> str:
+        text = "" if self._in_think else self._buffer
+        self._buffer = ""
+        return self._emit(text)
+
+    def _emit(self, text: str) -> str:
+        for token in _SPECIAL_TOKENS:
+            text = text.replace(token, "")
+        if not self._started:
+            # Igual que el .strip()/.lstrip() de las respuestas completas, pero solo al inicio
+            text = text.lstrip().lstrip(self.lstrip_chars).lstrip()
+            self._started = bool(text)
+        return text
+
+    @staticmethod
+    def _partial_marker_length(text: str) -> int:
+        """Longitud del sufijo más largo de `text` que es prefijo de algún marcador."""
+        longest = 0
+        for marker in _SPECIAL_TOKENS + (_THINK_OPEN,):
+            for size in range(min(len(marker) - 1, len(text)), longest, -1):
+                if text.endswith(marker[:size]):
+                    longest = size
+                    break
+        return longest
+
+
+def parse_openai_stream_line(line: str) -> Optional[str]:
+    """Extrae el texto de una línea `data: {...}` de /chat/completions con stream=true."""
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    chunk = json.loads(data)
+    choices = chunk.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content")
@@ -0,0 +1,45 @@
+import threading
+
+import anyio
+import anyio.to_thread
+import pytest
+
+from admission import AdmissionRejected, InferenceGate
+
+
+def test_model_slot_limits_threadpool_calls():
+    gate = InferenceGate(1, max_queue=0)
+    inside = threading.Event()
+    leave = threading.Event()
+
+    def hold_slot():
+        with gate.model_slot():
+            inside.set()
+            leave.wait(5)
+
+    def try_slot():
+        with gate.model_slot():
+            pass
+
+    async def main():
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(anyio.to_thread.run_sync, hold_slot)
+            await anyio.to_thread.run_sync(inside.wait, 5)
+            assert gate.active == 1
+            # Cola llena: la segunda llamada al modelo se rechaza sin esperar
+            with pytest.raises(AdmissionRejected) as rejected:
+                await anyio.to_thread.run_sync(try_slot)
+            assert rejected.value.status_code == 429
+            leave.set()
+        await anyio.sleep(0)
+        assert gate.active == 0
+        await anyio.to_thread.run_sync(try_slot)
+
+    anyio.run(main)
+
+
+def test_model_slot_outside_event_loop_is_not_limited():
+    gate = InferenceGate(1, max_queue=0)
+    with gate.model_slot():
+        with gate.model_slot():
+            assert gate.active == 0
@@ -0,0 +1,98 @@
+import pytest
+
+from attributes import AttributeConstraints, AttributeIndex, extract_constraints
+
+
+def test_no_constraints_keeps_question():
+    assert extract_constraints("¿Qué zapatillas tienes?") == (None, "¿Qué zapatillas tienes?")
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("zapatillas de menos de $100", AttributeConstraints(max_price=100, max_inclusive=False)),
+    ("precio no más de 20", AttributeConstraints(max_price=20)),
+    ("que cuesten más de 20", AttributeConstraints(min_price=20, min_inclusive=False)),
+    ("mochilas baratas de menos de 40", AttributeConstraints(max_price=40, max_inclusive=False)),
+    ("desde $1.500", AttributeConstraints(min_price=1500)),
+    ("hasta 99,90 dólares", AttributeConstraints(max_price=99.9)),
+    ("entre 150 y 50 pesos", AttributeConstraints(min_price=50, max_price=150)),
+    ("laptops de menos de $800 con más de 16 gb", AttributeConstraints(max_price=800, max_inclusive=False)),
+    ("mochilas en stock", AttributeConstraints(in_stock=True)),
+    ("¿hay disponibles de mochilas?", AttributeConstraints(in_stock=True)),
+    ("gorras en existencias", AttributeConstraints(in_stock=True)),
+])
+def test_parses_price_and_stock(question, expected):
+    assert extract_constraints(question)[0] == expected
+
+
+def test_rest_of_question_drops_constraints():
+    constraints, rest = extract_constraints("Zapatillas de menos de $100 en stock")
+    assert constraints == AttributeConstraints(max_price=100, max_inclusive=False, in_stock=True)
+    assert rest == "zapatillas de"
+
+
+def test_words_containing_keywords_are_not_constraints():
+    assert extract_constraints("hastaluego")[0] is None
+
+
+@pytest.mark.parametrize("question", [
+    "zapatillas de menos de 100",
+    "auriculares con más de 20 horas de batería",
+    "auriculares baratos con más de 20 horas de batería",
+    "camiseta talla hasta 38",
+    "camiseta barata talla hasta 38",
+    "mochila para portátil de hasta 15.6 pulgadas",
+    "tablets baratas desde 64 gb",
+])
+def test_numbers_without_currency_or_with_units_are_not_prices(question):
+    assert extract_constraints(question) == (None, question)
+
+
+@pytest.mark.parametrize("question", [
+    "¿El reloj está disponible en negro?",
+    "¿Tienen zapatillas disponibles?",
+    "¿Cuántas mochilas quedan?",
+])
+def test_availability_words_alone_are_not_stock_filters(question):
+    assert extract_constraints(question) == (None, question)
+
+
+def test_matches_requires_numeric_values():
+    constraints = AttributeConstraints(max_price=100, in_stock=True)
+    assert constraints.matches({"price": 100, "stock": 1})
+    assert not constraints.matches({"price": "100", "stock": 1})
+    assert not constraints.matches({"price": 50, "stock": None})
+
+
+PRODUCTS = [
+    {"category": "calzado", "price": 120.0, "stock": 0},
+    {"category": "calzado", "price": 80.0, "stock": 3},
+    {"category": "ropa", "price": 80.0, "stock": 5},
+    {"category": "ropa", "price": None, "stock": 2},
+    {"category": "calzado", "price": 100.0, "stock": 1},
+]
+BY_CATEGORY = {"calzado": [0, 1, 4], "ropa": [2, 3]}
+
+
+def test_index_orders_by_price_with_catalog_ties():
+    index = AttributeIndex(PRODUCTS, BY_CATEGORY)
+    assert list(index.positions(AttributeConstraints(max_price=120))) == [1, 2, 4, 0]
+
+
+def test_index_exclusive_bounds_and_category():
+    index = AttributeIndex(PRODUCTS, BY_CATEGORY)
+    constraints = AttributeConstraints(min_price=80, max_price=120, min_inclusive=False, max_inclusive=False)
+    assert list(index.positions(constraints, "Calzado")) == [4]
+    assert list(index.positions(constraints, "hogar")) == []
+
+
+def test_index_stock_only_keeps_catalog_order():
+    index = AttributeIndex(PRODUCTS, BY_CATEGORY)
+    assert list(index.positions(AttributeConstraints(in_stock=True))) == [1, 2, 3, 4]
+    assert list(index.positions(AttributeConstraints(max_price=100, in_stock=True), "calzado")) == [1, 4]
+
+
+def test_index_accepts_matches_linear_check():
+    index = AttributeIndex(PRODUCTS, BY_CATEGORY)
+    for constraints in (AttributeConstraints(max_price=90), AttributeConstraints(min_price=80, in_stock=True)):
+        assert [index.accepts(pos, constraints) for pos in range(len(PRODUCTS))] == \
+            [constraints.matches(p) for p in PRODUCTS]
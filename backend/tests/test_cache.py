@@ -0,0 +1,61 @@
+import cache
+from cache import ResponseCache, TTLCache
+
+
+def test_lru_eviction():
+    ttl_cache = TTLCache(maxsize=2, ttl=None)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    assert ttl_cache.get("a") == 1
+    ttl_cache.set("c", 3)
+    assert ttl_cache.get("b") is None
+    assert (ttl_cache.get("a"), ttl_cache.get("c")) == (1, 3)
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    ttl_cache = TTLCache(maxsize=4, ttl=10)
+    ttl_cache.set("a", 1)
+    now[0] += 9
+    assert ttl_cache.get("a") == 1
+    now[0] += 2
+    assert ttl_cache.get("a", "vencido") == "vencido"
+    assert len(ttl_cache) == 0
+
+
+def test_disabled_cache_stores_nothing():
+    ttl_cache = TTLCache(maxsize=0)
+    ttl_cache.set("a", 1)
+    assert not ttl_cache.enabled and ttl_cache.get("a") is None
+
+
+def test_response_key_normalizes_question():
+    responses = ResponseCache(maxsize=8)
+    responses.set("¿Qué zapatillas TIENES?", 1, "m", "respuesta")
+    assert responses.get("que zapatillas tienes", 1, "m") == "respuesta"
+    assert responses.get("que zapatillas tienes", 1, "otro") is None
+
+
+def test_newer_version_clears():
+    responses = ResponseCache(maxsize=8)
+    responses.set("hola", 1, "m", "v1")
+    assert responses.get("hola", 2, "m") is None
+    assert responses.stats()["size"] == 0
+    assert responses.get("hola", 1, "m") is None
+
+
+def test_stale_version_neither_clears_nor_stores():
+    responses = ResponseCache(maxsize=8)
+    responses.set("hola", 2, "m", "v2")
+    # Un request que todavía tiene el snapshot anterior
+    assert responses.get("hola", 1, "m") is None
+    responses.set("hola", 1, "m", "v1")
+    assert responses.get("hola", 2, "m") == "v2"
+    assert responses.stats()["catalog_version"] == 2
+
+
+def test_empty_response_not_stored():
+    responses = ResponseCache(maxsize=8)
+    responses.set("hola", 1, "m", "")
+    assert responses.get("hola", 1, "m") is None
@@ -0,0 +1,109 @@
+from attributes import AttributeConstraints
+from catalog import CatalogIndex
+
+PRODUCTS = [
+    {"id": 1, "name": "Mochila Urbana", "category": "accesorios", "price": 40.0, "stock": 0,
+     "description": "Para la ciudad"},
+    {"id": 2, "name": "Zapatillas Running", "category": "calzado", "price": 90.0, "stock": 3,
+     "description": "Ideales para correr"},
+    {"id": 3, "name": "Botas", "category": "calzado", "price": 120.0, "stock": 1,
+     "description": "Zapatillas de montaña no, botas"},
+    {"id": 4, "name": "Mochila Trekking", "category": "accesorios", "price": 70.0, "stock": 2,
+     "description": "Para montaña"},
+]
+
+
+def ids(results):
+    return [(score, p["id"]) for score, p in results]
+
+
+def test_scores_name_category_and_description():
+    index = CatalogIndex(PRODUCTS)
+    # nombre: 10 + 20; descripción: 10; categoría: 10 + 15
+    assert ids(index.top_by_keywords(["zapatilla"], 5)) == [(30, 2), (10, 3)]
+    assert ids(index.top_by_keywords(["calzado"], 5)) == [(25, 2), (25, 3)]
+
+
+def test_repeated_keywords_add_up_and_ties_keep_catalog_order():
+    index = CatalogIndex(PRODUCTS)
+    assert ids(index.top_by_keywords(["mochila", "montana"], 5)) == [(40, 4), (30, 1), (10, 3)]
+    assert ids(index.top_by_keywords(["mochila", "mochila"], 1)) == [(60, 1)]
+
+
+def test_constraints_filter_candidates():
+    index = CatalogIndex(PRODUCTS)
+    constraints = AttributeConstraints(max_price=100, in_stock=True)
+    assert ids(index.top_by_keywords(["mochila", "calzado"], 5, constraints)) == [(30, 4), (25, 2)]
+
+
+def test_unknown_keyword():
+    assert CatalogIndex(PRODUCTS).top_by_keywords(["inexistente"], 5) == []
+
+
+def test_sqlite_name_lookup_matches_memory(tmp_path):
+    from catalog_sqlite import SQLiteCatalogIndex, import_products
+    db_path = str(tmp_path / "catalog.db")
+    import_products(PRODUCTS, db_path)
+    db = SQLiteCatalogIndex(db_path)
+    memory = CatalogIndex(PRODUCTS)
+    for tokens in ({"mochila", "urbana"}, {"mochila"}, {"bota"}, {"zapatilla", "running", "roja"}, set()):
+        expected, found = memory.product_names.best_match(tokens), db.product_names.best_match(tokens)
+        assert (expected is None) == (found is None)
+        if expected is not None:
+            assert (found.product["id"], found.overlap, found.length, found.tied) == \
+                (expected.product["id"], expected.overlap, expected.length, expected.tied)
+    assert {k: set(v) for k, v in db.product_names.heads.items()} == memory.product_names.heads
+
+
+def test_sqlite_close_reopens_on_next_query(tmp_path):
+    from catalog_sqlite import SQLiteCatalogIndex, import_products
+    db_path = str(tmp_path / "catalog.db")
+    import_products(PRODUCTS, db_path)
+    db = SQLiteCatalogIndex(db_path)
+    db.close()
+    assert db._connections == []
+    assert [p["id"] for p in db.in_category("calzado")] == [2, 3]
+
+
+def test_views_serialize_as_plain_dicts(tmp_path):
+    import json
+    from catalog_sqlite import SQLiteCatalogIndex, import_products
+    from catalog import product_dict
+    products = [dict(p) for p in PRODUCTS]
+    del products[1]["description"]
+    views = CatalogIndex(products).products
+    assert [product_dict(p) for p in views] == products
+    assert json.loads(json.dumps(views[1].to_dict())) == products[1]
+    # Una base importada desde las vistas del catálogo en memoria
+    db_path = str(tmp_path / "catalog.db")
+    import_products(views, db_path)
+    assert [product_dict(p) for p in SQLiteCatalogIndex(db_path).products] == products
+
+
+def test_category_size_counts_whole_category(tmp_path):
+    from catalog_sqlite import SQLiteCatalogIndex, import_products
+    db_path = str(tmp_path / "catalog.db")
+    import_products(PRODUCTS, db_path)
+    in_stock = AttributeConstraints(in_stock=True)
+    cheap = AttributeConstraints(max_price=100)
+    for index in (CatalogIndex(PRODUCTS), SQLiteCatalogIndex(db_path)):
+        assert index.category_size("Calzado") == 2
+        assert index.category_size("accesorios", in_stock) == 1
+        assert index.category_size("calzado", cheap) == 1
+        assert index.category_size("hogar") == 0
+
+
+def test_store_rebuilds_changed_catalog_in_background(tmp_path):
+    import json
+    from catalog import CatalogStore
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps({"products": PRODUCTS[:2]}), encoding="utf-8")
+    store = CatalogStore(str(path), check_interval=0.001)
+    first = store.get()
+    path.write_text(json.dumps({"products": PRODUCTS}), encoding="utf-8")
+    store._last_check = 0.0
+    # El request que detecta el cambio sigue con el snapshot anterior
+    assert store.get() is first
+    store._reloader.join(timeout=5)
+    current = store.get()
+    assert current.version == first.version + 1 and len(current.products) == 4
@@ -0,0 +1,94 @@
+import json
+import pickle
+
+import pytest
+
+from constrained import IntentGrammar, IntentGrammarProcessor
+
+GRAMMAR = IntentGrammar(["general", "categoria", "producto"], ["calzado", "ropa"], max_terms=2, max_term_chars=5)
+
+
+class CharTokenizer:
+    """Un token por carácter; el 0 es EOS."""
+    eos_token_id = 0
+
+    def __init__(self):
+        self.vocab = ["<eos>"] + sorted(set('{}[]":, ' + "abcdefghijklmnopqrstuvwxyzé"))
+        self.ids = {ch: i for i, ch in enumerate(self.vocab)}
+
+    def encode(self, text, add_special_tokens=False):
+        return [self.ids[ch] for ch in text]
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(self.vocab[i] for i in ids if i != self.eos_token_id)
+
+
+def test_accepts_prompt_format():
+    text = json.dumps({"tipo": "categoria", "terminos": ["tenis", "rojo"], "categoria": "calzado"}, ensure_ascii=False)
+    assert GRAMMAR.is_complete(GRAMMAR.advance(GRAMMAR.initial, text))
+    text = '{"tipo": "general", "terminos": [], "categoria": null}'
+    assert GRAMMAR.is_complete(GRAMMAR.advance(GRAMMAR.initial, text))
+
+
+@pytest.mark.parametrize("text", [
+    '{"tipo": "otro"',
+    '{"tipo": "general", "terminos": ["a", "b", "c"',
+    '{"tipo": "general", "terminos": ["larguisimo"',
+    '{"tipo": "general", "terminos": ["a\\"',
+    '{"tipo": "general", "terminos": [], "categoria": "hogar"',
+])
+def test_rejects_invalid_prefixes(text):
+    assert GRAMMAR.advance(GRAMMAR.initial, text) is None
+
+
+def test_prefix_is_not_complete():
+    state = GRAMMAR.advance(GRAMMAR.initial, '{"tipo": "general", "terminos": ["a"')
+    assert state is not None and not GRAMMAR.is_complete(state)
+
+
+def test_completion_reaches_a_complete_intent():
+    state = GRAMMAR.advance(GRAMMAR.initial, '{"tipo": "producto", "terminos": ["zap')
+    text = ""
+    while not GRAMMAR.is_complete(state):
+        piece = GRAMMAR.completion(state)
+        state = GRAMMAR.advance(state, piece)
+        text += piece
+    assert json.loads('{"tipo": "producto", "terminos": ["zap' + text) == {
+        "tipo": "producto", "terminos": ["zap"], "categoria": None,
+    }
+
+
+def test_default_tipo_goes_first():
+    assert GRAMMAR.completion(GRAMMAR.initial) == '{"tipo": "general", "terminos": ['
+
+
+def test_batch_key_depends_on_grammar_content():
+    tokenizer = CharTokenizer()
+    same = IntentGrammar(["general", "categoria", "producto"], ["calzado", "ropa"], max_terms=2, max_term_chars=5)
+    other = IntentGrammar(["general"], ["calzado"])
+    assert IntentGrammarProcessor(tokenizer, GRAMMAR).batch_key == IntentGrammarProcessor(tokenizer, same).batch_key
+    assert IntentGrammarProcessor(tokenizer, GRAMMAR).batch_key != IntentGrammarProcessor(tokenizer, other).batch_key
+
+
+def test_processor_pickles_with_registered_tokenizer():
+    tokenizer = CharTokenizer()
+    processor = IntentGrammarProcessor(tokenizer, GRAMMAR, top_k=5)
+    restored = pickle.loads(pickle.dumps(processor))
+    assert restored.tokenizer is tokenizer and restored.top_k == 5
+    assert restored.batch_key == processor.batch_key
+
+
+def test_processor_forces_valid_json_per_row():
+    torch = pytest.importorskip("torch")
+    tokenizer = CharTokenizer()
+    processor = IntentGrammarProcessor(tokenizer, GRAMMAR, top_k=3)
+    prompt = tokenizer.encode("hi")
+    input_ids = torch.tensor([prompt, prompt])
+    # Sin preferencias del modelo: todo lo decide la continuación forzada
+    for _ in range(80):
+        scores = processor(input_ids, torch.zeros(2, len(tokenizer.vocab)))
+        next_ids = scores.argmax(dim=-1)
+        input_ids = torch.cat([input_ids, next_ids[:, None]], dim=1)
+    for row in input_ids.tolist():
+        text = tokenizer.decode(row[len(prompt):])
+        assert json.loads(text) == {"tipo": "general", "terminos": [], "categoria": None}
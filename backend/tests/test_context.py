@@ -0,0 +1,169 @@
+import re
+import zlib
+
+import pytest
+
+from catalog import CatalogIndex, CatalogSnapshot
+from context import CatalogContextBuilder, PromptAssembler, product_prompt_line
+
+PRODUCTS = [
+    {"id": 1, "name": "Zapatillas Running", "category": "calzado", "price": 89.9, "stock": 4, "description": "Livianas"},
+    {"id": 2, "name": "Botas Trekking", "category": "calzado", "price": 129.0, "stock": 0, "description": "Impermeables"},
+    {"id": 3, "name": "Sandalias", "category": "calzado", "price": 25.5, "stock": 9, "description": "De playa"},
+]
+PREFIX = "Eres un asistente.\n"
+HEADER = "Productos disponibles:\n"
+TAIL = "\n\nPregunta: ¿qué tienes?\n"
+
+
+class PiecesTokenizer:
+    """Un token por pieza de `split()` (el id es un hash de la pieza); `decode` junta las piezas con `joiner`."""
+    joiner = ""
+
+    def __init__(self):
+        self.pieces = {}
+
+    def split(self, text):
+        raise NotImplementedError
+
+    def encode(self, text, add_special_tokens=False):
+        ids = []
+        for piece in self.split(text):
+            ids.append(zlib.crc32(piece.encode("utf-8")))
+            self.pieces[ids[-1]] = piece
+        return ids
+
+    def decode(self, ids, **kwargs):
+        return self.joiner.join(self.pieces[i] for i in ids)
+
+
+class WordTokenizer(PiecesTokenizer):
+    """Un token por palabra: concatenar las líneas da lo mismo que tokenizar todo."""
+    joiner = " "
+
+    def split(self, text):
+        return text.split()
+
+
+class LineTokenizer(PiecesTokenizer):
+    """Un token por línea con su salto: la última línea se fusiona con el "\n\n" del final."""
+
+    def split(self, text):
+        return text.splitlines(keepends=True)
+
+
+class ChunkTokenizer(PiecesTokenizer):
+    """Palabras con los espacios que las siguen: sin salto entre dos partes, se fusionan."""
+
+    def split(self, text):
+        return re.findall(r"\S+\s*|\s+", text)
+
+
+class NoDecodeTokenizer:
+    """Sin decode(): las uniones no se pueden comprobar."""
+
+    def __init__(self):
+        self._chunks = ChunkTokenizer()
+
+    def encode(self, text, add_special_tokens=False):
+        return self._chunks.encode(text)
+
+
+def snapshot(version=1):
+    return CatalogSnapshot(version=version, products=PRODUCTS, index=CatalogIndex(PRODUCTS), path="<test>",
+                           mtime_ns=0, size=0, loaded_at=0.0)
+
+
+def expected_text(products, detailed):
+    return PREFIX + HEADER + "\n".join(product_prompt_line(p, detailed) for p in products) + TAIL
+
+
+def test_unlimited_matches_full_prompt():
+    catalog = snapshot()
+    tokenizer = WordTokenizer()
+    prompt = PromptAssembler(tokenizer, token_budget=0).assemble(
+        catalog, PREFIX, HEADER, catalog.products, True, TAIL)
+    text = expected_text(catalog.products, True)
+    assert prompt.text == text
+    assert prompt.input_ids == tokenizer.encode(text)
+    assert prompt.prefix_tokens == len(tokenizer.encode(PREFIX))
+    assert prompt.products == 3
+
+
+def test_budget_cuts_products_but_keeps_one():
+    catalog = snapshot()
+    assembler = PromptAssembler(WordTokenizer(), token_budget=14)
+    prompt = assembler.assemble(catalog, PREFIX, HEADER, catalog.products, False, TAIL)
+    assert prompt.products == 2 and prompt.tokens <= 14
+    assert prompt.text == expected_text(catalog.products[:2], False)
+
+    tiny = PromptAssembler(WordTokenizer(), token_budget=1)
+    assert tiny.assemble(catalog, PREFIX, HEADER, catalog.products, False, TAIL).products == 1
+
+
+# decode() tiene que reproducir el texto (WordTokenizer pierde los espacios, no sirve aquí)
+@pytest.mark.parametrize("tokenizer_cls", [LineTokenizer, ChunkTokenizer, NoDecodeTokenizer])
+@pytest.mark.parametrize("header", [HEADER, "Productos:"])
+@pytest.mark.parametrize("detailed", [False, True])
+def test_ids_always_match_full_tokenization(tokenizer_cls, header, detailed):
+    catalog = snapshot()
+    tokenizer = tokenizer_cls()
+    assembler = PromptAssembler(tokenizer, token_budget=0)
+    # Varias veces: la comprobación de las uniones se memoriza
+    for products in (catalog.products, catalog.products[1:], catalog.products[:1], []):
+        prompt = assembler.assemble(catalog, PREFIX, header, products, detailed, TAIL)
+        assert prompt.input_ids == tokenizer.encode(prompt.text)
+
+
+def test_without_tokenizer_estimates_tokens():
+    catalog = snapshot()
+    prompt = PromptAssembler(None, token_budget=0).assemble(catalog, PREFIX, HEADER, catalog.products, False, TAIL)
+    assert prompt.input_ids is None
+    assert prompt.text == expected_text(catalog.products, False)
+    assert prompt.tokens > 0
+
+
+def changed_snapshot(version=2):
+    changed = [dict(PRODUCTS[0], price=10.0)] + PRODUCTS[1:]
+    return CatalogSnapshot(version=version, products=changed, index=CatalogIndex(changed), path="<test>",
+                           mtime_ns=0, size=0, loaded_at=0.0)
+
+
+def test_new_version_drops_cached_lines():
+    assembler = PromptAssembler(WordTokenizer(), token_budget=0)
+    first = snapshot(1)
+    assembler.assemble(first, PREFIX, HEADER, first.products, False, TAIL)
+    second = changed_snapshot(2)
+    prompt = assembler.assemble(second, PREFIX, HEADER, second.products, False, TAIL)
+    assert "Zapatillas Running: $10.00" in prompt.text
+
+
+def test_stale_snapshot_neither_refills_nor_clears_lines():
+    assembler = PromptAssembler(WordTokenizer(), token_budget=0)
+    first, second = snapshot(1), changed_snapshot(2)
+    assembler.assemble(second, PREFIX, HEADER, second.products, False, TAIL)
+    cached = [assembler.line(p, False, 2) for p in second.products]
+    # Un request que todavía tiene el snapshot anterior, después de la recarga
+    stale = assembler.assemble(first, PREFIX, HEADER, first.products, False, TAIL)
+    assert "Zapatillas Running: $89.90" in stale.text
+    # Las líneas de la versión nueva siguen memorizadas (no se vació ni se reemplazó nada)
+    assert all(a is b for a, b in zip((assembler.line(p, False, 2) for p in second.products), cached))
+    prompt = assembler.assemble(second, PREFIX, HEADER, second.products, False, TAIL)
+    assert "Zapatillas Running: $10.00" in prompt.text
+
+
+def test_remote_fragment_follows_new_version():
+    builder = CatalogContextBuilder(token_budget=0)
+    first, second = snapshot(1), changed_snapshot(2)
+    assert "Zapatillas Running | calzado | $89.90" in builder.fragment(first, first.products)
+    assert "Zapatillas Running | calzado | $10.00" in builder.fragment(second, second.products)
+
+
+def test_remote_fragment_ignores_stale_snapshot():
+    builder = CatalogContextBuilder(token_budget=0)
+    first, second = snapshot(1), changed_snapshot(2)
+    current = builder.fragment(second, second.products)
+    # Un request que todavía tiene el snapshot anterior, después de la recarga
+    assert "$89.90" in builder.fragment(first, first.products)
+    assert builder.fragment(second, second.products) is current
+    assert "$10.00" in builder.fragment(second, second.products[:1])
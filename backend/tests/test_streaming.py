@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from metrics import collect_phases
+from providers import stream_text_events
+from streaming import StreamCleaner
+
+
+def feed_all(cleaner, chunks):
+    return "".join(cleaner.feed(chunk) for chunk in chunks) + cleaner.flush()
+
+
+def test_think_block_split_across_chunks():
+    chunks = ["Hola <th", "ink>razono", "mucho</th", "ink> mundo"]
+    assert feed_all(StreamCleaner(), chunks) == "Hola  mundo"
+
+
+def test_special_tokens_split_across_chunks():
+    assert feed_all(StreamCleaner(), ["Listo<|im_", "end|>"]) == "Listo"
+
+
+def test_partial_marker_is_held_until_next_chunk():
+    cleaner = StreamCleaner()
+    assert cleaner.feed("precio <|im") == "precio "
+    assert cleaner.feed("puesto") == "<|impuesto"
+
+
+def test_lstrip_only_at_start():
+    cleaner = StreamCleaner(lstrip_chars=": ")
+    assert cleaner.feed("  ") == ""
+    assert cleaner.feed(": Claro") == "Claro"
+    assert cleaner.feed(": sí") == ": sí"
+
+
+def test_unclosed_think_is_dropped_on_flush():
+    assert feed_all(StreamCleaner(), ["Antes <think>sin cerrar"]) == "Antes "
+
+
+def test_stream_records_generate_once_until_last_chunk():
+    async def chunks():
+        for chunk in ["Hola", " <think>x</think>", "mundo"]:
+            await asyncio.sleep(0.01)
+            yield chunk
+
+    async def consume(start):
+        return [event async for event in stream_text_events(chunks(), generate_start=start)]
+
+    with collect_phases() as phases:
+        start = time.perf_counter() - 0.05  # la petición se envió antes de recibir las cabeceras
+        events = asyncio.run(consume(start))
+    assert events[-1].startswith("event: done")
+    assert list(phases) == ["generate"]
+    assert phases["generate"] >= 0.08
@@ -0,0 +1,250 @@
+import os
+import pickle
+import queue
+import itertools
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("backend")
+
+# Fin del stream de un task (en la cola de fragmentos del proceso principal)
+_END = object()
+
+
+class WorkerError(RuntimeError):
+    """La generación falló en un worker (o el worker murió)."""
+
+
+def share_weights(*models) -> None:
+    """Pasa los parámetros y buffers de los modelos a memoria compartida (los None se ignoran).
+
+    Al enviarlos a un worker solo viaja la referencia al segmento: todos los
+    procesos mapean las mismas páginas en vez de tener cada uno su copia.
+    """
+    for model in models:
+        if model is not None:
+            model.share_memory()
+
+
+def _spawn_context():
+    """Contexto spawn; con torch, sus reducers envían los tensores en memoria compartida por referencia."""
+    try:
+        import torch.multiprocessing as mp
+    except ImportError:
+        import multiprocessing as mp
+    return mp.get_context("spawn")
+
+
+def _worker_main(index: int, loader, tasks, results, threads: int, streamer_factory) -> None:
+    """Bucle de un worker: carga el pipeline con `loader()`, recibe (id, prompt, kwargs serializados, stream)
+    y devuelve resultados por `results`."""
+    if threads > 0:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+            torch.set_num_interop_threads(1)
+        except (ImportError, RuntimeError):
+            pass
+    # Si falla, el proceso termina y sus tasks fallan como los de un worker caído
+    pipe = loader()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, prompt, payload, stream = task
+        try:
+            kwargs = pickle.loads(payload)
+            if not stream:
+                results.put(("done", task_id, pipe(prompt, **kwargs)))
+                continue
+            streamer = streamer_factory(pipe.tokenizer)
+            errors: List[Exception] = []
+
+            def run_generation():
+                try:
+                    pipe(prompt, streamer=streamer, **kwargs)
+                except Exception as e:
+                    errors.append(e)
+                    streamer.end()
+
+            thread = threading.Thread(target=run_generation, daemon=True)
+            thread.start()
+            for text in streamer:
+                results.put(("chunk", task_id, text))
+            thread.join()
+            if errors:
+                raise errors[0]
+            results.put(("done", task_id, None))
+        except Exception as e:
+            # Se envía como texto: no todas las excepciones se pueden serializar
+            results.put(("error", task_id, f"worker {index}: {type(e).__name__}: {e}"))
+
+
+class InferenceWorkerPool:
+    """Procesos de inferencia que comparten los pesos del modelo del proceso principal.
+
+    Los workers se inician con spawn, no con fork: el servidor ya tiene hilos
+    (threadpool, precarga, lector de resultados) y un fork solo copia el hilo que
+    lo hace, con los locks que tuvieran tomados los demás (y el pool de OpenMP de
+    torch no sobrevive al fork). Cada worker arma su pipeline con `loader()`, que
+    tiene que poder serializarse: un partial con el modelo ya cargado, cuyos
+    tensores (pasados antes a memoria compartida con share_weights()) llegan como
+    referencias al mismo segmento, así el modelo se carga una sola vez y la
+    memoria no crece con cada worker. Cada uno usa `threads` hilos de torch para
+    no sobresuscribir la CPU entre todos. `pipe` es el pipeline del proceso
+    principal: no genera (los workers lo reemplazan) y sus pesos son los mismos
+    que mapean los workers.
+
+    `submit()` y `stream()` se llaman desde los hilos de los requests; cada prompt
+    va al worker con menos trabajo pendiente. `warm_up()` espera a que todos hayan
+    cargado el modelo y generado una vez.
+    """
+
+    def __init__(
+        self, pipe, loader: Callable[[], Any], workers: int, threads: int = 0,
+        streamer_factory: Optional[Callable] = None,
+    ):
+        self.pipe = pipe
+        self.size = workers
+        self.threads = threads if threads > 0 else max(1, (os.cpu_count() or 1) // workers)
+        self._context = _spawn_context()
+        self._results = self._context.Queue()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        # id del task -> (worker, Future o cola de fragmentos)
+        self._pending: Dict[int, Tuple[int, Any]] = {}
+        self._inflight = [0] * workers
+        self._closed = False
+
+        self._tasks = []
+        self._processes = []
+        for index in range(workers):
+            tasks = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main,
+                args=(index, loader, tasks, self._results, self.threads, streamer_factory),
+                name=f"local-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self._tasks.append(tasks)
+            self._processes.append(process)
+
+        self._reader = threading.Thread(target=self._read_results, name="local-workers-reader", daemon=True)
+        self._reader.start()
+        logger.info(f"[workers] {workers} procesos de inferencia, {self.threads} hilos de torch cada uno")
+
+    def alive(self) -> bool:
+        return not self._closed and all(p.is_alive() for p in self._processes)
+
+    def _dispatch(
+        self, prompt: str, kwargs: Dict[str, Any], stream: bool, handle: Any, worker: Optional[int] = None,
+    ) -> None:
+        if self._closed:
+            raise WorkerError("el pool de workers está cerrado")
+        # Serializados aquí para que un error al reconstruirlos en el worker llegue como error del task
+        payload = pickle.dumps(kwargs)
+        with self._lock:
+            task_id = next(self._ids)
+            alive = [i for i, p in enumerate(self._processes) if p.is_alive()]
+            if not alive or (worker is not None and worker not in alive):
+                raise WorkerError("no quedan workers de inferencia vivos")
+            if worker is None:
+                worker = min(alive, key=self._inflight.__getitem__)
+            self._inflight[worker] += 1
+            self._pending[task_id] = (worker, handle)
+        self._tasks[worker].put((task_id, prompt, payload, stream))
+
+    def _finish(self, task_id: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._pending.pop(task_id, None)
+            if entry is None:
+                return None
+            worker, handle = entry
+            self._inflight[worker] -= 1
+            return handle
+
+    def submit(self, prompt: str, **generate_kwargs) -> Any:
+        """Genera en un worker y bloquea hasta tener el resultado (mismo formato que `pipe(prompt)`)."""
+        future: Future = Future()
+        self._dispatch(prompt, generate_kwargs, False, future)
+        return future.result()
+
+    def warm_up(self, prompt: str, **generate_kwargs) -> None:
+        """Una generación en cada worker; bloquea hasta que terminen todas (o lanza WorkerError)."""
+        futures = []
+        for worker in range(self.size):
+            future: Future = Future()
+            self._dispatch(prompt, generate_kwargs, False, future, worker=worker)
+            futures.append(future)
+        for future in futures:
+            future.result()
+
+    def __call__(self, prompt: str, **generate_kwargs) -> Any:
+        return self.submit(prompt, **generate_kwargs)
+
+    def stream(self, prompt: str, **generate_kwargs) -> Iterator[str]:
+        """Fragmentos de texto a medida que el worker genera; lanza WorkerError si falla."""
+        chunks: "queue.Queue" = queue.Queue()
+        self._dispatch(prompt, generate_kwargs, True, chunks)
+        while True:
+            item = chunks.get()
+            if item is _END:
+                return
+            if isinstance(item, WorkerError):
+                raise item
+            yield item
+
+    def _deliver(self, kind: str, task_id: int, payload: Any) -> None:
+        if kind == "chunk":
+            with self._lock:
+                entry = self._pending.get(task_id)
+            if entry is not None:
+                entry[1].put(payload)
+            return
+        handle = self._finish(task_id)
+        if handle is None:
+            return
+        error = WorkerError(payload) if kind == "error" else None
+        if isinstance(handle, Future):
+            if error is not None:
+                handle.set_exception(error)
+            else:
+                handle.set_result(payload)
+        else:
+            handle.put(error if error is not None else _END)
+
+    def _fail_dead_workers(self) -> None:
+        dead = {i for i, p in enumerate(self._processes) if not p.is_alive()}
+        if not dead:
+            return
+        with self._lock:
+            lost = [task_id for task_id, (worker, _) in self._pending.items() if worker in dead]
+        for task_id in lost:
+            self._deliver("error", task_id, "el worker de inferencia terminó inesperadamente")
+        if lost:
+            logger.error(f"[workers] workers caídos: {sorted(dead)}; {len(lost)} generaciones fallidas")
+
+    def _read_results(self) -> None:
+        while not self._closed:
+            try:
+                kind, task_id, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._fail_dead_workers()
+                continue
+            except (EOFError, OSError):
+                return
+            self._deliver(kind, task_id, payload)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
@@ -4,6 +4,30 @@ import ReactMarkdown from 'react-markdown'
 // Leer la URL del API desde variable de entorno
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
 
+// Lee una respuesta Server-Sent Events y llama a onEvent(evento, datos) por cada evento
+async function readEventStream(res, onEvent) {
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let separator
+    while ((separator = buffer.indexOf('\n\n')) >= 0) {
+      const raw = buffer.slice(0, separator)
+      buffer = buffer.slice(separator + 2)
+      let event = 'message'
+      let data = ''
+      for (const line of raw.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (data) onEvent(event, JSON.parse(data))
+    }
+  }
+}
+
 function App() {
   const [messages, setMessages] = useState([
     { id: 1, text: '¡Hola! Soy tu asistente de compras. ¿En qué puedo ayudarte hoy?', sender: 'bot' }
@@ -26,7 +50,8 @@ function App() {
     setIsLoading(true)
 
     try {
-      const res = await fetch(`${API_URL}/api/chat`, {
+      // Streaming: la respuesta se muestra a medida que el modelo la genera
+      const res = await fetch(`${API_URL}/api/chat/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ content: userMessage.text })
@@ -44,8 +69,23 @@ function App() {
         throw new Error(errorMessage)
       }
       
-      const data = await res.json()
-      setMessages(prev => [...prev, { id: Date.now() + 1, text: data.response, sender: 'bot' }])
+      const botId = Date.now() + 1
+      const setBotText = (update) => setMessages(prev => {
+        const exists = prev.some(m => m.id === botId)
+        if (!exists) return [...prev, { id: botId, text: update(''), sender: 'bot' }]
+        return prev.map(m => (m.id === botId ? { ...m, text: update(m.text) } : m))
+      })
+
+      await readEventStream(res, (event, data) => {
+        if (event === 'token') {
+          setBotText(text => text + data.text)
+        } else if (event === 'done') {
+          // La respuesta final puede reemplazar lo mostrado (p. ej. si el modelo falló)
+          setBotText(() => data.response)
+        } else if (event === 'error') {
+          throw new Error(data.detail || 'Error en el servidor')
+        }
+      })
     } catch (err) {
       console.error(err)
       const errorMsg = err.message || 'Ocurrió un error. Intenta nuevamente.'
@@ -80,7 +120,7 @@ function App() {
             </div>
           ))}
           <div ref={endRef} />
-          {isLoading && (
+          {isLoading && messages[messages.length - 1]?.sender !== 'bot' && (
             <div className="message bot">
               <div className="avatar">A</div>
               <div className="bubble message-content typing-indicator">